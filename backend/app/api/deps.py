@@ -1,7 +1,7 @@
 from typing import Callable
 
 from bson import ObjectId
-from fastapi import Depends, HTTPException, Request, status
+from fastapi import Depends, Header, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pymongo.database import Database
 
@@ -15,6 +15,20 @@ bearer_scheme = HTTPBearer(auto_error=False)
 
 
 
+def get_idempotency_key(
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+) -> str | None:
+    if idempotency_key is None:
+        return None
+    key = idempotency_key.strip()
+    if not key or len(key) > 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key must be 1-255 characters",
+        )
+    return key
+
+
 async def get_db(request: Request) -> Database:
     db = getattr(request.app.state, "db", None)
     if db is None:
@@ -1,6 +1,6 @@
 from typing import Literal
 
-from fastapi import APIRouter, Depends, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks, status
 from fastapi.responses import Response
 from pymongo.database import Database
 
@@ -11,11 +11,13 @@ from app.schemas.admin import (
     BillingReportResponse,
     ContentItemResponse,
     ContentStatusUpdateRequest,
+    PostSubmitStatusResponse,
     SetJeeExamDateRequest,
 )
 from app.schemas.common import PaginatedResponse
 from app.schemas.user import AdminUserCreateRequest, UserPublic, UserStatusUpdateRequest
 from app.services.admin_service import AdminService
+from app.services.post_submit_pipeline import PostSubmitPipeline
 from app.utils.cache import admin_cache
 
 
@@ -163,3 +165,23 @@ async def set_jee_exam_date(
     db: Database = Depends(get_db),
 ) -> dict:
     return AdminService.set_jee_exam_date(db, payload.jee_exam_date, background_tasks)
+
+
+@router.get("/post-submit/status", response_model=PostSubmitStatusResponse)
+async def post_submit_status(db: Database = Depends(get_db)) -> PostSubmitStatusResponse:
+    return PostSubmitStatusResponse(**PostSubmitPipeline.status_summary(db))
+
+
+@router.post("/post-submit/{attempt_id}/retry")
+async def retry_post_submit(
+    attempt_id: str,
+    background_tasks: BackgroundTasks,
+    db: Database = Depends(get_db),
+) -> dict:
+    if not PostSubmitPipeline.retry(db, attempt_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Attempt has no failed post-submit job",
+        )
+    background_tasks.add_task(PostSubmitPipeline.process, db, attempt_id)
+    return {"attempt_id": attempt_id, "status": "pending"}
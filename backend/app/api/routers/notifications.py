@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from pymongo.database import Database
 
 from app.api.deps import get_current_user, get_db, require_roles
@@ -8,6 +8,8 @@ from app.schemas.student import (
     NotificationResponse,
 )
 from app.services.student_service import StudentService
+from app.services.version_service import VersionService
+from app.utils.http_cache import etag_matches, not_modified, set_cache_headers
 
 
 router = APIRouter(
@@ -19,9 +21,17 @@ router = APIRouter(
 
 @router.get("", response_model=list[NotificationResponse])
 async def list_notifications(
+    request: Request,
+    response: Response,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-) -> list[NotificationResponse]:
+):
+    etag = VersionService.etag(
+        db, VersionService.notifications(str(current_user["_id"])), variant="notifications"
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, "private, no-cache")
+    set_cache_headers(response, etag, "private, no-cache")
     return [
         NotificationResponse(**item)
         for item in StudentService.list_notifications(db, current_user)
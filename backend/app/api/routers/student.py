@@ -1,10 +1,12 @@
+import json
 from typing import Literal
 
-from fastapi import APIRouter, Depends, Query, Response, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import StreamingResponse
 from pymongo.database import Database
 
-from app.api.deps import get_current_user, get_db, require_roles
+from app.api.deps import get_current_user, get_db, get_idempotency_key, require_roles
 from app.schemas.common import (
     MessageResponse,
     ChatAskResponse,
@@ -14,25 +16,42 @@ from app.schemas.common import (
     CreateChatSessionRequest,
 )
 from app.schemas.student import (
+    AttemptEventsRequest,
+    AttemptEventsResponse,
+    AttemptPackageResponse,
     FeedbackRequest,
+    LeaderboardResponse,
     ResultResponse,
     SaveAnswersRequest,
     SubmitAttemptRequest,
+    SyncRequest,
+    SyncResponse,
     StartAttemptResponse,
     StudentDoubtAskRequest,
     StudentDoubtResponse,
     StudentHomeSummaryResponse,
     StudentLibraryItemResponse,
     StudentProgressResponse,
+    StudentTestPageResponse,
     StudentTestResponse,
     SubmitAttemptResponse,
+    WeakTopicsResponse,
     QuizSubmitRequest,
     QuizSubmitResponse,
 )
 from app.schemas.planner import StudyPlanResponse, UpdateAvailabilityRequest
+from app.services.idempotency_service import REPLAYED_HEADER, IdempotencyService
+from app.services.leaderboard_service import LeaderboardService
+from app.services.offline_attempt_service import OfflineAttemptService
+from app.services.post_submit_pipeline import PostSubmitPipeline
 from app.services.student_service import StudentService
+from app.services.sync_service import SyncService
+from app.services.test_inbox_service import TestInboxService
+from app.services.topic_stats_service import TopicStatsService
+from app.services.version_service import VersionService
 from app.services.ai_service import stream_chat_reply
 from app.utils.cache import student_cache  # Added
+from app.utils.http_cache import etag_matches, not_modified, set_cache_headers
 
 
 router = APIRouter(
@@ -44,14 +63,24 @@ router = APIRouter(
 
 @router.get("/dashboard")
 async def student_dashboard(
+    request: Request,
+    response: Response,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-) -> dict:
+):
     """
     Single optimized endpoint for the student home dashboard.
     Bundles home summary, progress, tests, and notifications in one call.
     """
-    data = StudentService.dashboard_summary(db, current_user)
+    etag = StudentService.dashboard_etag(db, current_user)
+    if etag_matches(request, etag):
+        return not_modified(etag, "private, no-cache")
+    data = await StudentService.dashboard_summary(db, current_user, etag=etag)
+    if data["degraded"]:
+        # Never let a client pin a partial dashboard behind a validator.
+        response.headers["Cache-Control"] = "no-store"
+    else:
+        set_cache_headers(response, etag, "private, no-cache")
     return data
 
 
@@ -80,24 +109,103 @@ async def home_summary(
 
 @router.get("/tests", response_model=list[StudentTestResponse])
 async def list_tests(
+    request: Request,
+    response: Response,
     status_filter: Literal["assigned", "completed"] | None = Query(default=None, alias="status"),
     subject: Literal["Physics", "Chemistry", "Mathematics"] | None = None,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-) -> list[StudentTestResponse]:
+):
+    etag = VersionService.etag(
+        db,
+        VersionService.student(str(current_user["_id"])),
+        variant=["tests", status_filter, subject],
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag, "private, no-cache")
+    set_cache_headers(response, etag, "private, no-cache")
     return [
         StudentTestResponse(**test)
         for test in StudentService.list_tests(db, current_user, status_filter, subject)
     ]
 
 
+@router.get("/test-inbox", response_model=StudentTestPageResponse)
+async def list_test_inbox(
+    status_filter: Literal["assigned", "completed"] | None = Query(default=None, alias="status"),
+    subject: Literal["Physics", "Chemistry", "Mathematics"] | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> StudentTestPageResponse:
+    return StudentTestPageResponse(
+        **TestInboxService.list_page(
+            db,
+            current_user,
+            status_filter=status_filter,
+            subject=subject,
+            cursor=cursor,
+            limit=limit,
+        )
+    )
+
+
+@router.post("/sync", response_model=SyncResponse)
+async def sync_changes(
+    payload: SyncRequest,
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> SyncResponse:
+    """
+    Rows created, updated or deleted since each collection's watermark.
+    Keep calling with the returned watermarks while any collection has more.
+    """
+    return SyncResponse(
+        **SyncService.changes(db, current_user, payload.watermarks, limit=payload.limit)
+    )
+
+
 @router.post("/tests/{test_id}/start", response_model=StartAttemptResponse)
 async def start_test(
     test_id: str,
+    response: Response,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
+    idempotency_key: str | None = Depends(get_idempotency_key),
 ) -> StartAttemptResponse:
-    return StartAttemptResponse(**await StudentService.start_test(db, current_user, test_id))
+    fresh: dict = {}
+
+    async def start() -> dict:
+        fresh.update(await StudentService.start_test(db, current_user, test_id))
+        # Only the attempt's identity is kept under the key; a replay rebuilds
+        # the response, questions included, from the shared per-set view.
+        return {"attempt_id": fresh["attempt_id"], "question_set_id": fresh.get("question_set_id")}
+
+    stored = await IdempotencyService.run(
+        db,
+        user_id=str(current_user["_id"]),
+        scope="start_test",
+        key=idempotency_key,
+        fingerprint=IdempotencyService.fingerprint(test_id),
+        call=start,
+        response=response,
+    )
+    started = fresh or StudentService.started_attempt(db, current_user, stored["attempt_id"])
+    if not started.get("question_set_id"):
+        return StartAttemptResponse(**started)
+
+    # The questions are the bulk of the payload and come from the cached
+    # public view; encode them as they are instead of validating each one.
+    envelope = jsonable_encoder(StartAttemptResponse(**{**started, "questions": []}))
+    envelope["questions"] = started["questions"]
+    return Response(
+        content=json.dumps(envelope, separators=(",", ":")),
+        media_type="application/json",
+        headers={
+            name: value for name, value in response.headers.items() if name.lower() == REPLAYED_HEADER.lower()
+        },
+    )
 
 
 @router.post("/attempts/{attempt_id}/answers")
@@ -110,31 +218,85 @@ async def save_answers(
     return StudentService.save_answers(db, current_user, attempt_id, payload)
 
 
+@router.get("/attempts/{attempt_id}/package", response_model=AttemptPackageResponse)
+async def get_attempt_package(
+    attempt_id: str,
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> AttemptPackageResponse:
+    """Everything needed to sit the attempt offline; send ``signature`` back with replayed events."""
+    return AttemptPackageResponse(**OfflineAttemptService.package(db, current_user, attempt_id))
+
+
+@router.post("/attempts/{attempt_id}/events", response_model=AttemptEventsResponse)
+async def replay_attempt_events(
+    attempt_id: str,
+    payload: AttemptEventsRequest,
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> AttemptEventsResponse:
+    """Apply answer/time events recorded offline; events already applied are skipped."""
+    return AttemptEventsResponse(
+        **OfflineAttemptService.replay(
+            db,
+            current_user,
+            attempt_id,
+            [event.model_dump() for event in payload.events],
+            signature=payload.signature,
+        )
+    )
+
+
 @router.post("/attempts/{attempt_id}/submit", response_model=SubmitAttemptResponse)
 async def submit_attempt(
     attempt_id: str,
+    background_tasks: BackgroundTasks,
+    response: Response,
     payload: SubmitAttemptRequest | None = None,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
+    idempotency_key: str | None = Depends(get_idempotency_key),
 ) -> SubmitAttemptResponse:
-    return SubmitAttemptResponse(
-        **StudentService.submit_attempt(
+    async def submit() -> dict:
+        submitted = StudentService.submit_attempt(
             db,
             current_user,
             attempt_id,
             violation_reason=(payload.violation_reason if payload else None),
             time_spent=(payload.time_spent if payload else None),
         )
+        # Analysis, activity log and notifications run after the response is sent;
+        # the pipeline worker retries anything that fails here.
+        background_tasks.add_task(PostSubmitPipeline.process, db, attempt_id)
+        return submitted
+
+    submitted = await IdempotencyService.run(
+        db,
+        user_id=str(current_user["_id"]),
+        scope="submit_attempt",
+        key=idempotency_key,
+        fingerprint=IdempotencyService.fingerprint(attempt_id, payload.model_dump() if payload else None),
+        call=submit,
+        response=response,
     )
+    return SubmitAttemptResponse(**submitted)
 
 
 @router.get("/results/{attempt_id}", response_model=ResultResponse)
 async def get_result(
     attempt_id: str,
+    request: Request,
+    response: Response,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-) -> ResultResponse:
-    return ResultResponse(**StudentService.result(db, current_user, attempt_id))
+):
+    entry = StudentService.result_entry(db, current_user, attempt_id)
+    # Pending analysis must be revalidated; a finished result is immutable.
+    cache_control = "private, max-age=300" if entry["final"] else "private, no-cache"
+    if etag_matches(request, entry["etag"]):
+        return not_modified(entry["etag"], cache_control)
+    set_cache_headers(response, entry["etag"], cache_control)
+    return ResultResponse(**entry["payload"])
 
 
 @router.get("/progress", response_model=StudentProgressResponse)
@@ -152,6 +314,34 @@ async def progress(
     return StudentProgressResponse(**prog)
 
 
+@router.get("/leaderboard", response_model=LeaderboardResponse)
+async def leaderboard(
+    scope: Literal["global", "year", "class"] = "global",
+    class_id: str | None = None,
+    limit: int = Query(default=10, ge=1, le=100),
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> LeaderboardResponse:
+    position = LeaderboardService.position(db, current_user, scope=scope, class_id=class_id)
+    top = LeaderboardService.top(db, current_user, scope=scope, class_id=class_id, limit=limit)
+    return LeaderboardResponse(scope=scope, top=top, **position)
+
+
+@router.get("/weak-topics", response_model=WeakTopicsResponse)
+async def weak_topics(
+    threshold: float = Query(default=50.0, ge=0, le=100),
+    min_questions: int = Query(default=3, ge=1),
+    limit: int = Query(default=5, ge=1, le=50),
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> WeakTopicsResponse:
+    return WeakTopicsResponse(
+        **TopicStatsService.weak_topics(
+            db, str(current_user["_id"]), threshold=threshold, min_questions=min_questions, limit=limit
+        )
+    )
+
+
 @router.get("/library-items", response_model=list[StudentLibraryItemResponse])
 async def list_library_items(
     subject: Literal["Physics", "Chemistry", "Mathematics"] | None = None,
@@ -250,6 +440,7 @@ async def ask_student_doubt(
     session_id: str | None = Query(default=None),
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
+    idempotency_key: str | None = Depends(get_idempotency_key),
 ) -> StreamingResponse:
     # 1. Ensure a session exists or create one if not provided (though frontend should ideally manage this)
     # Actually, if session_id is None, we should probably create one, BUT doing it inside a streaming response 
@@ -257,15 +448,39 @@ async def ask_student_doubt(
     # For now, let's assume valid session_id is passed, OR we just log without session if missing (fallback).
     # Better: If session_id is present, we log.
     
+    # With an Idempotency-Key the finished reply is stored, so a retried ask
+    # replays it instead of generating (and logging) the answer again.
+    record_id = None
+    if idempotency_key is not None:
+        record_id = IdempotencyService.record_id(str(current_user["_id"]), "ask_doubt", idempotency_key)
+        existing = IdempotencyService.begin(
+            db, record_id, IdempotencyService.fingerprint(payload.model_dump(), session_id)
+        )
+        if existing is not None:
+            return StreamingResponse(
+                iter([existing["response"]["text"]]),
+                media_type="text/event-stream",
+                headers={REPLAYED_HEADER: "true"},
+            )
+
     if session_id:
         StudentService.save_chat_message(db, session_id, "user", payload.query)
 
     async def stream_and_save():
         full_response = ""
-        async for chunk in stream_chat_reply(payload.query):
-            full_response += chunk
-            yield chunk
-        
+        completed = False
+        try:
+            async for chunk in stream_chat_reply(payload.query):
+                full_response += chunk
+                yield chunk
+            completed = True
+        finally:
+            if record_id is not None:
+                if completed:
+                    IdempotencyService.complete(db, record_id, {"text": full_response})
+                else:
+                    IdempotencyService.release(db, record_id)
+
         # After streaming is done, save the AI response
         if session_id:
             StudentService.save_chat_message(db, session_id, "ai", full_response)
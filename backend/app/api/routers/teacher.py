@@ -1,14 +1,15 @@
 from typing import Literal
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
 from pydantic import ValidationError
 from pymongo.database import Database
 
 from app.core.config import get_settings
 from app.utils.cache import teacher_cache
-from app.api.deps import get_current_user, get_db, require_roles
+from app.api.deps import get_current_user, get_db, get_idempotency_key, require_roles
 from app.schemas.common import MessageResponse
 from app.schemas.teacher import (
+    AnswerKeyCorrectionRequest,
     AssignPaperRequest,
     TeacherClassStudentOptionResponse,
     TeacherClassStudentsUpdateRequest,
@@ -17,6 +18,7 @@ from app.schemas.teacher import (
     LessonPlanUpdateRequest,
     LibraryItemCreateRequest,
     LibraryItemResponse,
+    RescoreJobResponse,
     TeacherClassCreateRequest,
     TeacherClassResponse,
     TeacherHomeSummaryResponse,
@@ -24,9 +26,14 @@ from app.schemas.teacher import (
     TeacherPaperResponse,
     TeacherPaperUpdateRequest,
     TeacherStudentAttemptResponse,
+    TestItemAnalysisResponse,
 )
 from app.schemas.user import UserPublic
+from app.services.idempotency_service import IdempotencyService
+from app.services.rescore_service import RescoreService
 from app.services.teacher_service import TeacherService
+from app.services.version_service import VersionService
+from app.utils.http_cache import etag_matches, not_modified, set_cache_headers
 
 
 router = APIRouter(
@@ -53,9 +60,15 @@ async def home_summary(
 
 @router.get("/papers", response_model=list[TeacherPaperResponse])
 async def list_papers(
+    request: Request,
+    response: Response,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
-) -> list[TeacherPaperResponse]:
+):
+    etag = VersionService.etag(db, VersionService.papers(str(current_user["_id"])), variant="papers")
+    if etag_matches(request, etag):
+        return not_modified(etag, "private, no-cache")
+    set_cache_headers(response, etag, "private, no-cache")
     return [
         TeacherPaperResponse(**paper)
         for paper in TeacherService.list_papers(db, current_user)
@@ -65,10 +78,24 @@ async def list_papers(
 @router.post("/papers", response_model=TeacherPaperResponse, status_code=status.HTTP_201_CREATED)
 async def create_paper(
     payload: TeacherPaperCreateRequest,
+    response: Response,
     db: Database = Depends(get_db),
     current_user: dict = Depends(get_current_user),
+    idempotency_key: str | None = Depends(get_idempotency_key),
 ) -> TeacherPaperResponse:
-    return TeacherPaperResponse(**await TeacherService.create_paper(db, current_user, payload))
+    async def create() -> dict:
+        return await TeacherService.create_paper(db, current_user, payload)
+
+    paper = await IdempotencyService.run(
+        db,
+        user_id=str(current_user["_id"]),
+        scope="create_paper",
+        key=idempotency_key,
+        fingerprint=IdempotencyService.fingerprint(payload.model_dump()),
+        call=create,
+        response=response,
+    )
+    return TeacherPaperResponse(**paper)
 
 
 @router.get("/papers/{paper_id}", response_model=TeacherPaperResponse)
@@ -92,6 +119,39 @@ async def update_paper(
     )
 
 
+@router.put("/papers/{paper_id}/answer-key", response_model=RescoreJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def correct_answer_key(
+    paper_id: str,
+    payload: AnswerKeyCorrectionRequest,
+    background_tasks: BackgroundTasks,
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> RescoreJobResponse:
+    job = TeacherService.correct_answer_key(db, current_user, paper_id, payload)
+    if job["status"] == "pending":
+        # The rescore worker would pick the job up too; start it right away.
+        background_tasks.add_task(RescoreService.run, db, job["job_id"])
+    return RescoreJobResponse(**job)
+
+
+@router.get("/papers/{paper_id}/rescore", response_model=RescoreJobResponse)
+async def rescore_status(
+    paper_id: str,
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> RescoreJobResponse:
+    return RescoreJobResponse(**TeacherService.rescore_status(db, current_user, paper_id))
+
+
+@router.get("/papers/{paper_id}/item-analysis", response_model=TestItemAnalysisResponse)
+async def item_analysis(
+    paper_id: str,
+    db: Database = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+) -> TestItemAnalysisResponse:
+    return TestItemAnalysisResponse(**TeacherService.item_analysis(db, current_user, paper_id))
+
+
 @router.post("/papers/{paper_id}/assign", response_model=TeacherPaperResponse)
 async def assign_paper(
     paper_id: str,
@@ -100,7 +160,7 @@ async def assign_paper(
     current_user: dict = Depends(get_current_user),
 ) -> TeacherPaperResponse:
     return TeacherPaperResponse(
-        **TeacherService.assign_paper(db, current_user, paper_id, payload)
+        **await TeacherService.assign_paper(db, current_user, paper_id, payload)
     )
 
 
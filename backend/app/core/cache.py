@@ -64,6 +64,14 @@ def cache_delete(key: str) -> None:
     client.delete(key)
 
 
+def cache_delete_many(keys: list[str]) -> None:
+    """Delete a known set of keys in one round trip."""
+    client = get_redis()
+    if not client or not keys:
+        return
+    client.delete(*keys)
+
+
 def cache_delete_pattern(pattern: str) -> None:
     """Delete all keys matching a pattern (e.g. prefix:*)"""
     client = get_redis()
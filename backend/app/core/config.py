@@ -31,6 +31,47 @@ class Settings(BaseSettings):
     # Optional Redis connection URL, e.g. redis://localhost:6379/0
     redis_url: str | None = None
 
+    # Write-behind autosave buffer for live exams (Redis hash per attempt, flushed in batches).
+    answer_write_behind: bool = False
+    answer_flush_interval_seconds: float = 5.0
+    answer_buffer_ttl_seconds: int = 6 * 60 * 60
+
+    # Lease held by the single worker generating a test's question set.
+    question_set_lock_seconds: int = 120
+
+    # Post-submit pipeline (analysis, activity log, notifications) retry policy.
+    post_submit_poll_seconds: float = 15.0
+    post_submit_lease_seconds: int = 300
+    post_submit_max_attempts: int = 5
+    post_submit_retry_base_seconds: float = 30.0
+
+    # Per-section budget for the composite student dashboard; slow sections are returned degraded.
+    dashboard_part_timeout_seconds: float = 3.0
+
+    # Incremental sync holds back rows this fresh so late-committing writes are not skipped.
+    sync_settle_seconds: float = 2.0
+    # How often chat sessions nearing their TTL are deleted with sync tombstones.
+    chat_expiry_sweep_seconds: float = 3600.0
+
+    # Server-side expiry of abandoned attempts (started_at + duration + grace).
+    attempt_grace_seconds: int = 60
+    attempt_sweep_seconds: float = 30.0
+    attempt_sweep_batch_size: int = 500
+
+    # Idempotency-Key records: how long responses are replayable, and how long
+    # an unfinished request holds its key before a retry may take it over.
+    idempotency_ttl_seconds: int = 86400
+    idempotency_lease_seconds: int = 120
+
+    # Answer-key rescore jobs: attempts per claimed batch, how long a claim
+    # holds before another worker may take it, how often the app polls, and
+    # the backoff before a job whose batch failed is retried.
+    rescore_batch_size: int = 500
+    rescore_lease_seconds: int = 300
+    rescore_poll_seconds: float = 10.0
+    rescore_retry_base_seconds: float = 30.0
+    rescore_retry_max_seconds: float = 1800.0
+
     cors_origins: list[str] = Field(
         default_factory=lambda: [
             "http://localhost:3000",
@@ -1,4 +1,5 @@
 from pymongo.database import Database
+from pymongo.errors import CollectionInvalid, OperationFailure
 
 
 _THIRTY_DAYS_SECONDS = 60 * 60 * 24 * 30
@@ -36,6 +37,40 @@ def ensure_indexes(db: Database) -> None:
     # Added for optimized leaderboard aggregation
     db.test_attempts.create_index([("status", 1), ("submitted_at", -1), ("score", -1)]) 
     db.test_attempts.create_index([("student_id", 1), ("status", 1), ("updated_at", -1)])
+    # Post-submit pipeline worker scans due/expired jobs.
+    db.test_attempts.create_index([("post_submit.status", 1), ("post_submit.next_run_at", 1)])
+    # Deadline sweeper: expired in-progress attempts, oldest deadline first.
+    db.test_attempts.create_index([("status", 1), ("deadline_at", 1)])
+    db.test_attempts.create_index([("expired_by", 1)], sparse=True)
+    # Per-student test inbox: keyset pages ordered by (sort_key, _id).
+    db.student_test_inbox.create_index([("student_id", 1), ("sort_key", -1), ("_id", -1)])
+    db.student_test_inbox.create_index([("student_id", 1), ("status", 1), ("sort_key", -1), ("_id", -1)])
+    db.student_test_inbox.create_index([("student_id", 1), ("subject", 1), ("sort_key", -1), ("_id", -1)])
+    db.student_test_inbox.create_index([("test_id", 1)])
+    # Leaderboard fallback without Redis: rank = 1 + students with a higher average.
+    db.student_stats.create_index([("avg_score", -1)])
+    db.student_stats.create_index([("year", 1), ("avg_score", -1)])
+    # Incremental sync: (updated_at, _id) keyset per owner, plus expiring tombstones.
+    db.student_test_inbox.create_index([("student_id", 1), ("updated_at", 1), ("_id", 1)])
+    db.notifications.create_index([("user_id", 1), ("updated_at", 1), ("_id", 1)])
+    db.chat_sessions.create_index([("student_id", 1), ("updated_at", 1), ("_id", 1)])
+    db.library_items.create_index([("year", 1), ("updated_at", 1), ("_id", 1)])
+    db.sync_tombstones.create_index([("owner_id", 1), ("collection", 1), ("deleted_at", 1)])
+    db.sync_tombstones.create_index("deleted_at", expireAfterSeconds=_THIRTY_DAYS_SECONDS)
+    # Idempotency-Key claims and stored responses expire on their own.
+    db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    # Rescore jobs stream a test's submitted attempts and claim them by token.
+    db.test_attempts.create_index([("test_id", 1), ("status", 1), ("question_set_id", 1)])
+    db.test_attempts.create_index([("rescore.token", 1)], sparse=True)
+    db.rescore_jobs.create_index([("test_id", 1), ("created_at", -1)])
+    db.rescore_jobs.create_index([("status", 1), ("created_at", 1)])
+    # Cross-attempt topic counters are read per student.
+    db.student_topic_stats.create_index([("student_id", 1), ("subject", 1)])
+    _ensure_rank_snapshots(db)
+    db.rank_snapshots.create_index([("meta.student_id", 1), ("meta.period", 1), ("taken_at", -1)])
+    db.rank_snapshots.create_index([("meta.period", 1), ("taken_at", -1)])
+    # Content-addressed question sets shared by every attempt of a test.
+    db.question_sets.create_index([("test_id", 1), ("created_at", -1)])
     
     db.tests.create_index([("created_at", -1)])
 
@@ -55,6 +90,9 @@ def ensure_indexes(db: Database) -> None:
     db.feedback.create_index([("created_at", -1)])
     db.notifications.create_index([("user_id", 1), ("read", 1), ("created_at", -1)])
     db.activity_logs.create_index([("created_at", -1)])
+    # Side effects of retried post-submit steps are written at most once.
+    db.notifications.create_index("dedupe_key", unique=True, sparse=True)
+    db.activity_logs.create_index("dedupe_key", unique=True, sparse=True)
     db.classes.create_index([("subject", 1)])
     db.classes.create_index("student_ids")
     db.settings.create_index([("key", 1)], unique=True)
@@ -62,7 +100,21 @@ def ensure_indexes(db: Database) -> None:
     db.chat_sessions.create_index([("student_id", 1), ("updated_at", -1)])
     db.chat_messages.create_index([("session_id", 1), ("created_at", 1)])
 
-    # Auto-expire chat history after 30 days from creation.
-    # TTL cleanup is performed by MongoDB in the background.
+    # Auto-expire chat history after 30 days from creation. SyncService deletes
+    # sessions a day earlier so clients get tombstones; TTL is the backstop.
     db.chat_sessions.create_index("created_at", expireAfterSeconds=_THIRTY_DAYS_SECONDS)
     db.chat_messages.create_index("created_at", expireAfterSeconds=_THIRTY_DAYS_SECONDS)
+
+
+def _ensure_rank_snapshots(db: Database) -> None:
+    """Create ``rank_snapshots`` as a time-series collection where the server supports it."""
+    if "rank_snapshots" in db.list_collection_names():
+        return
+    try:
+        db.create_collection(
+            "rank_snapshots",
+            timeseries={"timeField": "taken_at", "metaField": "meta", "granularity": "hours"},
+        )
+    except (CollectionInvalid, OperationFailure, NotImplementedError):
+        # Older servers (and test doubles) keep it as a regular collection.
+        pass
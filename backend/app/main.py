@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
@@ -9,6 +10,11 @@ from app.core.cache import get_redis
 
 from app.db.client import create_mongo_client
 from app.db.indexes import ensure_indexes  # Added import
+from app.services.answer_buffer import AnswerBuffer
+from app.services.attempt_sweeper import AttemptSweeper
+from app.services.post_submit_pipeline import PostSubmitPipeline
+from app.services.rescore_service import RescoreService
+from app.services.sync_service import SyncService
 
 def create_app() -> FastAPI:
     settings: Settings = get_settings()
@@ -43,8 +49,26 @@ def create_app() -> FastAPI:
         except Exception as e:
             print(f"Failed to connect to MongoDB during startup: {e}")
             # we don't raise here to allow app to start, but requests will fail if db is None
-        
+
+        background_tasks: list[asyncio.Task] = []
+        db = getattr(app.state, "db", None)
+        if db is not None and AnswerBuffer.enabled():
+            background_tasks.append(asyncio.create_task(AnswerBuffer.run_flusher(db)))
+        elif settings.answer_write_behind:
+            print("Answer write-behind needs Redis (REDIS_URL); autosaves go straight to MongoDB.")
+        if db is not None:
+            background_tasks.append(asyncio.create_task(PostSubmitPipeline.run_worker(db)))
+            background_tasks.append(asyncio.create_task(AttemptSweeper.run_worker(db)))
+            background_tasks.append(asyncio.create_task(RescoreService.run_worker(db)))
+            background_tasks.append(asyncio.create_task(SyncService.run_expiry_worker(db)))
+
         yield
+
+        for task in background_tasks:
+            task.cancel()
+        if db is not None and AnswerBuffer.enabled():
+            # Final flush so buffered autosaves survive a restart.
+            AnswerBuffer.flush(db)
         client = getattr(app.state, "mongo_client", None)
         if client is not None:
             client.close()
@@ -69,3 +69,24 @@ class BillingReportResponse(BaseModel):
 
 class SetJeeExamDateRequest(BaseModel):
     jee_exam_date: datetime
+
+
+class PostSubmitCounts(BaseModel):
+    pending: int = 0
+    running: int = 0
+    done: int = 0
+    failed: int = 0
+
+
+class PostSubmitFailure(BaseModel):
+    attempt_id: str
+    student_id: str | None = None
+    attempts: int
+    done: list[str]
+    last_error: str | None = None
+    updated_at: datetime | None = None
+
+
+class PostSubmitStatusResponse(BaseModel):
+    counts: PostSubmitCounts
+    failures: list[PostSubmitFailure]
@@ -58,6 +58,11 @@ class StudentTestResponse(BaseModel):
     created_at: datetime | None = None
 
 
+class StudentTestPageResponse(BaseModel):
+    items: list[StudentTestResponse]
+    next_cursor: str | None = None
+
+
 class AttemptQuestionResponse(BaseModel):
     id: str
     subject: str
@@ -72,6 +77,8 @@ class StartAttemptResponse(BaseModel):
     status: str
     started_at: datetime
     duration: int
+    # Version of the question set; the questions for a given id never change.
+    question_set_id: str | None = None
     questions: list[AttemptQuestionResponse] = Field(default_factory=list)
     answers: dict[str, int | None] = Field(default_factory=dict)
 
@@ -81,6 +88,44 @@ class SaveAnswersRequest(BaseModel):
     time_spent: dict[str, int] | None = None
 
 
+class AttemptPackageResponse(BaseModel):
+    attempt_id: str
+    test_id: str
+    title: str | None = None
+    subject: str
+    duration: int
+    started_at: datetime
+    deadline_at: datetime | None = None
+    server_time: datetime
+    questions: list[AttemptQuestionResponse] = Field(default_factory=list)
+    answers: dict[str, int | None] = Field(default_factory=dict)
+    time_spent: dict[str, int] = Field(default_factory=dict)
+    last_seq: int = 0
+    signature: str
+
+
+class AttemptEvent(BaseModel):
+    # Per-attempt sequence number, increasing in the order events were recorded.
+    seq: int = Field(ge=1)
+    type: Literal["answer", "time"]
+    question_id: str
+    value: int | None = None
+    seconds: int | None = Field(default=None, ge=0)
+
+
+class AttemptEventsRequest(BaseModel):
+    events: list[AttemptEvent] = Field(max_length=2000)
+    signature: str | None = None
+
+
+class AttemptEventsResponse(BaseModel):
+    attempt_id: str
+    applied: int
+    skipped: int
+    last_seq: int
+    saved_answers: int
+
+
 class SubmitAttemptRequest(BaseModel):
     violation_reason: str | None = Field(default=None, max_length=500)
     time_spent: dict[str, int] | None = None
@@ -107,9 +152,12 @@ class ResultQuestionResponse(BaseModel):
     subject: str
     question_text: str
     options: list[str]
-    selected_answer: int | None
-    correct_answer: int
+    # An option index, a list of them (multi-correct) or a number (numerical).
+    selected_answer: int | float | list[int] | None
+    correct_answer: int | float | list[int] | None
     is_correct: bool
+    # "correct", "partial", "wrong" or "unattempted", as scored.
+    verdict: str | None = None
     explanation: str
     topic: str | None = None
     subtopic: str | None = None
@@ -138,6 +186,7 @@ class ResultResponse(BaseModel):
 class RankPoint(BaseModel):
     week: str
     rank: int
+    percentile: float | None = None
 
 
 class TopicMastery(BaseModel):
@@ -154,6 +203,60 @@ class StudentProgressResponse(BaseModel):
     topic_mastery: list[TopicMastery]
 
 
+class LeaderboardEntry(BaseModel):
+    rank: int
+    student_id: str
+    name: str
+    avg_score: float
+    is_me: bool = False
+
+
+class LeaderboardResponse(BaseModel):
+    scope: str
+    rank: int | None = None
+    total: int
+    percentile: float | None = None
+    avg_score: float
+    top: list[LeaderboardEntry]
+
+
+class WeakTopicEntry(BaseModel):
+    subject: str
+    topic: str
+    accuracy: float
+    questions: int
+    attempted: int
+    correct: int
+    partial: int
+    avg_time_seconds: float | None = None
+    weakest_subtopic: str | None = None
+
+
+class WeakTopicsResponse(BaseModel):
+    threshold: float
+    weak_topics: list[WeakTopicEntry]
+    strong_topics: list[WeakTopicEntry]
+
+
+class SyncRequest(BaseModel):
+    # Collection name -> watermark from the previous sync (null for a full sync).
+    watermarks: dict[str, str | None]
+    limit: int = Field(default=100, ge=1, le=500)
+
+
+class SyncCollectionChanges(BaseModel):
+    items: list[dict]
+    deleted: list[str]
+    watermark: str
+    has_more: bool
+    reset: bool
+
+
+class SyncResponse(BaseModel):
+    server_time: datetime
+    collections: dict[str, SyncCollectionChanges]
+
+
 class StudentLibraryItemResponse(BaseModel):
     id: str
     title: str
@@ -57,6 +57,50 @@ class AssignPaperRequest(BaseModel):
     class_ids: list[str] = Field(min_length=1)
 
 
+class ItemStatsResponse(BaseModel):
+    question_id: str
+    topic: str
+    correct: int
+    partial: int
+    wrong: int
+    unattempted: int
+    p_value: float | None = None
+    difficulty: Literal["Easy", "Medium", "Hard"] | None = None
+    discrimination: float | None = None
+    option_distribution: list[int]
+    median_time_seconds: float | None = None
+
+
+class TestItemAnalysisResponse(BaseModel):
+    test_id: str
+    attempts: int
+    mean_score: float
+    items: list[ItemStatsResponse]
+
+
+class AnswerKeyCorrection(BaseModel):
+    question_id: str = Field(min_length=1)
+    # Option index, a list of indices (multi-correct) or a numerical answer.
+    correct: int | float | list[int]
+
+
+class AnswerKeyCorrectionRequest(BaseModel):
+    corrections: list[AnswerKeyCorrection] = Field(min_length=1)
+
+
+class RescoreJobResponse(BaseModel):
+    job_id: str
+    test_id: str
+    question_set_id: str
+    status: Literal["pending", "running", "done", "failed", "superseded"]
+    total: int
+    processed: int
+    changed: int
+    created_at: datetime | None = None
+    finished_at: datetime | None = None
+    last_error: str | None = None
+
+
 class TeacherClassResponse(BaseModel):
     id: str
     name: str
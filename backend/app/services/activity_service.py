@@ -15,7 +15,9 @@ class ActivityService:
         actor_id: str | None = None,
         actor_role: str | None = None,
         metadata: dict | None = None,
+        dedupe_key: str | None = None,
     ) -> None:
+        """Append an activity entry. With ``dedupe_key`` a repeated call is a no-op."""
         document = {
             "text": text,
             "type": event_type,
@@ -25,7 +27,11 @@ class ActivityService:
             "created_at": datetime.now(timezone.utc),
         }
         try:
-            db.activity_logs.insert_one(document)
+            if dedupe_key is None:
+                db.activity_logs.insert_one(document)
+            else:
+                document["dedupe_key"] = dedupe_key
+                db.activity_logs.update_one({"dedupe_key": dedupe_key}, {"$setOnInsert": document}, upsert=True)
         except Exception:
             # Activity logs must never block core operations.
             return
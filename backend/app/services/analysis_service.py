@@ -3,14 +3,17 @@ Performance analysis service for test results.
 Analyzes student performance, identifies weak topics, detects patterns, and generates AI feedback.
 """
 
+import asyncio
+
 from app.services.ai_service import call_openai
+from app.services.answer_key import CORRECT, UNATTEMPTED, CompiledAnswerKey
 
 
 class AnalysisService:
     """Service for analyzing test performance and generating insights."""
 
     @staticmethod
-    def analyze_performance(session: dict) -> dict:
+    def analyze_performance(session: dict, key: CompiledAnswerKey | None = None) -> dict:
         """
         Analyze student performance by topic and subtopic.
 
@@ -18,77 +21,17 @@ class AnalysisService:
             session: Dictionary containing:
                 - questions: List of question objects
                 - answers: Dict mapping question IDs to selected answers
+            key: Compiled answer key for the questions (compiled here if omitted)
 
         Returns:
             Dictionary with topic and subtopic statistics.
         """
-        topic_stats = {}
-        subtopic_stats = {}
-
-        for q in session.get("questions", []):
-            qid = str(q.get("id", ""))
-            subject = q.get("subject", "General")
-            topic = q.get("topic", "General")
-            subtopic = q.get("subtopic", "General")
-
-            # Initialize topic if not exists
-            if topic not in topic_stats:
-                topic_stats[topic] = {
-                    "subject": subject,
-                    "attempted": 0,
-                    "correct": 0,
-                    "wrong": 0,
-                    "partial": 0,
-                }
-
-            # Initialize subtopic if not exists
-            subtopic_key = f"{topic}::{subtopic}"
-            if subtopic_key not in subtopic_stats:
-                subtopic_stats[subtopic_key] = {
-                    "subject": subject,
-                    "topic": topic,
-                    "attempted": 0,
-                    "correct": 0,
-                    "wrong": 0,
-                    "partial": 0,
-                }
-
-            user_answer = session.get("answers", {}).get(qid)
-
-            if user_answer is not None:
-                topic_stats[topic]["attempted"] += 1
-                subtopic_stats[subtopic_key]["attempted"] += 1
-
-                # Check if correct
-                if user_answer == q.get("correct"):
-                    topic_stats[topic]["correct"] += 1
-                    subtopic_stats[subtopic_key]["correct"] += 1
-                else:
-                    topic_stats[topic]["wrong"] += 1
-                    subtopic_stats[subtopic_key]["wrong"] += 1
-            else:
-                # Unattempted - still count towards topic
-                topic_stats[topic]["attempted"] += 1
-                subtopic_stats[subtopic_key]["attempted"] += 1
-
-        # Calculate accuracy for each topic and subtopic
-        for topic_data in topic_stats.values():
-            attempted = topic_data["attempted"]
-            topic_data["accuracy"] = (
-                (topic_data["correct"] / attempted) * 100
-                if attempted > 0 else 0
-            )
-
-        for subtopic_data in subtopic_stats.values():
-            attempted = subtopic_data["attempted"]
-            subtopic_data["accuracy"] = (
-                (subtopic_data["correct"] / attempted) * 100
-                if attempted > 0 else 0
-            )
-
+        if key is None:
+            key = CompiledAnswerKey(session.get("questions", []))
+        fused = AnalysisService.fused_pass(key, session.get("answers", {}))
         return {
-            "topic_stats": topic_stats,
-            "subtopic_stats": subtopic_stats,
+            "topic_stats": fused["topic_stats"],
+            "subtopic_stats": fused["subtopic_stats"],
         }
 
     @staticmethod
@@ -134,59 +77,95 @@ class AnalysisService:
         }
 
     @staticmethod
-    def detect_patterns(session: dict, question_set: list) -> dict:
+    def detect_patterns(session: dict, question_set: list, key: CompiledAnswerKey | None = None) -> dict:
         """
         Detect common mistake patterns.
 
         Args:
             session: Dictionary containing answers
             question_set: List of question objects
+            key: Compiled answer key for question_set (compiled here if omitted)
 
         Returns:
             Dictionary with mistake patterns.
         """
+        if key is None:
+            key = CompiledAnswerKey(question_set)
+        fused = AnalysisService.fused_pass(key, session.get("answers", {}))
+        return {
+            "patterns": fused["patterns"],
+            "mistake_examples": fused["mistake_examples"],
+        }
+
+    @staticmethod
+    def fused_pass(key: CompiledAnswerKey, answers: dict) -> dict:
+        """
+        Topic/subtopic statistics, mistake patterns and overall totals in one
+        walk over the compiled key. Verdicts are the ones the score was
+        computed from; mistake categories were classified when the key was
+        compiled.
+        """
+        # Unattempted questions still count towards the topic, so
+        # "attempted" is the topic's question count, known from the key.
+        topic_stats = {
+            topic: {"subject": subject, "attempted": count, "correct": 0, "wrong": 0, "partial": 0}
+            for topic, (subject, count) in key.topic_counts.items()
+        }
+        subtopic_stats = {
+            subtopic_key: {
+                "subject": subject,
+                "topic": topic,
+                "attempted": count,
+                "correct": 0,
+                "wrong": 0,
+                "partial": 0,
+            }
+            for subtopic_key, (subject, topic, count) in key.subtopic_counts.items()
+        }
         patterns = {
             "conceptual_errors": 0,
             "calculation_errors": 0,
             "careless_mistakes": 0,
             "skipped_questions": 0,
         }
-
         mistake_examples = []
+        total_correct = 0
 
-        for q in question_set:
-            qid = str(q.get("id", ""))
-            user_answer = session.get("answers", {}).get(qid)
-            correct_answer = q.get("correct")
-            explanation = q.get("explanation", "").lower()
-
-            # Skipped questions
-            if user_answer is None:
+        for qid, (_, topic, subtopic), subtopic_key, (pattern, mistake_type), verdict in zip(
+            key.question_ids, key.topics, key.subtopic_keys, key.mistake_types, key.verdicts(answers)
+        ):
+            if verdict == UNATTEMPTED:
                 patterns["skipped_questions"] += 1
                 continue
 
-            # Wrong answer - categorize the mistake
-            if user_answer != correct_answer:
-                if any(keyword in explanation for keyword in ["concept", "formula", "law", "principle", "rule"]):
-                    patterns["conceptual_errors"] += 1
-                    mistake_type = "Conceptual Error"
-                elif any(keyword in explanation for keyword in ["calculate", "formula", "multiply", "divide", "add"]):
-                    patterns["calculation_errors"] += 1
-                    mistake_type = "Calculation Error"
-                else:
-                    patterns["careless_mistakes"] += 1
-                    mistake_type = "Careless Mistake"
+            topic_stats[topic][verdict] += 1
+            subtopic_stats[subtopic_key][verdict] += 1
+            if verdict == CORRECT:
+                total_correct += 1
+                continue
 
+            # Wrong (or only partially correct) answer - categorize the mistake
+            patterns[pattern] += 1
+            if len(mistake_examples) < 5:  # Top 5 mistakes
                 mistake_examples.append({
                     "type": mistake_type,
                     "question_id": qid,
-                    "topic": q.get("topic", "General"),
-                    "subtopic": q.get("subtopic", "General"),
+                    "topic": topic,
+                    "subtopic": subtopic,
                 })
 
+        # Calculate accuracy for each topic and subtopic
+        for data in (*topic_stats.values(), *subtopic_stats.values()):
+            attempted = data["attempted"]
+            data["accuracy"] = (data["correct"] / attempted) * 100 if attempted > 0 else 0
+
         return {
+            "topic_stats": topic_stats,
+            "subtopic_stats": subtopic_stats,
             "patterns": patterns,
-            "mistake_examples": mistake_examples[:5],  # Top 5 mistakes
+            "mistake_examples": mistake_examples,
+            "total_questions": len(key.question_ids),
+            "total_correct": total_correct,
         }
 
     @staticmethod
@@ -241,7 +220,8 @@ Please provide:
 Keep it concise, actionable, and encouraging. Format as clear bullet points."""
 
         try:
-            feedback = await call_openai(prompt, max_tokens=500)
+            # call_openai is blocking; keep it off the event loop.
+            feedback = await asyncio.to_thread(call_openai, prompt, max_output_tokens=500)
             return feedback or "Focus on weak topics and practice similar problems."
         except Exception:
             return "Continue practicing weak topics identified above. Each mistake is a learning opportunity!"
@@ -251,6 +231,7 @@ Keep it concise, actionable, and encouraging. Format as clear bullet points."""
         session: dict,
         question_set: list,
         subject: str = "General",
+        key: CompiledAnswerKey | None = None,
     ) -> dict:
         """
         Build complete analysis combining all components.
@@ -259,44 +240,37 @@ Keep it concise, actionable, and encouraging. Format as clear bullet points."""
             session: Dictionary with questions and answers
             question_set: List of question objects
             subject: Test subject
+            key: Compiled answer key for question_set (compiled here if omitted)
 
         Returns:
             Complete analysis dictionary.
         """
-        # Step 1: Analyze performance
-        performance = AnalysisService.analyze_performance({
-            "questions": question_set,
-            "answers": session.get("answers", {}),
-        })
+        if key is None:
+            key = CompiledAnswerKey(question_set)
+
+        # Step 1: Topic stats, mistake patterns and totals in one pass
+        fused = AnalysisService.fused_pass(key, session.get("answers", {}))
 
         # Step 2: Find weak topics
         weak_analysis = AnalysisService.get_weak_topics(
-            performance["topic_stats"],
+            fused["topic_stats"],
             threshold=50.0
         )
 
-        # Step 3: Detect patterns
-        pattern_analysis = AnalysisService.detect_patterns(
-            session, question_set)
-
-        # Calculate overall metrics
-        all_attempts = sum(
-            t["attempted"] for t in performance["topic_stats"].values()
-        )
-        all_correct = sum(
-            t["correct"] for t in performance["topic_stats"].values()
-        )
+        # Every question counts as attempted towards its topic
+        all_attempts = fused["total_questions"]
+        all_correct = fused["total_correct"]
         overall_accuracy = (all_correct / all_attempts *
                             100) if all_attempts > 0 else 0
 
         return {
             "overall_accuracy": round(overall_accuracy, 1),
-            "topic_breakdown": performance["topic_stats"],
-            "subtopic_breakdown": performance["subtopic_stats"],
+            "topic_breakdown": fused["topic_stats"],
+            "subtopic_breakdown": fused["subtopic_stats"],
             "weak_topics": weak_analysis["weak_topics"],
             "strong_topics": weak_analysis["strong_topics"],
-            "mistake_patterns": pattern_analysis["patterns"],
-            "mistake_examples": pattern_analysis["mistake_examples"],
+            "mistake_patterns": fused["patterns"],
+            "mistake_examples": fused["mistake_examples"],
             "total_questions_attempted": all_attempts,
             "total_correct": all_correct,
         }
@@ -0,0 +1,223 @@
+"""
+Write-behind buffer for in-progress test attempts.
+
+During live exams every student autosaves every few seconds. With write-behind
+enabled, autosaves land in a Redis hash per attempt and are flushed to MongoDB
+in batched ``bulk_write`` calls on an interval and when the attempt is
+submitted. The buffer must be visible to every worker (the submit, the sweeper
+and the flusher may all run elsewhere), so without Redis write-behind stays
+off and autosaves go straight to MongoDB. ``InMemoryAnswerStore`` exists for
+tests only.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from app.core.cache import get_redis
+from app.core.config import get_settings
+
+_KEY_PREFIX = "attempt:buffer:"
+_DIRTY_KEY = "attempt:buffer:dirty"
+_OWNER_FIELD = "student_id"
+_ANSWER_PREFIX = "a:"
+_TIME_PREFIX = "t:"
+
+
+class InMemoryAnswerStore:
+    """
+    Process-local stand-in for the handful of Redis hash/set commands the
+    buffer uses. Tests only: they set it as ``AnswerBuffer._test_store``.
+    """
+
+    def __init__(self) -> None:
+        self._hashes: dict[str, dict[str, str]] = {}
+        self._sets: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def hset(self, name: str, mapping: dict[str, str]) -> None:
+        with self._lock:
+            self._hashes.setdefault(name, {}).update(mapping)
+
+    def hgetall(self, name: str) -> dict[str, str]:
+        with self._lock:
+            return dict(self._hashes.get(name, {}))
+
+    def hget(self, name: str, key: str) -> str | None:
+        with self._lock:
+            return self._hashes.get(name, {}).get(key)
+
+    def expire(self, name: str, seconds: int) -> None:
+        # Entries are dropped on submit; expiry is not needed for a single process.
+        return
+
+    def delete(self, *names: str) -> None:
+        with self._lock:
+            for name in names:
+                self._hashes.pop(name, None)
+                self._sets.pop(name, None)
+
+    def sadd(self, name: str, *values: str) -> None:
+        with self._lock:
+            self._sets.setdefault(name, set()).update(values)
+
+    def srem(self, name: str, *values: str) -> None:
+        with self._lock:
+            self._sets.get(name, set()).difference_update(values)
+
+    def spop(self, name: str, count: int) -> list[str]:
+        with self._lock:
+            members = self._sets.get(name, set())
+            popped = [members.pop() for _ in range(min(count, len(members)))]
+            return popped
+
+
+class AnswerBuffer:
+    # Set by tests; production buffers only in the shared Redis.
+    _test_store: InMemoryAnswerStore | None = None
+
+    @staticmethod
+    def enabled() -> bool:
+        if not get_settings().answer_write_behind:
+            return False
+        return AnswerBuffer._test_store is not None or get_redis() is not None
+
+    @staticmethod
+    def _store():
+        return AnswerBuffer._test_store or get_redis()
+
+    @staticmethod
+    def _key(attempt_id: str) -> str:
+        return f"{_KEY_PREFIX}{attempt_id}"
+
+    @staticmethod
+    def owner(attempt_id: str) -> str | None:
+        """Student that owns the buffered attempt, or None if nothing is buffered yet."""
+        return AnswerBuffer._store().hget(AnswerBuffer._key(attempt_id), _OWNER_FIELD)
+
+    @staticmethod
+    def seed(attempt_id: str, student_id: str, answers: dict, time_spent: dict) -> None:
+        """Load the persisted state of an attempt so later autosaves can skip MongoDB reads."""
+        mapping = {_OWNER_FIELD: student_id}
+        mapping.update(AnswerBuffer._encode(answers, time_spent))
+        store = AnswerBuffer._store()
+        key = AnswerBuffer._key(attempt_id)
+        store.hset(key, mapping=mapping)
+        store.expire(key, get_settings().answer_buffer_ttl_seconds)
+
+    @staticmethod
+    def record(attempt_id: str, answers: dict, time_spent: dict | None) -> int:
+        """Buffer an autosave and return the number of answered questions."""
+        store = AnswerBuffer._store()
+        key = AnswerBuffer._key(attempt_id)
+        mapping = AnswerBuffer._encode(answers, time_spent or {})
+        if mapping:
+            store.hset(key, mapping=mapping)
+            store.sadd(_DIRTY_KEY, attempt_id)
+        store.expire(key, get_settings().answer_buffer_ttl_seconds)
+
+        buffered = AnswerBuffer._decode(store.hgetall(key))
+        return len([value for value in buffered["answers"].values() if value is not None])
+
+    @staticmethod
+    def pending(attempt_id: str) -> dict:
+        """Latest buffered answers/time spent for an attempt (empty when nothing is buffered)."""
+        return AnswerBuffer._decode(AnswerBuffer._store().hgetall(AnswerBuffer._key(attempt_id)))
+
+    @staticmethod
+    def discard(attempt_id: str) -> None:
+        store = AnswerBuffer._store()
+        store.delete(AnswerBuffer._key(attempt_id))
+        store.srem(_DIRTY_KEY, attempt_id)
+
+    @staticmethod
+    def flush(db: Database, *, batch_size: int = 500) -> int:
+        """Write all dirty buffered attempts to MongoDB. Returns the number of attempts flushed."""
+        store = AnswerBuffer._store()
+        flushed = 0
+        while True:
+            attempt_ids = store.spop(_DIRTY_KEY, batch_size) or []
+            if not attempt_ids:
+                return flushed
+
+            now = datetime.now(timezone.utc)
+            operations: list[UpdateOne] = []
+            for attempt_id in attempt_ids:
+                if not ObjectId.is_valid(attempt_id):
+                    continue
+                buffered = AnswerBuffer._decode(store.hgetall(AnswerBuffer._key(attempt_id)))
+                updates = AnswerBuffer.mongo_set(buffered)
+                if not updates:
+                    continue
+                updates["updated_at"] = now
+                operations.append(
+                    UpdateOne(
+                        {"_id": ObjectId(attempt_id), "status": "in_progress"},
+                        {"$set": updates},
+                    )
+                )
+
+            if operations:
+                try:
+                    db.test_attempts.bulk_write(operations, ordered=False)
+                except Exception as exc:
+                    # Put the batch back so the next interval retries it.
+                    store.sadd(_DIRTY_KEY, *attempt_ids)
+                    print(f"Answer buffer flush failed: {exc}")
+                    return flushed
+            flushed += len(operations)
+
+    @staticmethod
+    async def run_flusher(db: Database) -> None:
+        """Background loop started from the app lifespan when write-behind is enabled."""
+        interval = max(0.5, float(get_settings().answer_flush_interval_seconds))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(AnswerBuffer.flush, db)
+            except Exception as exc:  # noqa: BLE001
+                print(f"Answer buffer flusher error: {exc}")
+
+    @staticmethod
+    def mongo_set(buffered: dict) -> dict:
+        """Dotted ``$set`` paths for merging buffered answers into an attempt document."""
+        updates: dict = {}
+        for question_id, value in buffered.get("answers", {}).items():
+            updates[f"answers.{question_id}"] = value
+        for question_id, seconds in buffered.get("time_spent", {}).items():
+            updates[f"time_spent.{question_id}"] = seconds
+        return updates
+
+    @staticmethod
+    def _encode(answers: dict, time_spent: dict) -> dict[str, str]:
+        mapping: dict[str, str] = {}
+        for question_id, value in answers.items():
+            mapping[f"{_ANSWER_PREFIX}{question_id}"] = json.dumps(value)
+        for question_id, seconds in time_spent.items():
+            if isinstance(seconds, int) and seconds >= 0:
+                mapping[f"{_TIME_PREFIX}{question_id}"] = str(seconds)
+        return mapping
+
+    @staticmethod
+    def _decode(raw: dict[str, str]) -> dict:
+        answers: dict = {}
+        time_spent: dict[str, int] = {}
+        for field, value in (raw or {}).items():
+            if field.startswith(_ANSWER_PREFIX):
+                try:
+                    answers[field[len(_ANSWER_PREFIX):]] = json.loads(value)
+                except (TypeError, ValueError):
+                    continue
+            elif field.startswith(_TIME_PREFIX):
+                try:
+                    time_spent[field[len(_TIME_PREFIX):]] = int(value)
+                except (TypeError, ValueError):
+                    continue
+        return {"answers": answers, "time_spent": time_spent}
@@ -0,0 +1,307 @@
+"""
+Compiled answer keys.
+
+A question set is immutable once stored, so everything scoring and analysis
+derive from it (type codes, marking scheme, correct-option bitmasks, numeric
+keys, maximum score, topic mapping) is computed once per question-set version
+and kept in a bounded LRU (``QuestionSetService.answer_key``). ``CompiledAnswerKey.grade``
+returns exactly what ``ScoringService.grade_attempt`` does.
+"""
+
+from __future__ import annotations
+
+from itertools import repeat
+from numbers import Real
+from typing import Any
+
+import numpy as np
+
+from app.services.scoring_service import JEE_RULES, ScoringService
+
+MCQ_MAIN, NUMERICAL_MAIN, ADV_SINGLE, ADV_MULTIPLE = range(4)
+_TYPE_CODES = {"MCQ_MAIN": MCQ_MAIN, "NUMERICAL_MAIN": NUMERICAL_MAIN, "ADV_SINGLE": ADV_SINGLE, "ADV_MULTIPLE": ADV_MULTIPLE}
+
+# Options 0..61 map to bits; bit 62 marks an answer that can never match a key.
+_MAX_OPTION = 62
+_FOREIGN = 1 << 62
+# Verdicts for questions scored the scalar way, encoded against key 0b11.
+_IRREGULAR_FULL = 0b11
+_IRREGULAR_PARTIAL = 0b10
+# Answer -> bit by dict lookup; equal numbers hash alike, so 2, 2.0 and
+# True/1 resolve exactly as ``==`` does in the scalar scorer.
+_OPTION_BITS: dict[Any, int] = {option: 1 << option for option in range(_MAX_OPTION)}
+_BITS: dict[Any, int] = {None: 0, **_OPTION_BITS}
+_NAN = float("nan")
+
+CORRECT, PARTIAL, WRONG, UNATTEMPTED = "correct", "partial", "wrong", "unattempted"
+
+# How a missed question is classified from its explanation: first match wins.
+_MISTAKE_KEYWORDS = (
+    ("conceptual_errors", "Conceptual Error", ("concept", "formula", "law", "principle", "rule")),
+    ("calculation_errors", "Calculation Error", ("calculate", "formula", "multiply", "divide", "add")),
+)
+_CARELESS = ("careless_mistakes", "Careless Mistake")
+
+
+def _option_bit(value: Any) -> int | None:
+    """Bit for an option index, or None when the value is not a usable index."""
+    if not isinstance(value, Real):
+        return None
+    try:
+        as_float = float(value)
+    except (OverflowError, TypeError, ValueError):
+        return None
+    if as_float.is_integer() and 0 <= as_float < _MAX_OPTION:
+        return 1 << int(as_float)
+    return None
+
+
+def _mistake_type(explanation: Any) -> tuple[str, str]:
+    text = str(explanation or "").lower()
+    for pattern, label, keywords in _MISTAKE_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return pattern, label
+    return _CARELESS
+
+
+def _as_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError, OverflowError):
+        return float("nan")
+
+
+class CompiledAnswerKey:
+    """
+    A question set's answer key compiled once: type codes, marking points,
+    correct-option bitmasks (multi-correct keys included), numeric keys, the
+    maximum score, each question's subject/topic/subtopic and the mistake
+    category its explanation implies. Arrays feed
+    ``BatchScoring``; ``grade`` and ``verdicts`` score a single attempt
+    without re-reading the raw question dicts.
+    """
+
+    def __init__(self, questions: list[dict]) -> None:
+        count = len(questions)
+        self.question_ids = [str(question.get("id")) for question in questions]
+        self.types = np.zeros(count, dtype=np.int8)
+        self.correct_mask = np.zeros(count, dtype=np.int64)
+        self.numeric_key = np.full(count, np.nan)
+        self.points_correct = np.zeros(count, dtype=np.int64)
+        self.points_partial = np.zeros(count, dtype=np.int64)
+        self.points_wrong = np.zeros(count, dtype=np.int64)
+        # Questions whose key cannot be expressed as option bits are compared
+        # with Python equality per answer (see ``encode``).
+        self.irregular: dict[int, dict] = {}
+        self.max_score = ScoringService.max_score(questions)
+        # (subject, topic, subtopic) per question, defaulted as analysis expects.
+        self.topics = [
+            (
+                question.get("subject", "General"),
+                question.get("topic", "General"),
+                question.get("subtopic", "General"),
+            )
+            for question in questions
+        ]
+        # Question counts per topic and "topic::subtopic", with the subject of
+        # each one's first question, in order of appearance.
+        self.subtopic_keys = [f"{topic}::{subtopic}" for _, topic, subtopic in self.topics]
+        self.topic_counts: dict[str, list] = {}
+        self.subtopic_counts: dict[str, list] = {}
+        for (subject, topic, _), subtopic_key in zip(self.topics, self.subtopic_keys):
+            self.topic_counts.setdefault(topic, [subject, 0])[1] += 1
+            self.subtopic_counts.setdefault(subtopic_key, [subject, topic, 0])[2] += 1
+        # (pattern key, label) a miss on each question counts as; see _MISTAKE_KEYWORDS.
+        self.mistake_types = [_mistake_type(question.get("explanation")) for question in questions]
+
+        for index, question in enumerate(questions):
+            qtype = question.get("type", "MCQ_MAIN")
+            if qtype not in JEE_RULES:
+                qtype = "MCQ_MAIN"
+            rules = JEE_RULES[qtype]
+            code = _TYPE_CODES[qtype]
+            self.types[index] = code
+            self.points_correct[index] = rules.get("full_correct", rules.get("correct", 0))
+            self.points_partial[index] = rules.get("partial_correct", 0)
+            self.points_wrong[index] = rules["wrong"]
+
+            correct = question.get("correct")
+            if code == NUMERICAL_MAIN:
+                self.numeric_key[index] = _as_float(correct)
+            elif code == ADV_MULTIPLE:
+                keys = correct if isinstance(correct, list) else ([correct] if correct is not None else [])
+                bits = [_option_bit(key) for key in keys]
+                if not keys or any(bit is None for bit in bits):
+                    self.irregular[index] = question
+                    self.correct_mask[index] = _IRREGULAR_FULL
+                else:
+                    mask = 0
+                    for bit in bits:
+                        mask |= bit
+                    self.correct_mask[index] = mask
+            else:
+                bit = _option_bit(correct)
+                if bit is None:
+                    self.irregular[index] = question
+                    self.correct_mask[index] = _IRREGULAR_FULL
+                else:
+                    self.correct_mask[index] = bit
+
+        # Plain-Python columns for the single-attempt path.
+        self._columns = (
+            self.types.tolist(),
+            self.correct_mask.tolist(),
+            self.numeric_key.tolist(),
+            [self.irregular.get(col) for col in range(count)],
+        )
+        self._points = list(
+            zip(self.points_correct.tolist(), self.points_partial.tolist(), self.points_wrong.tolist())
+        )
+
+    @staticmethod
+    def compile(questions: list[dict]) -> "CompiledAnswerKey":
+        return CompiledAnswerKey(questions)
+
+    def verdicts(self, answers: dict) -> list[str]:
+        """Per question: "correct", "partial", "wrong" or "unattempted"."""
+        verdicts: list[str] = []
+        for question_id, answer, code, key, numeric, irregular in zip(
+            self.question_ids, map(answers.get, self.question_ids), *self._columns
+        ):
+            if answer is None:
+                verdicts.append(UNATTEMPTED)
+                continue
+            if code == NUMERICAL_MAIN:
+                verdicts.append(CORRECT if _as_float(answer) == numeric else WRONG)
+                continue
+            if irregular is not None:
+                mask = CompiledAnswerKey._irregular_verdict(irregular, question_id, answer)
+            elif code == ADV_MULTIPLE:
+                mask = CompiledAnswerKey._multi_mask(answer)
+            else:
+                mask = CompiledAnswerKey._single_mask(answer)
+            if mask == key:
+                verdicts.append(CORRECT)
+            elif code == ADV_MULTIPLE and mask and not mask & ~key:
+                verdicts.append(PARTIAL)
+            else:
+                verdicts.append(WRONG)
+        return verdicts
+
+    def grade(self, answers: dict, verdicts: list[str] | None = None) -> dict:
+        """Fields stored on a submitted attempt; same as ``ScoringService.grade_attempt``."""
+        verdicts = verdicts if verdicts is not None else self.verdicts(answers)
+        raw_score = 0
+        counts = {CORRECT: 0, PARTIAL: 0, WRONG: 0, UNATTEMPTED: 0}
+        for verdict, (points_correct, points_partial, points_wrong) in zip(verdicts, self._points):
+            counts[verdict] += 1
+            if verdict == CORRECT:
+                raw_score += points_correct
+            elif verdict == PARTIAL:
+                raw_score += points_partial
+            elif verdict == WRONG:
+                raw_score += points_wrong
+
+        total_questions = len(self.question_ids)
+        accuracy = (counts[CORRECT] / total_questions) * 100 if total_questions else 0
+        max_possible = self.max_score
+        return {
+            "score": round((raw_score / max_possible * 100), 1) if max_possible > 0 else 0.0,
+            "raw_score": raw_score,
+            "max_score": max_possible,
+            "correct_answers": counts[CORRECT],
+            "incorrect_answers": counts[WRONG],
+            "unattempted": counts[UNATTEMPTED],
+            "partial_correct": counts[PARTIAL],
+            "total_answered": counts[CORRECT] + counts[WRONG] + counts[PARTIAL],
+            "accuracy": round(accuracy, 2),
+        }
+
+    def encode(self, answers_list: list[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Encode answer dicts as ``(attempted, masks, values)`` matrices of shape
+        (len(answers_list), question count), one column at a time. Every
+        attempted choice answer encodes to a non-zero mask, so ``attempted``
+        falls out of ``masks``; numerical columns store a 0/1 flag there.
+        """
+        rows, cols = len(answers_list), len(self.question_ids)
+        masks = np.zeros((rows, cols), dtype=np.int64)
+        values = np.full((rows, cols), np.nan)
+        # Gather row-wise with C-level map/zip, then walk the columns.
+        columns = zip(*(list(map(answers.get, self.question_ids)) for answers in answers_list))
+        for col, (question_id, column) in enumerate(zip(self.question_ids, columns)):
+            code = self.types[col]
+            irregular = self.irregular.get(col)
+            if code == NUMERICAL_MAIN:
+                masks[:, col] = [answer is not None for answer in column]
+                values[:, col] = CompiledAnswerKey._floats(column)
+            elif irregular is not None:
+                masks[:, col] = [
+                    0 if answer is None else CompiledAnswerKey._irregular_verdict(irregular, question_id, answer)
+                    for answer in column
+                ]
+            elif code == ADV_MULTIPLE:
+                masks[:, col] = CompiledAnswerKey._multi_masks(column)
+            else:
+                try:
+                    masks[:, col] = list(map(_BITS.get, column, repeat(_FOREIGN)))
+                except TypeError:
+                    # Unhashable answers (lists, dicts) never equal an option index.
+                    masks[:, col] = [CompiledAnswerKey._single_mask(answer) for answer in column]
+        return masks != 0, masks, values
+
+    @staticmethod
+    def _single_mask(answer: Any) -> int:
+        try:
+            return _BITS.get(answer, _FOREIGN)
+        except TypeError:
+            return _FOREIGN
+
+    @staticmethod
+    def _multi_masks(column: tuple) -> list[int]:
+        # Students pick from a handful of option combinations; encode each
+        # distinct selection once.
+        if tuple in set(map(type, column)):
+            # Tuples would be confused with the list selections keyed below.
+            return list(map(CompiledAnswerKey._multi_mask, column))
+        keys = [tuple(answer) if answer.__class__ is list else answer for answer in column]
+        try:
+            distinct = set(keys)
+        except TypeError:
+            return list(map(CompiledAnswerKey._multi_mask, column))
+        encoded = {
+            key: CompiledAnswerKey._multi_mask(list(key) if key.__class__ is tuple else key) for key in distinct
+        }
+        return list(map(encoded.__getitem__, keys))
+
+    @staticmethod
+    def _multi_mask(answer: Any) -> int:
+        if answer is None:
+            return 0
+        if not isinstance(answer, list):
+            answer = [answer]
+        # An empty selection is attempted but wrong, like a foreign option.
+        mask = 0 if answer else _FOREIGN
+        try:
+            for item in answer:
+                mask |= _OPTION_BITS.get(item, _FOREIGN)
+        except TypeError:
+            return _FOREIGN
+        return mask
+
+    @staticmethod
+    def _floats(column: list) -> list[float]:
+        if all(answer is None or answer.__class__ in (int, float) for answer in column):
+            try:
+                return [_NAN if answer is None else float(answer) for answer in column]
+            except OverflowError:
+                pass
+        return [_NAN if answer is None else _as_float(answer) for answer in column]
+
+    @staticmethod
+    def _irregular_verdict(question: dict, question_id: str, answer: Any) -> int:
+        """Score one answer the scalar way and encode the verdict as a mask."""
+        stats = ScoringService.calculate_jee_score([question], {question_id: answer})["stats"]
+        if stats["correct"]:
+            return _IRREGULAR_FULL
+        return _IRREGULAR_PARTIAL if stats["partial"] else _FOREIGN
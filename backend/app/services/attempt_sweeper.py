@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from app.core.config import get_settings
+from app.services.answer_buffer import AnswerBuffer
+from app.services.answer_key import CompiledAnswerKey
+from app.services.batch_scoring import BatchScoring
+from app.services.post_submit_pipeline import PostSubmitPipeline
+from app.services.question_set_service import QuestionSetService
+
+
+class AttemptSweeper:
+    """
+    Submits attempts whose time ran out without the client calling submit.
+
+    Each in-progress attempt carries ``deadline_at`` (start + duration +
+    ``attempt_grace_seconds``). A sweep claims a batch of expired attempts
+    with one conditional ``update_many`` (tagging them with a sweep token, so
+    a concurrent submit or another sweeper never double-processes one), grades
+    them against their shared question sets, writes every score in one
+    ``bulk_write`` and leaves the post-submit pipeline due for the worker.
+    """
+
+    @staticmethod
+    def deadline(started_at: datetime, duration_minutes: int) -> datetime:
+        grace = max(0, int(get_settings().attempt_grace_seconds))
+        return started_at + timedelta(minutes=max(1, int(duration_minutes or 60)), seconds=grace)
+
+    @staticmethod
+    def sweep(db: Database, *, now: datetime | None = None, limit: int | None = None) -> int:
+        """Auto-submit one batch of expired attempts. Returns how many were submitted."""
+        from app.services.student_service import StudentService
+
+        now = now or datetime.now(timezone.utc)
+        limit = limit or max(1, int(get_settings().attempt_sweep_batch_size))
+        AttemptSweeper._backfill_deadlines(db, limit=limit)
+
+        due_ids = [
+            doc["_id"]
+            for doc in db.test_attempts.find(
+                {"status": "in_progress", "deadline_at": {"$lte": now}}, {"_id": 1}
+            )
+            .sort("deadline_at", 1)
+            .limit(limit)
+        ]
+        if not due_ids:
+            return 0
+
+        token = uuid4().hex
+        db.test_attempts.update_many(
+            {"_id": {"$in": due_ids}, "status": "in_progress"},
+            {
+                "$set": {
+                    "status": "submitted",
+                    "auto_submitted": False,
+                    "expired": True,
+                    "expired_by": token,
+                    "violation_reason": None,
+                    "updated_at": now,
+                    "post_submit": PostSubmitPipeline.initial_state(now),
+                }
+            },
+        )
+        claimed = list(db.test_attempts.find({"expired_by": token}))
+
+        updates_by_id: dict[ObjectId, dict] = {}
+        answers_by_id: dict[ObjectId, dict] = {}
+        for attempt in claimed:
+            # The attempt counts as submitted when its time ran out.
+            deadline_at = attempt.get("deadline_at") or now
+            if deadline_at.tzinfo is None:
+                deadline_at = deadline_at.replace(tzinfo=timezone.utc)
+            attempt["submitted_at"] = min(deadline_at, now)
+            updates: dict = {
+                "submitted_at": attempt["submitted_at"],
+                # Release the pipeline's hold once the score is written.
+                "post_submit.next_run_at": now,
+            }
+            answers = dict(attempt.get("answers") or {})
+            if AnswerBuffer.enabled():
+                buffered = AnswerBuffer.pending(str(attempt["_id"]))
+                answers.update(buffered["answers"])
+                for question_id, value in buffered["answers"].items():
+                    updates[f"answers.{question_id}"] = value
+                for question_id, seconds in buffered["time_spent"].items():
+                    updates[f"time_spent.{question_id}"] = seconds
+
+            updates_by_id[attempt["_id"]] = updates
+            answers_by_id[attempt["_id"]] = answers
+
+        # Attempts of the same test share a question set; grade each group in
+        # one vectorized pass. Without a question set the score stays None and
+        # the pipeline's score step retries once the key is available.
+        groups: dict[str, tuple[CompiledAnswerKey, list[dict]]] = {}
+        for attempt in claimed:
+            question_set = QuestionSetService.for_attempt(db, attempt)
+            if question_set:
+                group_key = str(attempt.get("question_set_id") or attempt["_id"])
+                if group_key not in groups:
+                    key = QuestionSetService.answer_key(db, attempt.get("question_set_id"), question_set)
+                    groups[group_key] = (key, [])
+                groups[group_key][1].append(attempt)
+
+        graded_attempts: list[tuple[dict, dict]] = []
+        for key, attempts in groups.values():
+            answers_list = [answers_by_id[attempt["_id"]] for attempt in attempts]
+            for attempt, graded in zip(attempts, BatchScoring.grade_many(key, answers_list)):
+                updates_by_id[attempt["_id"]].update(graded)
+                updates_by_id[attempt["_id"]]["analysis"] = StudentService._pending_analysis(graded)
+                graded_attempts.append((attempt, graded))
+
+        if updates_by_id:
+            db.test_attempts.bulk_write(
+                [UpdateOne({"_id": attempt_id}, {"$set": updates}) for attempt_id, updates in updates_by_id.items()],
+                ordered=False,
+            )
+        # As on the submit path: year boards and year-filtered progress need
+        # the student's year, so the batch's students are loaded once.
+        student_ids = {str(attempt["student_id"]) for attempt, _ in graded_attempts}
+        student_oids = [ObjectId(student_id) for student_id in student_ids if ObjectId.is_valid(student_id)]
+        years = {
+            str(student["_id"]): student.get("year")
+            for student in db.users.find({"_id": {"$in": student_oids}}, {"year": 1})
+        }
+        for attempt, graded in graded_attempts:
+            StudentService._record_graded(db, attempt, graded, year=years.get(str(attempt["student_id"])))
+        return len(claimed)
+
+    @staticmethod
+    async def run_worker(db: Database) -> None:
+        """Periodically sweep expired attempts; a full batch is followed by another sweep at once."""
+        settings = get_settings()
+        interval = max(1.0, float(settings.attempt_sweep_seconds))
+        while True:
+            try:
+                swept = await asyncio.to_thread(AttemptSweeper.sweep, db)
+            except Exception as exc:
+                print(f"Attempt sweeper error: {exc}")
+                swept = 0
+            if swept < settings.attempt_sweep_batch_size:
+                await asyncio.sleep(interval)
+
+    @staticmethod
+    def _backfill_deadlines(db: Database, *, limit: int) -> None:
+        """Give in-progress attempts started before deadlines existed their ``deadline_at``."""
+        legacy = list(
+            db.test_attempts.find(
+                {"status": "in_progress", "deadline_at": {"$exists": False}},
+                {"test_id": 1, "started_at": 1},
+            ).limit(limit)
+        )
+        if not legacy:
+            return
+        test_oids = list({ObjectId(a["test_id"]) for a in legacy if ObjectId.is_valid(str(a.get("test_id")))})
+        durations = {
+            str(test["_id"]): int(test.get("duration", 60) or 60)
+            for test in db.tests.find({"_id": {"$in": test_oids}}, {"duration": 1})
+        }
+        now = datetime.now(timezone.utc)
+        db.test_attempts.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": attempt["_id"]},
+                    {
+                        "$set": {
+                            "deadline_at": AttemptSweeper.deadline(
+                                attempt.get("started_at") or now,
+                                durations.get(str(attempt.get("test_id")), 60),
+                            )
+                        }
+                    },
+                )
+                for attempt in legacy
+            ],
+            ordered=False,
+        )
@@ -0,0 +1,65 @@
+"""
+Vectorized scoring for many attempts of the same question set.
+
+``BatchScoring.grade_many`` scores N answer dicts against a
+``CompiledAnswerKey`` with NumPy. Results are identical to
+``ScoringService.grade_attempt``; the scalar path stays the reference
+implementation and ``tests/test_scoring.py`` checks the two agree.
+``scripts/benchmark_scoring.py`` measures the speedup.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from app.services.answer_key import ADV_MULTIPLE, NUMERICAL_MAIN, CompiledAnswerKey
+
+
+class BatchScoring:
+    @staticmethod
+    def grade_many(key: CompiledAnswerKey, answers_list: list[dict]) -> list[dict]:
+        """Grade every answer dict against ``key``; same fields as ``ScoringService.grade_attempt``."""
+        if not answers_list:
+            return []
+        attempted, masks, values = key.encode(answers_list)
+        multi = key.types == ADV_MULTIPLE
+        numerical = key.types == NUMERICAL_MAIN
+
+        exact = masks == key.correct_mask
+        full = attempted & np.where(numerical, values == key.numeric_key, exact)
+        partial = (
+            attempted
+            & multi
+            & ~exact
+            & (masks != 0)
+            & ((masks & ~key.correct_mask) == 0)
+        )
+        wrong = attempted & ~full & ~partial
+
+        raw = (full @ key.points_correct + partial @ key.points_partial + wrong @ key.points_wrong).tolist()
+        correct_counts = full.sum(axis=1).tolist()
+        partial_counts = partial.sum(axis=1).tolist()
+        wrong_counts = wrong.sum(axis=1).tolist()
+        unattempted_counts = (~attempted).sum(axis=1).tolist()
+
+        total_questions = len(key.question_ids)
+        max_possible = key.max_score
+        graded: list[dict] = []
+        for raw_score, correct, wrong, partial, unattempted in zip(
+            raw, correct_counts, wrong_counts, partial_counts, unattempted_counts
+        ):
+            accuracy = (correct / total_questions) * 100 if total_questions else 0
+            graded.append(
+                {
+                    "score": round((raw_score / max_possible * 100), 1) if max_possible > 0 else 0.0,
+                    "raw_score": raw_score,
+                    "max_score": max_possible,
+                    "correct_answers": correct,
+                    "incorrect_answers": wrong,
+                    "unattempted": unattempted,
+                    "partial_correct": partial,
+                    "total_answered": correct + wrong + partial,
+                    "accuracy": round(accuracy, 2),
+                }
+            )
+        return graded
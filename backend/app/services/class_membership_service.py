@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+
+class ClassMembershipService:
+    """
+    Keeps each student's class ids denormalized on their user document
+    (``users.class_ids``) so access checks and assigned-test queries need no
+    ``classes`` lookup. ``classes.student_ids`` stays the source of truth:
+    students without the field are backfilled from it on first read, and
+    ``scripts/check_class_membership.py`` reports or repairs drift.
+    """
+
+    @staticmethod
+    def class_ids(db: Database, student: dict) -> list[str]:
+        class_ids = student.get("class_ids")
+        if class_ids is None:
+            class_ids = ClassMembershipService.backfill(db, str(student["_id"]))
+            student["class_ids"] = class_ids
+        return [str(class_id) for class_id in class_ids]
+
+    @staticmethod
+    def class_ids_by_id(db: Database, student_id: str) -> list[str]:
+        user = (
+            db.users.find_one({"_id": ObjectId(student_id)}, {"class_ids": 1})
+            if ObjectId.is_valid(student_id)
+            else None
+        )
+        if user is None:
+            return ClassMembershipService.from_classes(db, student_id)
+        return ClassMembershipService.class_ids(db, user)
+
+    @staticmethod
+    def from_classes(db: Database, student_id: str) -> list[str]:
+        candidate_ids: list[object] = [student_id]
+        if ObjectId.is_valid(student_id):
+            candidate_ids.append(ObjectId(student_id))
+
+        class_docs = db.classes.find(
+            {"student_ids": {"$in": candidate_ids}},
+            {"_id": 1},
+        )
+        return [str(doc["_id"]) for doc in class_docs]
+
+    @staticmethod
+    def backfill(db: Database, student_id: str) -> list[str]:
+        class_ids = ClassMembershipService.from_classes(db, student_id)
+        if ObjectId.is_valid(student_id):
+            db.users.update_one({"_id": ObjectId(student_id)}, {"$set": {"class_ids": class_ids}})
+        return class_ids
+
+    @staticmethod
+    def apply(db: Database, class_id: str, *, added: list[str], removed: list[str]) -> None:
+        """Mirror a class membership change (already written to ``classes``) onto users."""
+        for student_ids, update in (
+            (added, {"$addToSet": {"class_ids": class_id}}),
+            (removed, {"$pull": {"class_ids": class_id}}),
+        ):
+            oids = [ObjectId(student_id) for student_id in student_ids if ObjectId.is_valid(student_id)]
+            if not oids:
+                continue
+            db.users.update_many({"_id": {"$in": oids}, "class_ids": {"$exists": True}}, update)
+            # Users never backfilled get their full list from classes, which
+            # already reflects this change.
+            for user in db.users.find({"_id": {"$in": oids}, "class_ids": {"$exists": False}}, {"_id": 1}):
+                ClassMembershipService.backfill(db, str(user["_id"]))
+
+    @staticmethod
+    def check(db: Database, *, repair: bool = False) -> dict:
+        """
+        Compare ``users.class_ids`` with ``classes.student_ids`` for every
+        student. Returns counts plus the drifted student ids; with ``repair``
+        the expected lists are written back.
+        """
+        expected: dict[str, set[str]] = {}
+        for cls in db.classes.find({}, {"student_ids": 1}):
+            for student_id in cls.get("student_ids") or []:
+                expected.setdefault(str(student_id), set()).add(str(cls["_id"]))
+
+        checked = 0
+        drifted: list[str] = []
+        operations: list[UpdateOne] = []
+        for user in db.users.find({"role": "student"}, {"class_ids": 1}):
+            checked += 1
+            student_id = str(user["_id"])
+            want = expected.get(student_id, set())
+            have = user.get("class_ids")
+            if have is not None and set(map(str, have)) == want:
+                continue
+            drifted.append(student_id)
+            operations.append(UpdateOne({"_id": user["_id"]}, {"$set": {"class_ids": sorted(want)}}))
+
+        if repair and operations:
+            db.users.bulk_write(operations, ordered=False)
+        return {"checked": checked, "drifted": drifted, "repaired": len(operations) if repair else 0}
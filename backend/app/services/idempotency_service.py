@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+from app.core.config import get_settings
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyService:
+    """
+    ``Idempotency-Key`` support for retried mutations.
+
+    The first request with a key claims it in ``idempotency_keys`` together
+    with a fingerprint of the request; once it succeeds its response is stored
+    on the claim. A retry with the same key and fingerprint gets the stored
+    response back without the handler running again, while the same key on a
+    different request is rejected. Failed requests release their claim so the
+    client can retry. Claims expire after ``idempotency_ttl_seconds`` (TTL
+    index in app/db/indexes.py); a claim whose request died mid-flight can be
+    taken over once ``idempotency_lease_seconds`` have passed.
+    """
+
+    @staticmethod
+    def fingerprint(*parts: object) -> str:
+        body = json.dumps(jsonable_encoder(parts), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def record_id(user_id: str, scope: str, key: str) -> str:
+        return f"{user_id}:{scope}:{key}"
+
+    @staticmethod
+    def begin(db: Database, record_id: str, fingerprint: str) -> dict | None:
+        """
+        Claim ``record_id`` for this request. Returns None when the caller
+        should run the handler, or the completed record to replay.
+        """
+        settings = get_settings()
+        for _ in range(2):
+            now = datetime.now(timezone.utc)
+            try:
+                db.idempotency_keys.insert_one(
+                    {
+                        "_id": record_id,
+                        "fingerprint": fingerprint,
+                        "status": "pending",
+                        "response": None,
+                        "created_at": now,
+                        "locked_until": now + timedelta(seconds=settings.idempotency_lease_seconds),
+                        "expires_at": now + timedelta(seconds=settings.idempotency_ttl_seconds),
+                    }
+                )
+                return None
+            except DuplicateKeyError:
+                existing = db.idempotency_keys.find_one({"_id": record_id})
+            if existing is None:
+                # Expired between the insert and the read; claim it afresh.
+                continue
+
+            if existing.get("fingerprint") != fingerprint:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was already used for a different request",
+                )
+            if existing.get("status") == "completed":
+                return existing
+
+            locked_until = existing.get("locked_until")
+            if isinstance(locked_until, datetime) and locked_until.tzinfo is None:
+                locked_until = locked_until.replace(tzinfo=timezone.utc)
+            if locked_until is None or locked_until <= now:
+                # The original request died without finishing; take over its claim.
+                taken = db.idempotency_keys.update_one(
+                    {"_id": record_id, "status": "pending", "locked_until": existing.get("locked_until")},
+                    {"$set": {"locked_until": now + timedelta(seconds=settings.idempotency_lease_seconds)}},
+                )
+                if taken.modified_count:
+                    return None
+            break
+
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress",
+        )
+
+    @staticmethod
+    def complete(db: Database, record_id: str, response: object) -> None:
+        db.idempotency_keys.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "completed", "response": jsonable_encoder(response), "locked_until": None}},
+        )
+
+    @staticmethod
+    def release(db: Database, record_id: str) -> None:
+        db.idempotency_keys.delete_one({"_id": record_id, "status": "pending"})
+
+    @staticmethod
+    async def run(
+        db: Database,
+        *,
+        user_id: str,
+        scope: str,
+        key: str | None,
+        fingerprint: str,
+        call: Callable[[], Awaitable[object]],
+        response: Response | None = None,
+    ) -> object:
+        """Run ``call`` once per key; retries get the stored (JSON-encoded) response."""
+        if key is None:
+            return await call()
+
+        record_id = IdempotencyService.record_id(user_id, scope, key)
+        existing = IdempotencyService.begin(db, record_id, fingerprint)
+        if existing is not None:
+            if response is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+            return existing["response"]
+
+        try:
+            result = await call()
+        except BaseException:
+            IdempotencyService.release(db, record_id)
+            raise
+        IdempotencyService.complete(db, record_id, result)
+        return result
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime, timezone
+
+from pymongo.database import Database
+
+from app.services.answer_key import ADV_MULTIPLE, CORRECT, NUMERICAL_MAIN, UNATTEMPTED, CompiledAnswerKey
+from app.services.question_set_service import QuestionSetService
+
+# Upper edges (seconds) of the time-spent histogram; the last bucket is open.
+TIME_BUCKETS = (10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+
+class ItemStatsService:
+    """
+    Per-question statistics for a test (``test_item_stats``, one document per
+    test keyed by test id).
+
+    Each scored submission adds ``$inc`` counters: per question the verdict
+    counts, the option picks, a time-spent histogram and the sum of the scores
+    of students who got it right, plus test-wide score sums. That is enough to
+    derive the p-value, the point-biserial discrimination index, the option
+    distribution and an interpolated median time, so the teacher's view is a
+    single document read. ``rebuild`` recomputes the document from attempts
+    (after a rescore, which changes verdicts).
+    """
+
+    @staticmethod
+    def record(db: Database, attempt: dict, key: CompiledAnswerKey) -> bool:
+        """Add one scored attempt to its test's counters, at most once. Returns whether it was added."""
+        now = datetime.now(timezone.utc)
+        claimed = db.test_attempts.update_one(
+            {"_id": attempt["_id"], "item_stats_at": None},
+            {"$set": {"item_stats_at": now}},
+        )
+        if not claimed.modified_count:
+            return False
+        db.test_item_stats.update_one(
+            {"_id": str(attempt["test_id"])},
+            {
+                "$inc": ItemStatsService.increments(attempt, key),
+                "$set": {"question_set_id": attempt.get("question_set_id"), "updated_at": now},
+            },
+            upsert=True,
+        )
+        return True
+
+    @staticmethod
+    def increments(attempt: dict, key: CompiledAnswerKey) -> dict[str, float]:
+        """The ``$inc`` document one attempt contributes."""
+        answers = dict(attempt.get("answers") or {})
+        time_spent = dict(attempt.get("time_spent") or {})
+        score = float(attempt.get("score") or 0.0)
+        inc: dict[str, float] = {"attempts": 1, "score_sum": score, "score_sq_sum": score * score}
+        for col, (question_id, verdict) in enumerate(zip(key.question_ids, key.verdicts(answers))):
+            prefix = f"items.{ItemStatsService._field(question_id)}"
+            inc[f"{prefix}.{verdict}"] = 1
+            if verdict == CORRECT:
+                inc[f"{prefix}.correct_score_sum"] = score
+            if verdict != UNATTEMPTED and key.types[col] != NUMERICAL_MAIN:
+                answer = answers.get(question_id)
+                picks = answer if key.types[col] == ADV_MULTIPLE and isinstance(answer, list) else [answer]
+                for option in picks:
+                    if isinstance(option, int) and not isinstance(option, bool) and option >= 0:
+                        inc[f"{prefix}.options.{option}"] = 1
+            seconds = time_spent.get(question_id)
+            if isinstance(seconds, int) and seconds > 0:
+                inc[f"{prefix}.time.{ItemStatsService._time_bucket(seconds)}"] = 1
+        return inc
+
+    @staticmethod
+    def rebuild(db: Database, test_id: str, question_set_id: str) -> int:
+        """Recompute a test's counters against one question set. Returns how many attempts were counted."""
+        key = QuestionSetService.answer_key(db, question_set_id)
+        now = datetime.now(timezone.utc)
+        totals: dict[str, float] = {}
+        counted = []
+        for attempt in db.test_attempts.find(
+            {"test_id": test_id, "status": "submitted", "score": {"$ne": None}},
+            {"test_id": 1, "answers": 1, "time_spent": 1, "score": 1},
+        ):
+            for field, value in ItemStatsService.increments(attempt, key).items():
+                totals[field] = totals.get(field, 0) + value
+            counted.append(attempt["_id"])
+
+        doc: dict = {"_id": test_id, "question_set_id": question_set_id, "updated_at": now}
+        for field, value in totals.items():
+            target = doc
+            *parents, leaf = field.split(".")
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = value
+        db.test_item_stats.replace_one({"_id": test_id}, doc, upsert=True)
+        # Counted here; their pipeline step must not add them again.
+        db.test_attempts.update_many({"_id": {"$in": counted}}, {"$set": {"item_stats_at": now}})
+        return len(counted)
+
+    @staticmethod
+    def analysis(db: Database, test_id: str, question_set: list[dict]) -> dict:
+        stats = db.test_item_stats.find_one({"_id": test_id}) or {}
+        attempts = int(stats.get("attempts") or 0)
+        score_sum = float(stats.get("score_sum") or 0.0)
+        mean = score_sum / attempts if attempts else 0.0
+        variance = float(stats.get("score_sq_sum") or 0.0) / attempts - mean * mean if attempts else 0.0
+        std = math.sqrt(variance) if variance > 0 else 0.0
+
+        items = []
+        for index, question in enumerate(question_set, start=1):
+            question_id = str(question.get("id") or f"q{index}")
+            item = (stats.get("items") or {}).get(ItemStatsService._field(question_id)) or {}
+            correct = int(item.get("correct") or 0)
+            p_value = correct / attempts if attempts else None
+            options = item.get("options") or {}
+            items.append(
+                {
+                    "question_id": question_id,
+                    "topic": question.get("topic") or "General",
+                    "correct": correct,
+                    "partial": int(item.get("partial") or 0),
+                    "wrong": int(item.get("wrong") or 0),
+                    "unattempted": int(item.get("unattempted") or 0),
+                    "p_value": round(p_value, 4) if p_value is not None else None,
+                    "difficulty": ItemStatsService._difficulty(p_value),
+                    "discrimination": ItemStatsService._point_biserial(
+                        attempts, correct, float(item.get("correct_score_sum") or 0.0), score_sum, std
+                    ),
+                    "option_distribution": [
+                        int(options.get(str(option)) or 0) for option in range(len(question.get("options") or []))
+                    ],
+                    "median_time_seconds": ItemStatsService._median_time(item.get("time") or {}),
+                }
+            )
+        return {
+            "test_id": test_id,
+            "attempts": attempts,
+            "mean_score": round(mean, 2),
+            "items": items,
+        }
+
+    @staticmethod
+    def _point_biserial(attempts: int, correct: int, correct_score_sum: float, score_sum: float, std: float) -> float | None:
+        """Correlation between getting the item right and the total score (-1..1)."""
+        if not std or not 0 < correct < attempts:
+            return None
+        mean_correct = correct_score_sum / correct
+        mean_other = (score_sum - correct_score_sum) / (attempts - correct)
+        p = correct / attempts
+        return round((mean_correct - mean_other) / std * math.sqrt(p * (1 - p)), 4)
+
+    @staticmethod
+    def _difficulty(p_value: float | None) -> str | None:
+        if p_value is None:
+            return None
+        if p_value >= 0.7:
+            return "Easy"
+        if p_value <= 0.3:
+            return "Hard"
+        return "Medium"
+
+    @staticmethod
+    def _median_time(histogram: dict) -> float | None:
+        counts = [int(histogram.get(str(bucket)) or 0) for bucket in range(len(TIME_BUCKETS) + 1)]
+        total = sum(counts)
+        if not total:
+            return None
+        half = total / 2
+        seen = 0
+        for bucket, count in enumerate(counts):
+            if count and seen + count >= half:
+                lower = TIME_BUCKETS[bucket - 1] if bucket else 0
+                if bucket == len(TIME_BUCKETS):
+                    return float(lower)
+                # Interpolate within the bucket.
+                return round(lower + (half - seen) / count * (TIME_BUCKETS[bucket] - lower), 1)
+            seen += count
+        return None
+
+    @staticmethod
+    def _time_bucket(seconds: int) -> int:
+        for bucket, edge in enumerate(TIME_BUCKETS):
+            if seconds < edge:
+                return bucket
+        return len(TIME_BUCKETS)
+
+    @staticmethod
+    def _field(question_id: str) -> str:
+        # Field names cannot contain dots or start with '$'.
+        return question_id.replace(".", "_").lstrip("$") or "_"
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo.database import Database
+
+from app.core.cache import get_redis
+from app.services.class_membership_service import ClassMembershipService
+
+_GLOBAL_KEY = "leaderboard:global"
+_SEEDED_KEY = "leaderboard:seeded"
+
+
+class LeaderboardService:
+    """
+    Rank boards over each student's average score.
+
+    With Redis configured, every board is a sorted set (member = student id,
+    score = average) updated when a submission changes the average, so a
+    position is ``ZSCORE`` + ``ZCOUNT`` + ``ZCARD`` (all O(log n)). Without
+    Redis the same answers come from indexed counts over ``student_stats``.
+    Boards: ``global``, ``year`` (the student's JEE year) and ``class``.
+    Only students with at least one submitted test are ranked.
+    """
+
+    @staticmethod
+    def record(db: Database, student_id: str, avg_score: float, *, year: str | None = None) -> None:
+        """Apply a student's new average to every board they belong to."""
+        client = get_redis()
+        if not client:
+            return
+        if not client.exists(_SEEDED_KEY):
+            # Boards were never seeded (or Redis was flushed): seed from stats,
+            # which already include this student's new average.
+            LeaderboardService.rebuild(db)
+            return
+
+        if year is None:
+            year = (db.student_stats.find_one({"_id": student_id}, {"year": 1}) or {}).get("year")
+        pipe = client.pipeline(transaction=False)
+        for key in LeaderboardService._student_keys(
+            year, ClassMembershipService.class_ids_by_id(db, student_id)
+        ):
+            pipe.zadd(key, {student_id: float(avg_score)})
+        pipe.execute()
+
+    @staticmethod
+    def sync_class(db: Database, class_id: str, *, added: list[str], removed: list[str]) -> None:
+        """Reflect class membership changes on the class board."""
+        client = get_redis()
+        if not client or not client.exists(_SEEDED_KEY):
+            return
+        key = LeaderboardService._class_key(class_id)
+        pipe = client.pipeline(transaction=False)
+        if removed:
+            pipe.zrem(key, *removed)
+        if added:
+            for stats in db.student_stats.find(
+                {"_id": {"$in": added}, "completed_tests": {"$gt": 0}}, {"avg_score": 1}
+            ):
+                pipe.zadd(key, {str(stats["_id"]): float(stats.get("avg_score") or 0.0)})
+        pipe.execute()
+
+    @staticmethod
+    def position(
+        db: Database,
+        student: dict,
+        *,
+        scope: str = "global",
+        class_id: str | None = None,
+    ) -> dict:
+        """Return the student's rank, the board size and their percentile on one board."""
+        student_id = str(student["_id"])
+        key, query = LeaderboardService._board(db, student, scope, class_id)
+
+        client = get_redis()
+        if client and LeaderboardService._ensure_seeded(db, client):
+            pipe = client.pipeline(transaction=False)
+            pipe.zscore(key, student_id)
+            pipe.zcard(key)
+            my_score, total = pipe.execute()
+            avg_score = float(my_score) if my_score is not None else None
+            higher = client.zcount(key, f"({avg_score}", "+inf") if avg_score is not None else 0
+        else:
+            total = db.student_stats.count_documents(query)
+            stats = db.student_stats.find_one(
+                {"_id": student_id, "completed_tests": {"$gt": 0}}, {"avg_score": 1}
+            )
+            avg_score = float(stats.get("avg_score") or 0.0) if stats else None
+            higher = (
+                db.student_stats.count_documents({**query, "avg_score": {"$gt": avg_score}})
+                if avg_score is not None
+                else 0
+            )
+
+        total = int(total or 0)
+        if avg_score is None or not total:
+            return {"rank": None, "total": total, "percentile": None, "avg_score": 0.0}
+        rank = int(higher) + 1
+        return {
+            "rank": rank,
+            "total": total,
+            # Share of ranked students placed below this one.
+            "percentile": round((total - rank) / total * 100, 1),
+            "avg_score": round(avg_score, 1),
+        }
+
+    @staticmethod
+    def top(
+        db: Database,
+        student: dict,
+        *,
+        scope: str = "global",
+        class_id: str | None = None,
+        limit: int = 10,
+    ) -> list[dict]:
+        key, query = LeaderboardService._board(db, student, scope, class_id)
+
+        client = get_redis()
+        if client and LeaderboardService._ensure_seeded(db, client):
+            rows = [
+                (str(member), float(score))
+                for member, score in client.zrevrange(key, 0, limit - 1, withscores=True)
+            ]
+        else:
+            rows = [
+                (str(stats["_id"]), float(stats.get("avg_score") or 0.0))
+                for stats in db.student_stats.find(query, {"avg_score": 1})
+                .sort([("avg_score", -1), ("_id", 1)])
+                .limit(limit)
+            ]
+
+        oids = [ObjectId(student_id) for student_id, _ in rows if ObjectId.is_valid(student_id)]
+        names = {
+            str(user["_id"]): user.get("name") or "Student"
+            for user in db.users.find({"_id": {"$in": oids}}, {"name": 1})
+        }
+
+        entries: list[dict] = []
+        for index, (student_id, score) in enumerate(rows):
+            # Competition ranking: ties share the better rank.
+            rank = entries[-1]["rank"] if entries and score == rows[index - 1][1] else index + 1
+            entries.append(
+                {
+                    "rank": rank,
+                    "student_id": student_id,
+                    "name": names.get(student_id, "Student"),
+                    "avg_score": round(score, 1),
+                    "is_me": student_id == str(student["_id"]),
+                }
+            )
+        return entries
+
+    @staticmethod
+    def rebuild(db: Database) -> int:
+        """Reload every Redis board from ``student_stats``. Returns the ranked student count."""
+        client = get_redis()
+        if not client:
+            return 0
+
+        averages: dict[str, float] = {}
+        boards: dict[str, dict[str, float]] = {_GLOBAL_KEY: {}}
+        for stats in db.student_stats.find(
+            {"completed_tests": {"$gt": 0}}, {"avg_score": 1, "year": 1}
+        ):
+            student_id = str(stats["_id"])
+            averages[student_id] = float(stats.get("avg_score") or 0.0)
+            for key in LeaderboardService._student_keys(stats.get("year"), []):
+                boards.setdefault(key, {})[student_id] = averages[student_id]
+        for cls in db.classes.find({}, {"student_ids": 1}):
+            key = LeaderboardService._class_key(str(cls["_id"]))
+            for student_id in cls.get("student_ids") or []:
+                if str(student_id) in averages:
+                    boards.setdefault(key, {})[str(student_id)] = averages[str(student_id)]
+
+        stale = [
+            key
+            for key in client.scan_iter(match="leaderboard:*")
+            if key not in boards and key != _SEEDED_KEY
+        ]
+        pipe = client.pipeline(transaction=True)
+        if stale:
+            pipe.delete(*stale)
+        for key, members in boards.items():
+            pipe.delete(key)
+            if members:
+                pipe.zadd(key, members)
+        pipe.set(_SEEDED_KEY, "1")
+        pipe.execute()
+        return len(averages)
+
+    @staticmethod
+    def _ensure_seeded(db: Database, client) -> bool:
+        try:
+            if not client.exists(_SEEDED_KEY):
+                LeaderboardService.rebuild(db)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _board(db: Database, student: dict, scope: str, class_id: str | None) -> tuple[str, dict]:
+        """Resolve a board to its Redis key and the equivalent ``student_stats`` filter."""
+        query: dict = {"completed_tests": {"$gt": 0}}
+        if scope == "global":
+            return _GLOBAL_KEY, query
+        if scope == "year":
+            query["year"] = student.get("year")
+            return f"leaderboard:year:{student.get('year')}", query
+        if scope != "class":
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown leaderboard scope")
+
+        class_ids = ClassMembershipService.class_ids(db, student)
+        class_id = class_id or (class_ids[0] if class_ids else None)
+        if not class_id or class_id not in class_ids:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Class not found")
+        cls = db.classes.find_one({"_id": ObjectId(class_id)}, {"student_ids": 1}) or {}
+        query["_id"] = {"$in": [str(student_id) for student_id in cls.get("student_ids") or []]}
+        return LeaderboardService._class_key(class_id), query
+
+    @staticmethod
+    def _student_keys(year: object, class_ids: list[str]) -> list[str]:
+        keys = [_GLOBAL_KEY]
+        if year:
+            keys.append(f"leaderboard:year:{year}")
+        keys.extend(LeaderboardService._class_key(class_id) for class_id in class_ids)
+        return keys
+
+    @staticmethod
+    def _class_key(class_id: str) -> str:
+        return f"leaderboard:class:{class_id}"
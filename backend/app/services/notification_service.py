@@ -4,6 +4,8 @@ from datetime import datetime, timezone
 
 from pymongo.database import Database
 
+from app.services.version_service import VersionService
+
 
 class NotificationService:
     @staticmethod
@@ -14,7 +16,9 @@ class NotificationService:
         title: str,
         message: str,
         notification_type: str,
+        dedupe_key: str | None = None,
     ) -> None:
+        """Notify one user. With ``dedupe_key`` a repeated call (e.g. a retried job step) is a no-op."""
         doc = {
             "user_id": user_id,
             "title": title,
@@ -23,8 +27,16 @@ class NotificationService:
             "read": False,
             "created_at": datetime.now(timezone.utc),
         }
+        doc["updated_at"] = doc["created_at"]
         try:
-            db.notifications.insert_one(doc)
+            if dedupe_key is None:
+                db.notifications.insert_one(doc)
+            else:
+                doc["dedupe_key"] = dedupe_key
+                result = db.notifications.update_one({"dedupe_key": dedupe_key}, {"$setOnInsert": doc}, upsert=True)
+                if result.upserted_id is None:
+                    return
+            VersionService.bump(db, VersionService.notifications(user_id))
         except Exception:
             # Notifications are non-blocking.
             return
@@ -50,10 +62,12 @@ class NotificationService:
                 "type": notification_type,
                 "read": False,
                 "created_at": now,
+                "updated_at": now,
             }
             for user_id in user_ids
         ]
         try:
             db.notifications.insert_many(docs)
+            VersionService.bump(db, *(VersionService.notifications(user_id) for user_id in user_ids))
         except Exception:
             return
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+
+from fastapi import HTTPException, status
+from pymongo.database import Database
+
+from app.core.config import get_settings
+from app.services.answer_buffer import AnswerBuffer
+from app.services.question_set_service import QuestionSetService
+from app.utils.mongo import parse_object_id
+
+
+class OfflineAttemptService:
+    """
+    Offline mode for in-progress attempts.
+
+    ``package`` returns everything the app needs to sit the attempt without a
+    connection: public questions, saved answers, the deadline and an HMAC
+    signature binding them to this student, attempt and question set.
+    ``replay`` then applies the answer/time events recorded offline in one
+    conditional write. Events carry a per-attempt sequence number and the
+    attempt stores the last one applied (``event_seq``), so a batch that is
+    re-sent after a dropped response is a no-op.
+    """
+
+    @staticmethod
+    def package(db: Database, student: dict, attempt_id: str) -> dict:
+        from app.services.student_service import StudentService
+
+        student_id = str(student["_id"])
+        attempt_oid = parse_object_id(attempt_id, "attempt_id")
+        attempt = StudentService._get_in_progress_attempt(db, student_id, attempt_oid)
+        question_set = OfflineAttemptService._question_set(db, attempt)
+
+        answers = dict(attempt.get("answers") or {})
+        time_spent = dict(attempt.get("time_spent") or {})
+        if AnswerBuffer.enabled():
+            buffered = AnswerBuffer.pending(attempt_id)
+            answers.update(buffered["answers"])
+            time_spent.update(buffered["time_spent"])
+
+        test = StudentService._find_test_by_id(db, str(attempt.get("test_id") or "")) or {}
+        question_ids = [str(question.get("id") or f"q{index}") for index, question in enumerate(question_set, start=1)]
+        deadline_at = OfflineAttemptService._as_utc(attempt.get("deadline_at"))
+        return {
+            "attempt_id": attempt_id,
+            "test_id": str(attempt.get("test_id") or ""),
+            "title": test.get("title"),
+            "subject": attempt.get("subject") or test.get("subject") or "General",
+            "duration": int(test.get("duration", 60) or 60),
+            "started_at": attempt["started_at"],
+            "deadline_at": deadline_at,
+            "server_time": datetime.now(timezone.utc),
+            "questions": QuestionSetService.public_view(db, attempt.get("question_set_id"), question_set)["questions"],
+            "answers": answers,
+            "time_spent": time_spent,
+            "last_seq": int(attempt.get("event_seq") or 0),
+            "signature": OfflineAttemptService.sign(
+                attempt_id, student_id, str(attempt.get("question_set_id") or ""), question_ids, deadline_at
+            ),
+        }
+
+    @staticmethod
+    def replay(
+        db: Database,
+        student: dict,
+        attempt_id: str,
+        events: list[dict],
+        *,
+        signature: str | None = None,
+    ) -> dict:
+        from app.services.student_service import StudentService
+
+        student_id = str(student["_id"])
+        attempt_oid = parse_object_id(attempt_id, "attempt_id")
+        attempt = StudentService._get_in_progress_attempt(db, student_id, attempt_oid)
+        question_set = OfflineAttemptService._question_set(db, attempt)
+        question_ids = [str(question.get("id") or f"q{index}") for index, question in enumerate(question_set, start=1)]
+
+        if signature is not None:
+            expected = OfflineAttemptService.sign(
+                attempt_id,
+                student_id,
+                str(attempt.get("question_set_id") or ""),
+                question_ids,
+                OfflineAttemptService._as_utc(attempt.get("deadline_at")),
+            )
+            if not hmac.compare_digest(signature, expected):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Attempt package is stale; download it again",
+                )
+
+        last_seq = attempt.get("event_seq")
+        applied_seq = int(last_seq or 0)
+        known = set(question_ids)
+        answers: dict[str, int | None] = {}
+        time_spent: dict[str, int] = {}
+        applied = 0
+        for event in sorted(events, key=lambda item: item["seq"]):
+            if event["seq"] <= applied_seq:
+                continue
+            question_id = str(event["question_id"])
+            if question_id not in known:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Unknown question '{question_id}' in event {event['seq']}",
+                )
+            if event["type"] == "answer":
+                answers[question_id] = StudentService._normalize_answer(event.get("value"))
+            elif isinstance(event.get("seconds"), int) and event["seconds"] >= 0:
+                time_spent[question_id] = event["seconds"]
+            applied_seq = event["seq"]
+            applied += 1
+
+        if applied:
+            updates: dict = {
+                "event_seq": applied_seq,
+                "updated_at": datetime.now(timezone.utc),
+                **{f"answers.{question_id}": value for question_id, value in answers.items()},
+                **{f"time_spent.{question_id}": seconds for question_id, seconds in time_spent.items()},
+            }
+            # Conditional on the sequence we read: a concurrent replay of the
+            # same batch loses here instead of applying the events twice.
+            result = db.test_attempts.update_one(
+                {"_id": attempt_oid, "status": "in_progress", "event_seq": last_seq},
+                {"$set": updates},
+            )
+            if not result.modified_count:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Attempt changed while replaying events; retry",
+                )
+            if AnswerBuffer.enabled() and AnswerBuffer.owner(attempt_id) is not None:
+                # Keep the write-behind copy in step so its next flush does
+                # not restore older answers.
+                AnswerBuffer.record(attempt_id, answers, time_spent)
+
+        saved = dict(attempt.get("answers") or {})
+        if AnswerBuffer.enabled():
+            saved.update(AnswerBuffer.pending(attempt_id)["answers"])
+        saved.update(answers)
+        return {
+            "attempt_id": attempt_id,
+            "applied": applied,
+            "skipped": len(events) - applied,
+            "last_seq": applied_seq,
+            "saved_answers": len([value for value in saved.values() if value is not None]),
+        }
+
+    @staticmethod
+    def sign(
+        attempt_id: str,
+        student_id: str,
+        question_set_id: str,
+        question_ids: list[str],
+        deadline_at: datetime | None,
+    ) -> str:
+        body = json.dumps(
+            [
+                attempt_id,
+                student_id,
+                question_set_id,
+                question_ids,
+                deadline_at.isoformat() if deadline_at else None,
+            ],
+            separators=(",", ":"),
+        )
+        key = get_settings().jwt_secret_key.encode("utf-8")
+        return hmac.new(key, body.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _question_set(db: Database, attempt: dict) -> list[dict]:
+        question_set = QuestionSetService.for_attempt(db, attempt)
+        if not question_set:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Test questions are not ready",
+            )
+        return question_set
+
+    @staticmethod
+    def _as_utc(value: object) -> datetime | None:
+        if not isinstance(value, datetime):
+            return None
+        # Drop sub-millisecond precision so the signature survives a BSON round trip.
+        value = value.replace(microsecond=value.microsecond // 1000 * 1000)
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
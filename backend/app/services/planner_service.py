@@ -4,6 +4,7 @@ import re
 from typing import Any
 from pymongo.database import Database
 from app.services.ai_service import call_openai
+from app.services.topic_stats_service import TopicStatsService
 from app.utils.mongo import parse_object_id, serialize_id
 
 class PlannerService:
@@ -25,7 +26,13 @@ class PlannerService:
         days_left = (target_date - now).days
         if days_left <= 0:
             days_left = 30 # Default to 1 month if target date is passed or too close
-            
+
+        # Weakest topics across all submitted tests, from the per-student counters.
+        weak_topics = TopicStatsService.weak_topics(db, student_id)["weak_topics"]
+        focus = ", ".join(
+            f"{entry['subject']} - {entry['topic']} ({entry['accuracy']:.0f}% accuracy)" for entry in weak_topics
+        )
+
         prompt = (
             f"Generate a highly detailed JEE study plan for a {year} student.\n"
             f"Daily Availability: {availability_hours} hours.\n"
@@ -37,7 +44,9 @@ class PlannerService:
             "- Mix subjects daily (e.g., Physics + Math on Day 1, Chemistry + Physics on Day 2).\n"
             "- Include 'Revision' slots and 'Mock Test' slots periodically.\n"
             "- Ensure the total duration per day roughly matches availability.\n"
-            "- CRITICAL: Break down large chapters into specific daily tasks.\n\n"
+            "- CRITICAL: Break down large chapters into specific daily tasks.\n"
+            + (f"- Give extra study and revision slots to these weak areas from past tests: {focus}.\n" if focus else "")
+            + "\n"
             "Return a JSON object with a 'tasks' key containing a list of tasks. Each task must have:\n"
             "- 'title': Chapter name\n"
             "- 'subject': 'Physics', 'Chemistry', or 'Mathematics'\n"
@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.database import Database
+
+from app.core.config import get_settings
+from app.services.activity_service import ActivityService
+from app.services.analysis_service import AnalysisService
+from app.services.answer_key import CORRECT
+from app.services.item_stats_service import ItemStatsService
+from app.services.leaderboard_service import LeaderboardService
+from app.services.notification_service import NotificationService
+from app.services.question_set_service import QuestionSetService
+from app.services.student_stats_service import StudentStatsService
+from app.services.test_inbox_service import TestInboxService
+from app.services.topic_stats_service import TopicStatsService
+from app.utils.mongo import parse_object_id
+
+# Order matters: later steps rely on the score and analysis being stored.
+STEPS = ("score", "item_stats", "topic_stats", "analysis", "activity", "notify_student", "notify_teacher")
+
+
+class PostSubmitPipeline:
+    """
+    Durable follow-up work for a submitted attempt.
+
+    Job state lives on the attempt itself under ``post_submit`` and is written
+    in the same update that marks the attempt submitted, so a crash between
+    responding and running the steps never loses the job. Completed steps are
+    recorded individually; a retry resumes at the first unfinished step.
+    """
+
+    @staticmethod
+    def initial_state(now: datetime) -> dict:
+        """
+        Job state written with the submit transition. The first run is held
+        back by one lease so the worker does not score the attempt while the
+        submitting request is still grading it; that request releases the
+        hold (``next_run_at``) once the score is stored, and a request that
+        dies midway is recovered when the hold expires.
+        """
+        return {
+            "status": "pending",
+            "attempts": 0,
+            "done": [],
+            "last_error": None,
+            "next_run_at": now + timedelta(seconds=get_settings().post_submit_lease_seconds),
+            "lease_until": None,
+            "updated_at": now,
+        }
+
+    @staticmethod
+    async def process(db: Database, attempt_id: str) -> str | None:
+        """Run the unfinished steps for one attempt. Returns the resulting status, or None if not claimable."""
+        settings = get_settings()
+        now = datetime.now(timezone.utc)
+        attempt = db.test_attempts.find_one_and_update(
+            {"_id": parse_object_id(attempt_id, "attempt_id"), **PostSubmitPipeline._due_filter(now)},
+            {
+                "$set": {
+                    "post_submit.status": "running",
+                    "post_submit.lease_until": now + timedelta(seconds=settings.post_submit_lease_seconds),
+                    "post_submit.updated_at": now,
+                },
+                "$inc": {"post_submit.attempts": 1},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        if not attempt:
+            return None
+
+        state = attempt["post_submit"]
+        done = set(state.get("done") or [])
+        try:
+            for step in STEPS:
+                if step in done:
+                    continue
+                await PostSubmitPipeline._run_step(db, step, attempt)
+                # Renew the lease after each step so a slow one (the AI
+                # analysis) does not hand the rest to another worker.
+                db.test_attempts.update_one(
+                    {"_id": attempt["_id"]},
+                    {
+                        "$addToSet": {"post_submit.done": step},
+                        "$set": {
+                            "post_submit.lease_until": datetime.now(timezone.utc)
+                            + timedelta(seconds=settings.post_submit_lease_seconds)
+                        },
+                    },
+                )
+        except Exception as exc:
+            failed_at = datetime.now(timezone.utc)
+            attempts = int(state.get("attempts") or 1)
+            exhausted = attempts >= settings.post_submit_max_attempts
+            delay = settings.post_submit_retry_base_seconds * (2 ** (attempts - 1))
+            db.test_attempts.update_one(
+                {"_id": attempt["_id"]},
+                {
+                    "$set": {
+                        "post_submit.status": "failed" if exhausted else "pending",
+                        "post_submit.last_error": f"{type(exc).__name__}: {exc}"[:500],
+                        "post_submit.next_run_at": failed_at + timedelta(seconds=delay),
+                        "post_submit.lease_until": None,
+                        "post_submit.updated_at": failed_at,
+                    }
+                },
+            )
+            print(f"Post-submit pipeline failed for attempt {attempt_id} (try {attempts}): {exc}")
+            return "failed" if exhausted else "pending"
+
+        finished_at = datetime.now(timezone.utc)
+        db.test_attempts.update_one(
+            {"_id": attempt["_id"]},
+            {
+                "$set": {
+                    "post_submit.status": "done",
+                    "post_submit.last_error": None,
+                    "post_submit.lease_until": None,
+                    "post_submit.updated_at": finished_at,
+                }
+            },
+        )
+        return "done"
+
+    @staticmethod
+    async def run_due(db: Database, *, limit: int = 100) -> int:
+        """Process attempts whose pipeline is due for a (re)try. Returns how many were picked up."""
+        now = datetime.now(timezone.utc)
+        due = list(
+            db.test_attempts.find(PostSubmitPipeline._due_filter(now), {"_id": 1})
+            .sort("post_submit.next_run_at", 1)
+            .limit(limit)
+        )
+        for doc in due:
+            await PostSubmitPipeline.process(db, str(doc["_id"]))
+        return len(due)
+
+    @staticmethod
+    async def run_worker(db: Database) -> None:
+        """Periodically retry pipelines that failed or were orphaned by a restart."""
+        interval = max(1.0, float(get_settings().post_submit_poll_seconds))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await PostSubmitPipeline.run_due(db)
+            except Exception as exc:
+                print(f"Post-submit worker error: {exc}")
+
+    @staticmethod
+    def status_summary(db: Database, *, failure_limit: int = 20) -> dict:
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        for row in db.test_attempts.aggregate(
+            [
+                {"$match": {"post_submit.status": {"$in": list(counts)}}},
+                {"$group": {"_id": "$post_submit.status", "count": {"$sum": 1}}},
+            ]
+        ):
+            counts[str(row["_id"])] = int(row["count"])
+
+        failures = [
+            {
+                "attempt_id": str(doc["_id"]),
+                "student_id": doc.get("student_id"),
+                "attempts": int(doc["post_submit"].get("attempts") or 0),
+                "done": list(doc["post_submit"].get("done") or []),
+                "last_error": doc["post_submit"].get("last_error"),
+                "updated_at": doc["post_submit"].get("updated_at"),
+            }
+            for doc in db.test_attempts.find(
+                {"post_submit.status": "failed"},
+                {"student_id": 1, "post_submit": 1},
+            )
+            .sort("post_submit.updated_at", -1)
+            .limit(failure_limit)
+        ]
+        return {"counts": counts, "failures": failures}
+
+    @staticmethod
+    def retry(db: Database, attempt_id: str) -> bool:
+        """Re-queue a failed pipeline immediately, keeping the steps it already finished."""
+        now = datetime.now(timezone.utc)
+        result = db.test_attempts.update_one(
+            {"_id": parse_object_id(attempt_id, "attempt_id"), "post_submit.status": "failed"},
+            {
+                "$set": {
+                    "post_submit.status": "pending",
+                    "post_submit.attempts": 0,
+                    "post_submit.next_run_at": now,
+                    "post_submit.updated_at": now,
+                }
+            },
+        )
+        return result.modified_count == 1
+
+    @staticmethod
+    def rerun_analysis(attempt: dict, now: datetime) -> dict:
+        """
+        Update operators that re-queue only the analysis step of a finished
+        attempt, e.g. after a rescore changed its verdicts. Attempts submitted
+        before the pipeline existed get a state with every other step done.
+        """
+        if not attempt.get("post_submit"):
+            state = PostSubmitPipeline.initial_state(now)
+            state.update(done=[step for step in STEPS if step != "analysis"], next_run_at=now)
+            return {"$set": {"analysis.status": "pending", "post_submit": state}}
+        return {
+            "$set": {
+                "analysis.status": "pending",
+                "post_submit.status": "pending",
+                "post_submit.attempts": 0,
+                "post_submit.last_error": None,
+                "post_submit.next_run_at": now,
+                "post_submit.lease_until": None,
+                "post_submit.updated_at": now,
+            },
+            "$pull": {"post_submit.done": "analysis"},
+        }
+
+    @staticmethod
+    def _due_filter(now: datetime) -> dict:
+        return {
+            "status": "submitted",
+            "$or": [
+                {"post_submit.status": "pending", "post_submit.next_run_at": {"$lte": now}},
+                # A worker died mid-run; its lease has lapsed.
+                {"post_submit.status": "running", "post_submit.lease_until": {"$lt": now}},
+            ],
+        }
+
+    @staticmethod
+    async def _run_step(db: Database, step: str, attempt: dict) -> None:
+        if step == "score":
+            PostSubmitPipeline._ensure_scored(db, attempt)
+        elif step == "item_stats":
+            PostSubmitPipeline._record_item_stats(db, attempt)
+        elif step == "topic_stats":
+            PostSubmitPipeline._record_topic_stats(db, attempt)
+        elif step == "analysis":
+            await PostSubmitPipeline._store_analysis(db, attempt)
+        elif step == "activity":
+            PostSubmitPipeline._log_activity(db, attempt)
+        elif step == "notify_student":
+            NotificationService.create_for_user(
+                db,
+                user_id=str(attempt["student_id"]),
+                title="Result Ready",
+                message=f"Your result is ready. Score: {attempt.get('score')}%",
+                notification_type="result",
+                dedupe_key=PostSubmitPipeline._dedupe_key(attempt, step),
+            )
+        elif step == "notify_teacher":
+            PostSubmitPipeline._notify_teacher(db, attempt)
+
+    @staticmethod
+    def _ensure_scored(db: Database, attempt: dict) -> None:
+        """Score attempts whose submit request died after the status transition."""
+        if attempt.get("score") is not None:
+            return
+        question_set = QuestionSetService.for_attempt(db, attempt)
+        if not question_set:
+            raise RuntimeError("Attempt has no question set to score against")
+
+        key = QuestionSetService.answer_key(db, attempt.get("question_set_id"), question_set)
+        graded = key.grade(dict(attempt.get("answers") or {}))
+        analysis = {
+            "status": "pending",
+            "total_score": graded["raw_score"],
+            "max_score": graded["max_score"],
+            "partial_correct": graded["partial_correct"],
+        }
+        result = db.test_attempts.update_one(
+            {"_id": attempt["_id"], "score": None},
+            {"$set": {**graded, "analysis": analysis}},
+        )
+        if not result.modified_count:
+            # Scored concurrently; that writer also recorded the submission.
+            attempt.update(db.test_attempts.find_one({"_id": attempt["_id"]}) or {})
+            return
+        TestInboxService.mark_completed(db, attempt, score=graded["score"])
+        # As on the submit path: year boards and year-filtered progress need it.
+        year = PostSubmitPipeline._student_year(db, attempt)
+        avg_score = StudentStatsService.record_submission(
+            db,
+            str(attempt["student_id"]),
+            subject=attempt.get("subject"),
+            score=graded["score"],
+            submitted_at=attempt.get("submitted_at") or datetime.now(timezone.utc),
+            year=year,
+        )
+        LeaderboardService.record(db, str(attempt["student_id"]), avg_score, year=year)
+        attempt.update(graded)
+        attempt["analysis"] = analysis
+
+    @staticmethod
+    def _record_item_stats(db: Database, attempt: dict) -> None:
+        if not attempt.get("test_id"):
+            return
+        question_set = QuestionSetService.for_attempt(db, attempt)
+        key = QuestionSetService.answer_key(db, attempt.get("question_set_id"), question_set)
+        ItemStatsService.record(db, attempt, key)
+
+    @staticmethod
+    def _record_topic_stats(db: Database, attempt: dict) -> None:
+        question_set = QuestionSetService.for_attempt(db, attempt)
+        key = QuestionSetService.answer_key(db, attempt.get("question_set_id"), question_set)
+        TopicStatsService.record(db, attempt, key)
+
+    @staticmethod
+    async def _store_analysis(db: Database, attempt: dict) -> None:
+        question_set = QuestionSetService.for_attempt(db, attempt)
+        key = QuestionSetService.answer_key(db, attempt.get("question_set_id"), question_set)
+        answers = dict(attempt.get("answers") or {})
+        subject = attempt.get("subject", "General")
+        pending = attempt.get("analysis") or {}
+        base = {
+            "total_score": pending.get("total_score", attempt.get("raw_score", 0)),
+            "max_score": pending.get("max_score", attempt.get("max_score", 0)),
+            "partial_correct": pending.get("partial_correct", attempt.get("partial_correct", 0)),
+        }
+
+        try:
+            complete_analysis = AnalysisService.build_complete_analysis(
+                session={"questions": question_set, "answers": answers},
+                question_set=question_set,
+                subject=subject,
+                key=key,
+            )
+        except Exception:
+            # Fallback to simple analysis if comprehensive analysis fails
+            weak_topics = set()
+            for q, verdict in zip(question_set, key.verdicts(answers)):
+                if verdict != CORRECT:
+                    if q.get("subject"):
+                        weak_topics.add(q.get("subject"))
+            analysis = {
+                **base,
+                "status": "ready",
+                "weak_areas": list(weak_topics),
+                "message": "Focus more on " + ", ".join(list(weak_topics)[:2]) + " to improve your rank." if weak_topics else "Excellent performance! Keep it up.",
+            }
+        else:
+            ai_feedback = await AnalysisService.generate_ai_feedback(
+                analysis=complete_analysis,
+                weak_topics={
+                    "weak_topics": complete_analysis["weak_topics"],
+                    "strong_topics": complete_analysis["strong_topics"],
+                },
+                patterns={
+                    "patterns": complete_analysis["mistake_patterns"],
+                    "mistake_examples": complete_analysis["mistake_examples"],
+                },
+                session_subject=attempt.get("subject", "JEE"),
+            )
+            analysis = {
+                **base,
+                "status": "ready",
+                "weak_areas": [t["topic"] for t in complete_analysis.get("weak_topics", [])],
+                "strong_areas": [t["topic"] for t in complete_analysis.get("strong_topics", [])],
+                "message": ai_feedback or "Review your performance and focus on weak topics.",
+                "overall_accuracy": complete_analysis.get("overall_accuracy", 0),
+                "topic_breakdown": complete_analysis.get("topic_breakdown", {}),
+                "mistake_patterns": complete_analysis.get("mistake_patterns", {}),
+                "weak_topics_detailed": complete_analysis.get("weak_topics", []),
+            }
+
+        db.test_attempts.update_one({"_id": attempt["_id"]}, {"$set": {"analysis": analysis}})
+        attempt["analysis"] = analysis
+
+    @staticmethod
+    def _log_activity(db: Database, attempt: dict) -> None:
+        name = PostSubmitPipeline._student_name(db, attempt)
+        score = attempt.get("score")
+        auto_submitted = bool(attempt.get("auto_submitted"))
+        activity_text = f"{name} submitted test with score {score}%"
+        if auto_submitted:
+            activity_text = f"{name} was auto-submitted for leaving test screen ({score}%)"
+        ActivityService.log(
+            db,
+            text=activity_text,
+            event_type="test",
+            actor_id=str(attempt["student_id"]),
+            actor_role="student",
+            metadata={
+                "attempt_id": str(attempt["_id"]),
+                "score": score,
+                "subject": attempt.get("subject"),
+                "auto_submitted": auto_submitted,
+                "violation_reason": attempt.get("violation_reason"),
+            },
+            dedupe_key=PostSubmitPipeline._dedupe_key(attempt, "activity"),
+        )
+
+    @staticmethod
+    def _notify_teacher(db: Database, attempt: dict) -> None:
+        if not attempt.get("auto_submitted"):
+            return
+        test_id = str(attempt.get("test_id") or "")
+        if not ObjectId.is_valid(test_id):
+            return
+        test_doc = db.tests.find_one({"_id": ObjectId(test_id)}, {"creator_id": 1, "title": 1})
+        teacher_id = str(test_doc.get("creator_id") or "") if test_doc else ""
+        if not teacher_id:
+            return
+        NotificationService.create_for_user(
+            db,
+            user_id=teacher_id,
+            title="Test Auto-Submitted",
+            message=(
+                f"{PostSubmitPipeline._student_name(db, attempt)}'s attempt for "
+                f"'{test_doc.get('title', 'a test')}' was auto-submitted for leaving the test screen."
+            ),
+            notification_type="test",
+            dedupe_key=PostSubmitPipeline._dedupe_key(attempt, "notify_teacher"),
+        )
+
+    @staticmethod
+    def _dedupe_key(attempt: dict, step: str) -> str:
+        # A worker that takes over a lapsed lease may repeat a step whose
+        # completion was never recorded; its side effect lands only once.
+        return f"post_submit:{attempt['_id']}:{step}"
+
+    @staticmethod
+    def _student_year(db: Database, attempt: dict) -> str | None:
+        student_id = str(attempt.get("student_id") or "")
+        if ObjectId.is_valid(student_id):
+            student = db.users.find_one({"_id": ObjectId(student_id)}, {"year": 1})
+            if student:
+                return student.get("year")
+        return None
+
+    @staticmethod
+    def _student_name(db: Database, attempt: dict) -> str:
+        student_id = str(attempt.get("student_id") or "")
+        if ObjectId.is_valid(student_id):
+            student = db.users.find_one({"_id": ObjectId(student_id)}, {"name": 1})
+            if student and student.get("name"):
+                return str(student["name"])
+        return "Student"
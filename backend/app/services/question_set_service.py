@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from bson import ObjectId
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+from app.core.cache import cache_get, cache_set
+from app.core.config import get_settings
+from app.services.answer_key import CompiledAnswerKey
+from app.services.question_bank import build_question_set
+from app.services.version_service import VersionService
+from app.utils.cache import answer_key_cache, public_question_cache, question_set_cache
+
+_LOCK_POLL_SECONDS = 0.25
+_REDIS_TTL = timedelta(days=1)
+
+# Builders currently running in this process, keyed by test id.
+_inflight: dict[str, asyncio.Future] = {}
+
+
+class QuestionSetService:
+    """
+    Materializes and validates a test's question set before students can start it.
+
+    Materialized sets are stored once in ``question_sets`` under the SHA-256 of
+    their content, which doubles as the set's version. Tests and attempts keep
+    only the ``question_set_id`` reference.
+    """
+
+    @staticmethod
+    def normalize(question_set: list[dict], *, subject: str) -> list[dict]:
+        """Fill in the fields the attempt flow relies on (stable ids, subject, type)."""
+        normalized: list[dict] = []
+        for index, question in enumerate(question_set, start=1):
+            item = dict(question)
+            item["id"] = str(item.get("id") or f"q{index}")
+            item["subject"] = str(item.get("subject") or subject)
+            item["type"] = str(item.get("type") or "MCQ_MAIN")
+            item["options"] = [str(option) for option in (item.get("options") or [])]
+            normalized.append(item)
+        return normalized
+
+    @staticmethod
+    def validate(question_set: list[dict]) -> None:
+        """Raise ValueError if any question cannot be shown or graded."""
+        if not question_set:
+            raise ValueError("Question set is empty")
+
+        seen_ids: set[str] = set()
+        for question in question_set:
+            question_id = str(question.get("id") or "")
+            if not question_id or question_id in seen_ids:
+                raise ValueError(f"Question id '{question_id}' is missing or duplicated")
+            seen_ids.add(question_id)
+
+            if not str(question.get("text") or "").strip():
+                raise ValueError(f"Question {question_id} has no text")
+
+            qtype = question.get("type", "MCQ_MAIN")
+            options = question.get("options") or []
+            correct = question.get("correct")
+            if qtype == "NUMERICAL_MAIN":
+                try:
+                    float(correct)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Question {question_id} has no numerical answer") from None
+                continue
+
+            if len(options) < 2:
+                raise ValueError(f"Question {question_id} needs at least two options")
+            keys = correct if qtype == "ADV_MULTIPLE" and isinstance(correct, list) else [correct]
+            for key in keys:
+                if isinstance(key, bool) or not isinstance(key, int) or not 0 <= key < len(options):
+                    raise ValueError(f"Question {question_id} has an invalid answer key")
+
+    @staticmethod
+    async def materialize(db: Database, test: dict) -> list[dict]:
+        """
+        Ensure ``test`` has a persisted, validated question set and return it.
+
+        Generation is single-flight: concurrent callers in this process share
+        one builder task, and a lease on the test document makes builders in
+        other processes wait for that result instead of generating their own.
+        Raises RuntimeError when generation fails and ValueError when the
+        stored or generated set cannot be graded.
+        """
+        if test.get("question_set_ready_at") and test.get("question_set"):
+            QuestionSetService.reference(db, test)
+            return test["question_set"]
+
+        key = str(test["_id"])
+        task = _inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(QuestionSetService._materialize_once(db, test))
+            _inflight[key] = task
+            task.add_done_callback(lambda _: _inflight.pop(key, None))
+
+        # Shield so one cancelled request does not abort the shared builder.
+        question_set, question_set_id = await asyncio.shield(task)
+        test["question_set"] = question_set
+        test["question_set_id"] = question_set_id
+        test["question_set_ready_at"] = test.get("question_set_ready_at") or datetime.now(timezone.utc)
+        return question_set
+
+    @staticmethod
+    async def _materialize_once(db: Database, test: dict) -> tuple[list[dict], str]:
+        settings = get_settings()
+        lease_seconds = max(1, int(settings.question_set_lock_seconds))
+        token = uuid4().hex
+        deadline = time.monotonic() + lease_seconds * 2
+
+        while not QuestionSetService._claim(db, test["_id"], token, lease_seconds):
+            current = db.tests.find_one(
+                {"_id": test["_id"]},
+                {"question_set": 1, "question_set_id": 1, "question_set_ready_at": 1},
+            )
+            if current is None:
+                raise ValueError("Test no longer exists")
+            if current.get("question_set_ready_at") and current.get("question_set"):
+                return current["question_set"], QuestionSetService.reference(db, current)
+            if time.monotonic() > deadline:
+                raise RuntimeError("Timed out waiting for question generation. Please try again.")
+            await asyncio.sleep(_LOCK_POLL_SECONDS)
+
+        try:
+            fresh = db.tests.find_one({"_id": test["_id"]}) or test
+            subject = str(fresh.get("subject", "Physics"))
+            question_set = fresh.get("question_set") or []
+            if not question_set:
+                question_set = await build_question_set(
+                    db,
+                    subject,
+                    int(fresh.get("questions", 0) or 0),
+                    str(fresh.get("difficulty", "Medium")),
+                    require_ai=bool((settings.openai_api_key or "").strip()),
+                    topic=fresh.get("topic"),
+                )
+
+            normalized = QuestionSetService.normalize(question_set, subject=subject)
+            QuestionSetService.validate(normalized)
+            question_set_id = QuestionSetService.store(db, normalized, test_id=str(test["_id"]))
+        except BaseException:
+            db.tests.update_one(
+                {"_id": test["_id"], "question_set_lock.owner": token},
+                {"$unset": {"question_set_lock": ""}},
+            )
+            raise
+
+        now = datetime.now(timezone.utc)
+        db.tests.update_one(
+            {"_id": test["_id"], "question_set_lock.owner": token},
+            {
+                "$set": {
+                    "question_set": normalized,
+                    "question_set_id": question_set_id,
+                    "question_set_ready_at": now,
+                    "updated_at": now,
+                },
+                "$unset": {"question_set_lock": ""},
+            },
+        )
+        if fresh.get("creator_id"):
+            VersionService.bump(db, VersionService.papers(str(fresh["creator_id"])))
+        return normalized, question_set_id
+
+    @staticmethod
+    def _claim(db: Database, test_oid: ObjectId, token: str, lease_seconds: int) -> bool:
+        """Take the generation lease for a test that is not ready yet."""
+        now = datetime.now(timezone.utc)
+        result = db.tests.update_one(
+            {
+                "_id": test_oid,
+                "question_set_ready_at": None,
+                "$or": [
+                    {"question_set_lock": None},
+                    {"question_set_lock.expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "question_set_lock": {
+                        "owner": token,
+                        "expires_at": now + timedelta(seconds=lease_seconds),
+                    }
+                }
+            },
+        )
+        return result.modified_count == 1
+
+    @staticmethod
+    def content_hash(question_set: list[dict]) -> str:
+        canonical = json.dumps(question_set, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def store(db: Database, question_set: list[dict], *, test_id: str) -> str:
+        """Store an immutable question set and return its content-hash id."""
+        question_set_id = QuestionSetService.content_hash(question_set)
+        try:
+            db.question_sets.update_one(
+                {"_id": question_set_id},
+                {
+                    "$setOnInsert": {
+                        "test_id": test_id,
+                        "questions": question_set,
+                        "question_count": len(question_set),
+                        "created_at": datetime.now(timezone.utc),
+                    }
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert stored the same content first.
+            pass
+        question_set_cache.set(question_set_id, question_set)
+        return question_set_id
+
+    @staticmethod
+    def get(db: Database, question_set_id: str) -> list[dict]:
+        """
+        Resolve a stored question set through the in-process LRU, then Redis,
+        then MongoDB. Returned lists are shared between callers; do not mutate.
+        """
+        question_set = question_set_cache.get(question_set_id)
+        if question_set is not None:
+            return question_set
+
+        redis_key = f"question_set:{question_set_id}"
+        question_set = cache_get(redis_key)
+        if question_set is None:
+            doc = db.question_sets.find_one({"_id": question_set_id}, {"questions": 1})
+            if not doc:
+                return []
+            question_set = doc.get("questions") or []
+            cache_set(redis_key, question_set, ttl=_REDIS_TTL)
+
+        question_set_cache.set(question_set_id, question_set)
+        return question_set
+
+    @staticmethod
+    def public_questions(question_set: list[dict]) -> list[dict]:
+        """The answer-free view of a question set shown to students."""
+        payload: list[dict] = []
+        for index, question in enumerate(question_set, start=1):
+            payload.append(
+                {
+                    "id": str(question.get("id") or f"q{index}"),
+                    "subject": str(question.get("subject") or "General"),
+                    "text": str(question.get("text") or f"Question {index}"),
+                    "options": [str(option) for option in (question.get("options") or [])],
+                    "topic": str(question.get("topic") or "General"),
+                    "subtopic": str(question.get("subtopic") or "General"),
+                }
+            )
+        return payload
+
+    @staticmethod
+    def public_view(db: Database, question_set_id: str | None, question_set: list[dict] | None = None) -> dict:
+        """
+        ``{"questions": [...], "json": "[...]"}`` for a question set, built
+        once per set: stored sets are immutable, so the view is cached under
+        their id in the in-process LRU and Redis. Embedded legacy sets (no id)
+        are rendered on every call. Both values are shared; do not mutate.
+        """
+        if not question_set_id:
+            questions = QuestionSetService.public_questions(question_set or [])
+            return {"questions": questions, "json": json.dumps(questions, separators=(",", ":"))}
+
+        view = public_question_cache.get(question_set_id)
+        if view is not None:
+            return view
+
+        redis_key = f"question_set:public:{question_set_id}"
+        serialized = cache_get(redis_key)
+        if isinstance(serialized, str):
+            view = {"questions": json.loads(serialized), "json": serialized}
+        else:
+            if question_set is None:
+                question_set = QuestionSetService.get(db, question_set_id)
+            questions = QuestionSetService.public_questions(question_set)
+            view = {"questions": questions, "json": json.dumps(questions, separators=(",", ":"))}
+            if questions:
+                cache_set(redis_key, view["json"], ttl=_REDIS_TTL)
+
+        if view["questions"]:
+            public_question_cache.set(question_set_id, view)
+        return view
+
+    @staticmethod
+    def answer_key(db: Database, question_set_id: str | None, question_set: list[dict] | None = None) -> CompiledAnswerKey:
+        """
+        The compiled answer key for a question set, cached per id in a bounded
+        LRU (stored sets are immutable). Embedded legacy sets are compiled on
+        every call. Keys are shared between callers; do not mutate.
+        """
+        if not question_set_id:
+            return CompiledAnswerKey(question_set or [])
+
+        key = answer_key_cache.get(question_set_id)
+        if key is None:
+            if question_set is None:
+                question_set = QuestionSetService.get(db, question_set_id)
+            key = CompiledAnswerKey(question_set)
+            if question_set:
+                answer_key_cache.set(question_set_id, key)
+        return key
+
+    @staticmethod
+    def for_attempt(db: Database, attempt: dict) -> list[dict]:
+        question_set_id = attempt.get("question_set_id")
+        if question_set_id:
+            return QuestionSetService.get(db, str(question_set_id))
+        # Attempts started before the shared store embed their own copy.
+        return attempt.get("question_set") or []
+
+    @staticmethod
+    def reference(db: Database, test: dict) -> str | None:
+        """Return the test's stored question set id, storing its set on first use."""
+        if test.get("question_set_id"):
+            return str(test["question_set_id"])
+        question_set = test.get("question_set") or []
+        if not question_set:
+            return None
+
+        question_set_id = QuestionSetService.store(db, question_set, test_id=str(test["_id"]))
+        db.tests.update_one({"_id": test["_id"]}, {"$set": {"question_set_id": question_set_id}})
+        if test.get("creator_id"):
+            VersionService.bump(db, VersionService.papers(str(test["creator_id"])))
+        test["question_set_id"] = question_set_id
+        return question_set_id
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from pymongo import InsertOne
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+PERIODS = ("daily", "weekly")
+_BATCH_SIZE = 1000
+# How long a snapshot run may hold its period before another run takes over.
+_LEASE_SECONDS = 600
+
+
+class RankSnapshotService:
+    """
+    Periodic rank history (``rank_snapshots``, a MongoDB time-series collection).
+
+    A snapshot walks ``student_stats`` once in average-score order, assigning
+    competition ranks (ties share the better rank), and writes one point per
+    ranked student with ``taken_at`` set to the start of the period. Progress
+    then reads a student's history with one indexed query on
+    ``(meta.student_id, taken_at)``.
+
+    Time-series collections have no unique indexes, so each period is claimed
+    with a marker in ``rank_snapshot_runs`` before any point is written: a
+    concurrent scheduler finds the claim and backs off, and a run that died
+    midway is taken over once its lease lapses and completes the period,
+    skipping the students it already wrote.
+    """
+
+    @staticmethod
+    def period_start(period: str, now: datetime | None = None) -> datetime:
+        if period not in PERIODS:
+            raise ValueError(f"Unknown snapshot period '{period}'")
+        now = now or datetime.now(timezone.utc)
+        start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+        if period == "weekly":
+            start -= timedelta(days=start.weekday())
+        return start
+
+    @staticmethod
+    def exists(db: Database, period: str, taken_at: datetime) -> bool:
+        """Whether this period's snapshot is complete."""
+        run = db.rank_snapshot_runs.find_one({"_id": RankSnapshotService._run_id(period, taken_at)})
+        if run is not None:
+            return run.get("status") == "done"
+        # Periods captured before runs were recorded.
+        return db.rank_snapshots.find_one({"meta.period": period, "taken_at": taken_at}, {"_id": 1}) is not None
+
+    @staticmethod
+    def take(db: Database, *, period: str = "weekly", now: datetime | None = None, dry_run: bool = False) -> int:
+        """
+        Snapshot every ranked student for the current period. Returns the
+        number of points written (or that would be written), or 0 when this
+        period was already captured or another run is capturing it.
+        """
+        taken_at = RankSnapshotService.period_start(period, now)
+        if RankSnapshotService.exists(db, period, taken_at):
+            return 0
+
+        query = {"completed_tests": {"$gt": 0}}
+        total = db.student_stats.count_documents(query)
+        if not total:
+            return 0
+        if not dry_run and not RankSnapshotService._claim(db, period, taken_at):
+            return 0
+        # Points a previous, interrupted run already wrote for this period.
+        written_ids = (
+            set()
+            if dry_run
+            else set(db.rank_snapshots.distinct("meta.student_id", {"meta.period": period, "taken_at": taken_at}))
+        )
+
+        written = 0
+        rank = 0
+        previous_avg: float | None = None
+        batch: list[InsertOne] = []
+        cursor = (
+            db.student_stats.find(query, {"avg_score": 1})
+            .sort([("avg_score", -1), ("_id", 1)])
+            .batch_size(_BATCH_SIZE)
+        )
+        for position, stats in enumerate(cursor, start=1):
+            avg_score = float(stats.get("avg_score") or 0.0)
+            if avg_score != previous_avg:
+                rank, previous_avg = position, avg_score
+            if str(stats["_id"]) in written_ids:
+                continue
+            batch.append(
+                InsertOne(
+                    {
+                        "taken_at": taken_at,
+                        "meta": {"student_id": str(stats["_id"]), "period": period},
+                        "rank": rank,
+                        "total": total,
+                        "percentile": round((total - rank) / total * 100, 1),
+                        "avg_score": round(avg_score, 1),
+                    }
+                )
+            )
+            if len(batch) >= _BATCH_SIZE:
+                written += RankSnapshotService._flush(db, batch, dry_run)
+        written += RankSnapshotService._flush(db, batch, dry_run)
+        if not dry_run:
+            db.rank_snapshot_runs.update_one(
+                {"_id": RankSnapshotService._run_id(period, taken_at)},
+                {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc), "lease_until": None}},
+            )
+        return written
+
+    @staticmethod
+    def history(db: Database, student_id: str, *, period: str = "weekly", limit: int = 6) -> list[dict]:
+        """Oldest-first rank points for the student's latest ``limit`` snapshots."""
+        points = list(
+            db.rank_snapshots.find(
+                {"meta.student_id": student_id, "meta.period": period},
+                {"taken_at": 1, "rank": 1, "percentile": 1},
+            )
+            .sort("taken_at", -1)
+            .limit(limit)
+        )
+        return [
+            {
+                "week": point["taken_at"].strftime("%b %d"),
+                "rank": int(point.get("rank") or 0),
+                "percentile": point.get("percentile"),
+            }
+            for point in reversed(points)
+        ]
+
+    @staticmethod
+    def _claim(db: Database, period: str, taken_at: datetime) -> bool:
+        """Claim a period for this run: a new marker, or one whose run died mid-write."""
+        run_id = RankSnapshotService._run_id(period, taken_at)
+        now = datetime.now(timezone.utc)
+        lease_until = now + timedelta(seconds=_LEASE_SECONDS)
+        try:
+            db.rank_snapshot_runs.insert_one(
+                {
+                    "_id": run_id,
+                    "period": period,
+                    "taken_at": taken_at,
+                    "status": "running",
+                    "lease_until": lease_until,
+                    "started_at": now,
+                }
+            )
+            return True
+        except DuplicateKeyError:
+            existing = db.rank_snapshot_runs.find_one({"_id": run_id})
+        if existing is None or existing.get("status") != "running":
+            return False
+        expires = existing.get("lease_until")
+        if isinstance(expires, datetime) and expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        if expires is not None and expires > now:
+            return False
+        taken = db.rank_snapshot_runs.update_one(
+            {"_id": run_id, "status": "running", "lease_until": existing.get("lease_until")},
+            {"$set": {"lease_until": lease_until}},
+        )
+        return bool(taken.modified_count)
+
+    @staticmethod
+    def _run_id(period: str, taken_at: datetime) -> str:
+        return f"{period}:{taken_at:%Y-%m-%d}"
+
+    @staticmethod
+    def _flush(db: Database, batch: list[InsertOne], dry_run: bool) -> int:
+        count = len(batch)
+        if batch and not dry_run:
+            db.rank_snapshots.bulk_write(batch, ordered=False)
+        batch.clear()
+        return count
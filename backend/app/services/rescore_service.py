@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.database import Database
+
+from app.core.config import get_settings
+from app.services.answer_key import CompiledAnswerKey
+from app.services.batch_scoring import BatchScoring
+from app.services.item_stats_service import ItemStatsService
+from app.services.leaderboard_service import LeaderboardService
+from app.services.post_submit_pipeline import PostSubmitPipeline
+from app.services.question_set_service import QuestionSetService
+from app.services.student_stats_service import StudentStatsService
+from app.services.test_inbox_service import TestInboxService
+from app.services.topic_stats_service import TopicStatsService
+from app.utils.mongo import parse_object_id
+
+ACTIVE = ("pending", "running")
+
+
+class RescoreService:
+    """
+    Re-grades every submitted attempt of a test after its answer key changed.
+
+    A job (``rescore_jobs``) names the test and the question set to score
+    against and the source sets it corrects. Progress lives on the attempts
+    themselves: an attempt is done once its ``question_set_id`` has moved off
+    the sources, so a crashed run resumes with whatever is left. Attempts on
+    other versions of the paper are never touched. Batches are claimed with
+    a leased token on the attempts (``rescore``), which lets any number of
+    workers, in the app or in ``scripts/rescore_test.py`` processes, split
+    one job safely. Each
+    batch is scored with ``BatchScoring``, written with one ``bulk_write``,
+    and its score changes are applied to stats, leaderboards, the inbox and
+    the students' topic counters. A batch that fails leaves the job running;
+    the worker retries it with an exponential backoff (``next_run_at``).
+    """
+
+    @staticmethod
+    def create(
+        db: Database,
+        *,
+        test_id: str,
+        question_set_id: str,
+        source_set_ids: list[str | None],
+        requested_by: str | None = None,
+    ) -> dict:
+        """
+        Queue a rescore of ``test_id``'s attempts on ``source_set_ids`` against
+        ``question_set_id``, superseding older jobs. Attempts an older job had
+        not reached yet are carried over; attempts on any other version of the
+        paper are left alone.
+        """
+        now = datetime.now(timezone.utc)
+        sources = list(dict.fromkeys(source_set_ids))
+        for superseded in db.rescore_jobs.find({"test_id": test_id, "status": {"$in": list(ACTIVE)}}):
+            sources.extend(RescoreService._sources(superseded))
+        sources = [source for source in dict.fromkeys(sources) if source != question_set_id]
+        db.rescore_jobs.update_many(
+            {"test_id": test_id, "status": {"$in": list(ACTIVE)}},
+            {"$set": {"status": "superseded", "updated_at": now}},
+        )
+        job = {
+            "_id": ObjectId(),
+            "test_id": test_id,
+            "question_set_id": question_set_id,
+            "source_set_ids": sources,
+            "status": "pending",
+            "processed": 0,
+            "changed": 0,
+            "requested_by": requested_by,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "attempts": 0,
+            "last_error": None,
+            "next_run_at": None,
+        }
+        job["total"] = db.test_attempts.count_documents(RescoreService._remaining_filter(job))
+        db.rescore_jobs.insert_one(job)
+        return job
+
+    @staticmethod
+    def latest(db: Database, test_id: str) -> dict | None:
+        return db.rescore_jobs.find_one({"test_id": test_id}, sort=[("created_at", -1)])
+
+    @staticmethod
+    def run_batch(db: Database, job: dict, *, limit: int | None = None) -> int:
+        """Claim, re-grade and write one batch of the job's attempts. Returns how many were claimed."""
+        from app.services.student_service import StudentService
+
+        settings = get_settings()
+        limit = limit or max(1, int(settings.rescore_batch_size))
+        target = job["question_set_id"]
+        now = datetime.now(timezone.utc)
+        pending = RescoreService._remaining_filter(job)
+        due_ids = [
+            doc["_id"]
+            for doc in db.test_attempts.find(
+                {**pending, "$or": [{"rescore": None}, {"rescore.lease_until": {"$lt": now}}]},
+                {"_id": 1},
+            ).limit(limit)
+        ]
+        if not due_ids:
+            return 0
+
+        token = uuid4().hex
+        db.test_attempts.update_many(
+            {
+                "_id": {"$in": due_ids},
+                **pending,
+                "$or": [{"rescore": None}, {"rescore.lease_until": {"$lt": now}}],
+            },
+            {
+                "$set": {
+                    "rescore": {
+                        "job_id": str(job["_id"]),
+                        "token": token,
+                        "lease_until": now + timedelta(seconds=settings.rescore_lease_seconds),
+                    }
+                }
+            },
+        )
+        claimed = list(db.test_attempts.find({"rescore.token": token}))
+        if not claimed:
+            return 0
+
+        try:
+            key = QuestionSetService.answer_key(db, target)
+            if not key.question_ids:
+                raise RuntimeError(f"Question set {target} is missing")
+
+            # Attempts whose submit never finished scoring only need the new key;
+            # the post-submit pipeline scores them against it.
+            scored = [attempt for attempt in claimed if attempt.get("score") is not None]
+            graded_list = BatchScoring.grade_many(key, [dict(attempt.get("answers") or {}) for attempt in scored])
+            writes = [
+                UpdateOne(
+                    {"_id": attempt["_id"], "rescore.token": token},
+                    {"$set": {"question_set_id": target}, "$unset": {"rescore": ""}},
+                )
+                for attempt in claimed
+                if attempt.get("score") is None
+            ]
+            changed: list[tuple[dict, dict]] = []
+            old_keys: dict[ObjectId, CompiledAnswerKey] = {}
+            for attempt, graded in zip(scored, graded_list):
+                # Legacy attempts without a stored set carry their own copy.
+                old_key = old_keys[attempt["_id"]] = QuestionSetService.answer_key(
+                    db, attempt.get("question_set_id"), attempt.get("question_set")
+                )
+                update = {
+                    "$set": {
+                        **graded,
+                        "question_set_id": target,
+                        "total_questions": len(key.question_ids),
+                        "analysis.total_score": graded["raw_score"],
+                        "analysis.max_score": graded["max_score"],
+                        "analysis.partial_correct": graded["partial_correct"],
+                        "rescored_at": now,
+                    },
+                    "$unset": {"rescore": ""},
+                }
+                answers = dict(attempt.get("answers") or {})
+                if old_key.question_ids != key.question_ids or old_key.verdicts(answers) != key.verdicts(answers):
+                    # Weak/strong topics, breakdowns and feedback were built from
+                    # the old verdicts; the pipeline regenerates them.
+                    rerun = PostSubmitPipeline.rerun_analysis(attempt, now)
+                    update["$set"].update(rerun["$set"])
+                    if "$pull" in rerun:
+                        update["$pull"] = rerun["$pull"]
+                writes.append(UpdateOne({"_id": attempt["_id"], "rescore.token": token}, update))
+                if graded["score"] != attempt.get("score"):
+                    changed.append((attempt, graded))
+            db.test_attempts.bulk_write(writes, ordered=False)
+
+            for attempt in scored:
+                if attempt.get("topic_stats_at"):
+                    TopicStatsService.apply_rescore(db, attempt, old_keys[attempt["_id"]], key)
+
+            score_deltas: dict[str, dict[str | None, float]] = {}
+            for attempt, graded in changed:
+                student_id = str(attempt["student_id"])
+                by_subject = score_deltas.setdefault(student_id, {})
+                subject = attempt.get("subject")
+                by_subject[subject] = by_subject.get(subject, 0.0) + graded["score"] - float(attempt["score"])
+                TestInboxService.mark_completed(db, attempt, score=graded["score"])
+            for attempt in claimed:
+                # Rendered results show the answer key, so every one is stale.
+                StudentService.invalidate_result(str(attempt["student_id"]), str(attempt["_id"]))
+            for student_id, by_subject in score_deltas.items():
+                avg_score = StudentStatsService.apply_rescore(db, student_id, by_subject)
+                LeaderboardService.record(db, student_id, avg_score)
+                StudentService._invalidate_cache(student_id)
+
+            db.rescore_jobs.update_one(
+                {"_id": job["_id"]},
+                {
+                    "$inc": {"processed": len(claimed), "changed": len(changed)},
+                    "$set": {"attempts": 0, "last_error": None, "updated_at": datetime.now(timezone.utc)},
+                },
+            )
+            return len(claimed)
+        except Exception:
+            # Hand the unwritten part of the batch back so the retry does not
+            # wait out the lease.
+            db.test_attempts.update_many({"rescore.token": token}, {"$unset": {"rescore": ""}})
+            raise
+
+    @staticmethod
+    def run(db: Database, job_id: str) -> dict:
+        """Work on one job until nothing is left to claim; returns the job's latest state."""
+        job_oid = parse_object_id(job_id, "job_id")
+        job = db.rescore_jobs.find_one_and_update(
+            {"_id": job_oid, "status": {"$in": list(ACTIVE)}},
+            {"$set": {"status": "running", "updated_at": datetime.now(timezone.utc)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        try:
+            while job is not None and job["status"] == "running":
+                if not RescoreService.run_batch(db, job):
+                    # Nothing left to claim: either finished, or the last
+                    # batches are leased by other workers, who finish the job.
+                    RescoreService._finish_if_done(db, job)
+                    break
+                job = db.rescore_jobs.find_one({"_id": job_oid})
+        except Exception as exc:
+            # A half-rescored test must not be left behind: the job stays
+            # running and the worker retries it after a backoff.
+            settings = get_settings()
+            failures = int((job or {}).get("attempts") or 0) + 1
+            delay = min(
+                settings.rescore_retry_max_seconds,
+                settings.rescore_retry_base_seconds * (2 ** (failures - 1)),
+            )
+            failed_at = datetime.now(timezone.utc)
+            db.rescore_jobs.update_one(
+                {"_id": job_oid, "status": "running"},
+                {
+                    "$set": {
+                        "attempts": failures,
+                        "last_error": f"{type(exc).__name__}: {exc}"[:500],
+                        "next_run_at": failed_at + timedelta(seconds=delay),
+                        "updated_at": failed_at,
+                    }
+                },
+            )
+            raise
+        return db.rescore_jobs.find_one({"_id": job_oid}) or {}
+
+    @staticmethod
+    def run_due(db: Database) -> int:
+        """Advance every active job that is not backing off. Returns how many jobs were touched."""
+        now = datetime.now(timezone.utc)
+        jobs = list(
+            db.rescore_jobs.find(
+                {
+                    "status": {"$in": list(ACTIVE)},
+                    "$or": [{"next_run_at": None}, {"next_run_at": {"$lte": now}}],
+                },
+                {"_id": 1},
+            ).sort("created_at", 1)
+        )
+        for job in jobs:
+            try:
+                RescoreService.run(db, str(job["_id"]))
+            except Exception as exc:
+                print(f"Rescore job {job['_id']} failed, will retry: {exc}")
+        return len(jobs)
+
+    @staticmethod
+    async def run_worker(db: Database) -> None:
+        """Periodically pick up queued or orphaned rescore jobs."""
+        interval = max(1.0, float(get_settings().rescore_poll_seconds))
+        while True:
+            try:
+                await asyncio.to_thread(RescoreService.run_due, db)
+            except Exception as exc:
+                print(f"Rescore worker error: {exc}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def payload(job: dict) -> dict:
+        return {
+            "job_id": str(job["_id"]),
+            "test_id": job["test_id"],
+            "question_set_id": job["question_set_id"],
+            "status": job["status"],
+            "total": int(job.get("total") or 0),
+            "processed": int(job.get("processed") or 0),
+            "changed": int(job.get("changed") or 0),
+            "created_at": job.get("created_at"),
+            "finished_at": job.get("finished_at"),
+            "last_error": job.get("last_error"),
+        }
+
+    @staticmethod
+    def _remaining_filter(job: dict) -> dict:
+        return {
+            "test_id": job["test_id"],
+            "status": "submitted",
+            "question_set_id": {"$in": RescoreService._sources(job)},
+        }
+
+    @staticmethod
+    def _sources(job: dict) -> list[str | None]:
+        return list(job.get("source_set_ids") or [])
+
+    @staticmethod
+    def _finish_if_done(db: Database, job: dict) -> None:
+        if db.test_attempts.count_documents(RescoreService._remaining_filter(job), limit=1):
+            return
+        now = datetime.now(timezone.utc)
+        finished = db.rescore_jobs.update_one(
+            {"_id": job["_id"], "status": "running"},
+            {"$set": {"status": "done", "finished_at": now, "updated_at": now}},
+        )
+        if finished.modified_count:
+            # Verdicts changed with the key, so item counters are recounted.
+            ItemStatsService.rebuild(db, job["test_id"], job["question_set_id"])
@@ -111,6 +111,46 @@ class ScoringService:
             "accuracy": round(accuracy, 2)
         }
 
+    @staticmethod
+    def max_score(questions: List[Dict[str, Any]]) -> int:
+        """Best possible raw score (Adv Single = 3, everything else = 4)."""
+        return sum(
+            JEE_RULES["ADV_SINGLE"]["correct"] if q.get("type", "MCQ_MAIN") == "ADV_SINGLE" else 4
+            for q in questions
+        )
+
+    @staticmethod
+    def grade_attempt(questions: List[Dict[str, Any]], user_answers: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Score an attempt and return the fields stored on a submitted attempt.
+        """
+        scoring = ScoringService.calculate_jee_score(questions, user_answers)
+        stats = scoring["stats"]
+        max_possible = ScoringService.max_score(questions)
+        raw_score = scoring["score"]
+        return {
+            "score": round((raw_score / max_possible * 100), 1) if max_possible > 0 else 0.0,
+            "raw_score": raw_score,
+            "max_score": max_possible,
+            "correct_answers": stats["correct"],
+            "incorrect_answers": stats["wrong"],
+            "unattempted": stats["unattempted"],
+            "partial_correct": stats["partial"],
+            "total_answered": stats["correct"] + stats["wrong"] + stats["partial"],
+            "accuracy": scoring["accuracy"],
+        }
+
+    @staticmethod
+    def grade_attempts(questions: List[Dict[str, Any]], answers_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Grade many attempts of the same question set at once (vectorized, see
+        app/services/batch_scoring.py). Same results as ``grade_attempt`` per attempt.
+        """
+        from app.services.answer_key import CompiledAnswerKey
+        from app.services.batch_scoring import BatchScoring
+
+        return BatchScoring.grade_many(CompiledAnswerKey.compile(questions), answers_list)
+
     @staticmethod
     def _is_wrong(q: Dict[str, Any], user_ans: Any) -> bool:
         """
@@ -1,23 +1,40 @@
+import asyncio
+import math
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
 from bson import ObjectId
 from fastapi import HTTPException, status
+from pymongo import ReturnDocument
 from pymongo.database import Database
 
-from app.core.cache import cache_get, cache_set, cache_delete_pattern
 from app.core.config import get_settings
+from app.core.cache import cache_delete_many, cache_get, cache_set, get_redis
 from app.schemas.student import FeedbackRequest, SaveAnswersRequest
 from app.services.activity_service import ActivityService
 from app.services.ai_service import generate_chat_reply
-from app.services.analysis_service import AnalysisService
-from app.services.notification_service import NotificationService
+from app.services.answer_buffer import AnswerBuffer
+from app.services.answer_key import CORRECT, NUMERICAL_MAIN
+from app.services.attempt_sweeper import AttemptSweeper
+from app.services.class_membership_service import ClassMembershipService
+from app.services.leaderboard_service import LeaderboardService
 from app.services.planner_service import PlannerService
+from app.services.post_submit_pipeline import PostSubmitPipeline
 from app.services.public_resource import PublicResourceService
-from app.services.question_bank import build_question_set
-from app.services.scoring_service import ScoringService
+from app.services.question_set_service import QuestionSetService
+from app.services.rank_snapshot_service import RankSnapshotService
+from app.services.student_stats_service import StudentStatsService
+from app.services.sync_service import SyncService
+from app.services.test_inbox_service import TestInboxService
+from app.services.version_service import VersionService
+from app.utils.cache import result_cache
+from app.utils.http_cache import make_etag
 from app.utils.mongo import parse_object_id, serialize_id
 
+# Dashboard validators roll over with the dashboard cache TTL.
+_DASHBOARD_WINDOW_SECONDS = 180
+
 # JEE Marking Configuration
 JEE_MAIN_RULES = {
     "MCQ": {
@@ -37,39 +54,98 @@ class StudentService:
     @staticmethod
     def _invalidate_cache(student_id: str) -> None:
         """Clear all student-related caches (dashboard, home, tests, progress)"""
-        cache_delete_pattern(f"student:*:{student_id}:*")
+        # Dashboard entries are keyed by their version stamp and need no purge.
+        cache_delete_many([
+            f"student:home:{student_id}:v2",
+            f"student:progress:{student_id}:v2",
+        ])
 
     @staticmethod
-    def dashboard_summary(db: Database, student: dict) -> dict:
+    async def dashboard_summary(db: Database, student: dict, *, etag: str | None = None) -> dict:
         """
         Aggregated view for the student dashboard.
         Returns small, already-shaped payloads used on the home screen.
+
+        Independent reads run concurrently on worker threads, each within
+        ``dashboard_part_timeout_seconds``. A section whose reads fail or time
+        out is returned empty and listed under ``degraded`` instead of failing
+        the whole dashboard; degraded payloads are not cached. Cached entries
+        are keyed by the dashboard ETag, so any version bump retires them.
         """
         student_id = str(student["_id"])
-        cache_key = f"student:dashboard:{student_id}:v2"
+        etag = etag or StudentService.dashboard_etag(db, student)
+        cache_key = f"student:dashboard:{student_id}:{etag.strip(chr(34))}"
 
         if cached := cache_get(cache_key):
             return cached
 
-        # Reuse existing optimized helpers (each of them is cached individually as well)
-        home = StudentService.home_summary(db, student)
-
-        # Progress has two variants; prefer the richer v1 result when available.
-        full_progress = StudentService.progress(db, student)
+        timeout = get_settings().dashboard_part_timeout_seconds
+        parts = {
+            "stats": lambda: StudentStatsService.get(db, student_id),
+            "assigned": lambda: StudentService._assigned_tests_count(db, student),
+            "progress": lambda: StudentService.progress(db, student),
+            "tests": lambda: StudentService.list_tests(db, student, status_filter=None, subject=None),
+            "notifications": lambda: StudentService.list_notifications(db, student),
+        }
+        outcomes = await asyncio.gather(
+            *(asyncio.wait_for(asyncio.to_thread(read), timeout) for read in parts.values()),
+            return_exceptions=True,
+        )
+        results: dict = {}
+        failed: set[str] = set()
+        for name, outcome in zip(parts, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"Dashboard part {name} failed for student {student_id}: {outcome!r}")
+                failed.add(name)
+            else:
+                results[name] = outcome
 
-        tests = StudentService.list_tests(
-            db, student, status_filter=None, subject=None)
-        notifications = StudentService.list_notifications(db, student)
+        degraded: list[str] = []
+        if failed & {"stats", "assigned"}:
+            degraded.append("home")
+            home = {"assigned_tests": 0, "completed_tests": 0, "avg_score": 0.0, "streak": 0}
+        else:
+            home = StudentService._home_payload(results["stats"], results["assigned"])
+        if "progress" in failed:
+            degraded.append("progress")
+        if "tests" in failed:
+            degraded.append("tests")
+        if "notifications" in failed:
+            degraded.append("notifications")
 
         payload = {
             "home": home,
-            "progress": full_progress,
-            "tests": tests,
-            "notifications": notifications,
+            "progress": results.get("progress") or {
+                "overall_rank": 0,
+                "total_students": 0,
+                "tests_completed": 0,
+                "avg_score": 0.0,
+                "rank_history": [],
+                "topic_mastery": [],
+            },
+            "tests": results.get("tests") or [],
+            "notifications": results.get("notifications") or [],
+            "degraded": degraded,
         }
-        cache_set(cache_key, payload, ttl=timedelta(minutes=3))
+        if not degraded:
+            cache_set(cache_key, payload, ttl=timedelta(minutes=3))
         return payload
 
+    @staticmethod
+    def dashboard_etag(db: Database, student: dict) -> str:
+        """
+        Validator for the dashboard: the student's and their notifications'
+        version stamps, plus a three-minute window because rank and streak
+        also move with other students' submissions and the calendar.
+        """
+        student_id = str(student["_id"])
+        return VersionService.etag(
+            db,
+            VersionService.student(student_id),
+            VersionService.notifications(student_id),
+            variant=["dashboard", int(time.time() // _DASHBOARD_WINDOW_SECONDS)],
+        )
+
     @staticmethod
     def home_summary(db: Database, student: dict) -> dict:
         student_id = str(student["_id"])
@@ -78,26 +154,27 @@ class StudentService:
         if cached:
             return cached
 
-        year = student.get("year")
-        class_ids = StudentService._student_class_ids(db, student_id)
+        result = StudentService._home_payload(
+            StudentStatsService.get(db, student_id),
+            StudentService._assigned_tests_count(db, student),
+        )
+        cache_set(cache_key, result, ttl=timedelta(minutes=2))
+        return result
 
-        # 1. Counts and Averages
-        stats_pipeline = [
-            {"$match": {"student_id": student_id, "status": "submitted"}},
-            {
-                "$group": {
-                    "_id": None,
-                    "completed_tests": {"$sum": 1},
-                    "avg_score": {"$avg": "$score"},
-                }
-            },
-        ]
-        stats = list(db.test_attempts.aggregate(stats_pipeline))
-        completed_tests = stats[0].get("completed_tests", 0) if stats else 0
-        avg_score = round(
-            float(stats[0].get("avg_score", 0.0) or 0.0), 1) if stats else 0.0
+    @staticmethod
+    def _home_payload(stats: dict, assigned_tests_count: int) -> dict:
+        return {
+            "assigned_tests": assigned_tests_count,
+            "completed_tests": int(stats.get("completed_tests") or 0),
+            "avg_score": round(float(stats.get("avg_score") or 0.0), 1),
+            "streak": StudentStatsService.streak(stats),
+        }
+
+    @staticmethod
+    def _assigned_tests_count(db: Database, student: dict) -> int:
+        year = student.get("year")
+        class_ids = ClassMembershipService.class_ids(db, student)
 
-        # 2. Assigned tests (optimized query)
         access_clauses = []
         if class_ids:
             access_clauses.append(
@@ -112,43 +189,7 @@ class StudentService:
         else:
             assigned_query["_id"] = {"$exists": False}
 
-        assigned_tests_count = db.tests.count_documents(assigned_query)
-
-        # 3. Streak (Minimal fetch)
-        submissions = list(
-            db.test_attempts.find(
-                {"student_id": student_id, "status": "submitted",
-                    "submitted_at": {"$ne": None}},
-                {"submitted_at": 1},
-            ).sort("submitted_at", -1).limit(30)  # Fetch last 30 for streak
-        )
-        unique_dates = []
-        seen = set()
-        for s in submissions:
-            day = s["submitted_at"].astimezone(timezone.utc).date()
-            if day not in seen:
-                seen.add(day)
-                unique_dates.append(day)
-
-        streak = 0
-        if unique_dates:
-            today = datetime.now(timezone.utc).date()
-            if (today - unique_dates[0]).days <= 1:
-                streak = 1
-                for i in range(len(unique_dates) - 1):
-                    if (unique_dates[i] - unique_dates[i+1]).days == 1:
-                        streak += 1
-                    else:
-                        break
-
-        result = {
-            "assigned_tests": assigned_tests_count,
-            "completed_tests": completed_tests,
-            "avg_score": avg_score,
-            "streak": streak,
-        }
-        cache_set(cache_key, result, ttl=timedelta(minutes=2))
-        return result
+        return db.tests.count_documents(assigned_query)
 
     @staticmethod
     def list_tests(
@@ -157,118 +198,10 @@ class StudentService:
         status_filter: str | None,
         subject: str | None,
     ) -> list[dict]:
-        student_id = str(student["_id"])
-        cache_key = f"student:tests:{student_id}:{status_filter or 'all'}:{subject or 'all'}:v2"
-        cached = cache_get(cache_key)
-        if cached:
-            return cached
-
-        year = student.get("year")
-        class_ids = StudentService._student_class_ids(db, student_id)
-
-        # Only pull what we need for the list UI (avoid big attempt payloads).
-        submitted_attempts = list(
-            db.test_attempts.find(
-                {"student_id": student_id, "status": "submitted"},
-                {"test_id": 1, "score": 1, "submitted_at": 1},
-            ).sort("submitted_at", -1)
-        )
-        # Collect all tests to fetch
-        all_test_ids = set()
-        for attempt in submitted_attempts:
-            if tid := attempt.get("test_id"):
-                all_test_ids.add(str(tid))
-
-        # Build query for assigned/active tests
-        access_clauses: list[dict] = []
-        if class_ids:
-            access_clauses.append(
-                {
-                    "status": {"$in": ["assigned", "active"]},
-                    "assigned_to_class_ids": {"$in": class_ids},
-                }
-            )
-        if year:
-            # Legacy fallback
-            access_clauses.append(
-                {
-                    "assigned": True,
-                    "year": year,
-                    "status": {"$in": ["assigned", "active"]},
-                    "$or": [
-                        {"assigned_to_class_ids": {"$exists": False}},
-                        {"assigned_to_class_ids": {"$size": 0}},
-                    ],
-                }
-            )
-
-        main_query = {"$or": access_clauses} if access_clauses else {
-            "_id": {"$exists": False}}
-        if subject:
-            main_query["subject"] = subject
-
-        test_list_projection = {"question_set": 0}
-
-        # Fetch assigned tests
-        assigned_tests = list(
-            db.tests.find(main_query, test_list_projection).sort(
-                "created_at", -1)
-        )
-
-        # Identify which submitted tests are missing from the assigned list
-        assigned_ids = {str(t["_id"]) for t in assigned_tests}
-        missing_ids = [parse_object_id(tid, "test_id")
-                       for tid in all_test_ids if tid not in assigned_ids]
-
-        # Batch fetch missing tests
-        additional_tests = []
-        if missing_ids:
-            missing_query = {"_id": {"$in": missing_ids}}
-            if subject:
-                missing_query["subject"] = subject
-            additional_tests = list(db.tests.find(
-                missing_query, test_list_projection))
-
-        # Combine and sort
-        all_tests = assigned_tests + additional_tests
-
-        def _created_at_key(doc: dict) -> datetime:
-            created_at = doc.get("created_at")
-            if isinstance(created_at, datetime):
-                return created_at
-            return datetime(1970, 1, 1, tzinfo=timezone.utc)
-
-        all_tests.sort(key=_created_at_key, reverse=True)
-
-        # Map attempts for O(1) lookup
-        attempt_map = {
-            str(a.get("test_id")): a
-            for a in submitted_attempts
-            if a.get("test_id")
-        }
-
-        responses = []
-        for test in all_tests:
-            payload = serialize_id(test)
-            test_id = payload["id"]
-            attempt = attempt_map.get(test_id)
-
-            if attempt:
-                payload["score"] = attempt.get("score")
-                payload["attempt_id"] = str(attempt.get("_id"))
-                payload["status"] = "completed"
-            else:
-                payload["score"] = None
-                payload["attempt_id"] = None
-                payload["status"] = "assigned"
-
-            if status_filter and payload["status"] != status_filter:
-                continue
-
-            responses.append(payload)
-
-        cache_set(cache_key, responses, ttl=timedelta(minutes=2))
-        return responses
+        # Backed by the per-student test inbox; see TestInboxService.list_page
+        # for the cursor-paginated variant.
+        return TestInboxService.list_all(
+            db, student, status_filter=status_filter, subject=subject)
 
     @staticmethod
     async def start_test(db: Database, student: dict, test_id: str) -> dict:
@@ -299,34 +232,23 @@ class StudentService:
                 detail="Test already submitted",
             )
 
-        total_questions = int(test.get("questions", 0) or 0)
         duration = int(test.get("duration", 60) or 60)
 
-        question_set = test.get("question_set") or []
-        if not question_set:
-            try:
-                question_set = await build_question_set(
-                    db,
-                    str(test.get("subject", "Physics")),
-                    total_questions,
-                    str(test.get("difficulty", "Medium")),
-                    require_ai=bool(
-                        (get_settings().openai_api_key or "").strip()),
-                )
-            except RuntimeError as exc:
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=str(exc),
-                ) from exc
-            db.tests.update_one(
-                {"_id": test_oid},
-                {
-                    "$set": {
-                        "question_set": question_set,
-                        "updated_at": datetime.now(timezone.utc),
-                    }
-                },
-            )
+        # Papers are materialized at assignment time, so this is normally a
+        # no-op; only tests assigned before that existed get built here.
+        try:
+            question_set = await QuestionSetService.materialize(db, test)
+        except RuntimeError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(exc),
+            ) from exc
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Test questions are not ready: {exc}",
+            ) from exc
+        question_set_id = test.get("question_set_id")
 
         existing = db.test_attempts.find_one(
             {
@@ -336,26 +258,34 @@ class StudentService:
             }
         )
         if existing:
-            attempt_questions = existing.get("question_set") or question_set
+            attempt_questions = QuestionSetService.for_attempt(
+                db, existing) or question_set
             existing_answers = dict(existing.get("answers", {}))
-            if not existing.get("question_set"):
+            if AnswerBuffer.enabled():
+                existing_answers.update(
+                    AnswerBuffer.pending(str(existing["_id"]))["answers"])
+            if not existing.get("question_set_id") and not existing.get("question_set"):
                 db.test_attempts.update_one(
                     {"_id": existing["_id"]},
                     {
                         "$set": {
-                            "question_set": attempt_questions,
+                            "question_set_id": question_set_id,
                             "total_questions": len(attempt_questions),
                             "updated_at": datetime.now(timezone.utc),
                         }
                     },
                 )
 
+            attempt_set_id = existing.get("question_set_id") or (
+                None if existing.get("question_set") else question_set_id)
             return {
                 "attempt_id": str(existing["_id"]),
                 "status": "in_progress",
                 "started_at": existing["started_at"],
                 "duration": duration,
-                "questions": StudentService._public_question_set(attempt_questions),
+                "question_set_id": attempt_set_id,
+                "questions": QuestionSetService.public_view(
+                    db, attempt_set_id, attempt_questions)["questions"],
                 "answers": existing_answers,
             }
 
@@ -366,8 +296,10 @@ class StudentService:
             "subject": test.get("subject", "General"),
             "status": "in_progress",
             "answers": {},
-            "question_set": question_set,
+            "question_set_id": question_set_id,
             "started_at": now,
+            # Expired attempts are submitted server-side by AttemptSweeper.
+            "deadline_at": AttemptSweeper.deadline(now, duration),
             "submitted_at": None,
             "score": None,
             "total_questions": len(question_set),
@@ -382,32 +314,71 @@ class StudentService:
             "status": "in_progress",
             "started_at": now,
             "duration": duration,
-            "questions": StudentService._public_question_set(question_set),
+            "question_set_id": question_set_id,
+            "questions": QuestionSetService.public_view(
+                db, question_set_id, question_set)["questions"],
             "answers": {},
         }
 
     @staticmethod
-    def save_answers(db: Database, student: dict, attempt_id: str, payload: SaveAnswersRequest) -> dict:
-        student_id = str(student["_id"])
-        attempt_oid = parse_object_id(attempt_id, "attempt_id")
-
+    def started_attempt(db: Database, student: dict, attempt_id: str) -> dict:
+        """The start response for an attempt the student already started (Idempotency-Key replays)."""
         attempt = db.test_attempts.find_one(
-            {"_id": attempt_oid, "student_id": student_id})
+            {"_id": parse_object_id(attempt_id, "attempt_id"), "student_id": str(student["_id"])}
+        )
         if not attempt:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Attempt not found")
 
-        if attempt.get("status") != "in_progress":
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Attempt is already submitted",
-            )
+        test = StudentService._find_test_by_id(db, str(attempt.get("test_id") or "")) or {}
+        answers = dict(attempt.get("answers", {}))
+        if AnswerBuffer.enabled() and attempt.get("status") == "in_progress":
+            answers.update(AnswerBuffer.pending(attempt_id)["answers"])
+        question_set_id = attempt.get("question_set_id")
+        return {
+            "attempt_id": attempt_id,
+            "status": attempt.get("status", "in_progress"),
+            "started_at": attempt["started_at"],
+            "duration": int(test.get("duration", 60) or 60),
+            "question_set_id": question_set_id,
+            "questions": QuestionSetService.public_view(
+                db, question_set_id, attempt.get("question_set"))["questions"],
+            "answers": answers,
+        }
 
-        merged_answers = dict(attempt.get("answers", {}))
+    @staticmethod
+    def save_answers(db: Database, student: dict, attempt_id: str, payload: SaveAnswersRequest) -> dict:
+        student_id = str(student["_id"])
+        attempt_oid = parse_object_id(attempt_id, "attempt_id")
         normalized_answers = {
             key: StudentService._normalize_answer(value)
             for key, value in payload.answers.items()
         }
+
+        if AnswerBuffer.enabled():
+            # Write-behind: only the first autosave of an attempt touches MongoDB.
+            owner = AnswerBuffer.owner(attempt_id)
+            if owner is None:
+                attempt = StudentService._get_in_progress_attempt(
+                    db, student_id, attempt_oid)
+                AnswerBuffer.seed(
+                    attempt_id,
+                    student_id,
+                    dict(attempt.get("answers", {})),
+                    dict(attempt.get("time_spent", {})),
+                )
+            elif owner != student_id:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Attempt not found")
+
+            saved = AnswerBuffer.record(
+                attempt_id, normalized_answers, payload.time_spent)
+            return {"attempt_id": attempt_id, "saved_answers": saved}
+
+        attempt = StudentService._get_in_progress_attempt(
+            db, student_id, attempt_oid)
+
+        merged_answers = dict(attempt.get("answers", {}))
         merged_answers.update(normalized_answers)
 
         merged_time_spent = dict(attempt.get("time_spent", {}))
@@ -432,6 +403,21 @@ class StudentService:
             "saved_answers": len([value for value in merged_answers.values() if value is not None]),
         }
 
+    @staticmethod
+    def _get_in_progress_attempt(db: Database, student_id: str, attempt_oid: ObjectId) -> dict:
+        attempt = db.test_attempts.find_one(
+            {"_id": attempt_oid, "student_id": student_id})
+        if not attempt:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Attempt not found")
+
+        if attempt.get("status") != "in_progress":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Attempt is already submitted",
+            )
+        return attempt
+
     @staticmethod
     def submit_attempt(
         db: Database,
@@ -444,253 +430,182 @@ class StudentService:
         student_id = str(student["_id"])
         attempt_oid = parse_object_id(attempt_id, "attempt_id")
 
-        attempt = db.test_attempts.find_one(
-            {"_id": attempt_oid, "student_id": student_id})
-        if not attempt:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Attempt not found")
+        cleaned_violation_reason = (violation_reason or "").strip() or None
+        auto_submitted = cleaned_violation_reason is not None
+        submitted_at = datetime.now(timezone.utc)
 
-        if attempt.get("status") == "submitted":
+        transition: dict = {
+            "status": "submitted",
+            "auto_submitted": auto_submitted,
+            "violation_reason": cleaned_violation_reason,
+            "submitted_at": submitted_at,
+            "updated_at": submitted_at,
+            # Written with the transition so the pipeline can finish (or
+            # re-score) the attempt even if this request dies midway.
+            "post_submit": PostSubmitPipeline.initial_state(submitted_at),
+        }
+        if AnswerBuffer.enabled():
+            # Autosaves may still be sitting in the write-behind buffer.
+            buffered = AnswerBuffer.pending(attempt_id)
+            for question_id, value in buffered["answers"].items():
+                transition[f"answers.{question_id}"] = value
+            for question_id, seconds in buffered["time_spent"].items():
+                transition[f"time_spent.{question_id}"] = seconds
+        for question_id, seconds in (time_spent or {}).items():
+            if isinstance(seconds, int) and seconds >= 0:
+                transition[f"time_spent.{question_id}"] = seconds
+
+        # Single conditional transition: concurrent submits cannot both win.
+        attempt = db.test_attempts.find_one_and_update(
+            {"_id": attempt_oid, "student_id": student_id, "status": "in_progress"},
+            {"$set": transition},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not attempt:
+            if not db.test_attempts.find_one(
+                    {"_id": attempt_oid, "student_id": student_id}, {"_id": 1}):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Attempt not found")
             raise HTTPException(
                 status_code=409, detail="Attempt already submitted")
 
-        cleaned_violation_reason = (violation_reason or "").strip() or None
-        if time_spent:
-            db.test_attempts.update_one(
-                {"_id": attempt_oid},
-                {"$set": {f"time_spent.{k}": v for k,
-                          v in time_spent.items() if isinstance(v, int) and v >= 0}}
-            )
-
-        attempt = db.test_attempts.find_one({"_id": attempt_oid})  # Refresh
-        auto_submitted = cleaned_violation_reason is not None
-
-        answers = attempt.get("answers", {})
-        question_set = attempt.get("question_set") or []
+        graded_updates: dict = {}
+        question_set = QuestionSetService.for_attempt(db, attempt)
         if not question_set:
-            test_id = str(attempt.get("test_id") or "")
-            test_doc = StudentService._find_test_by_id(db, test_id)
-            if test_doc:
-                recovered_question_set = test_doc.get("question_set") or []
-                if isinstance(recovered_question_set, list) and recovered_question_set:
-                    question_set = recovered_question_set
-                    db.test_attempts.update_one(
-                        {"_id": attempt_oid},
-                        {
-                            "$set": {
-                                "question_set": question_set,
-                                "total_questions": len(question_set),
-                                "updated_at": datetime.now(timezone.utc),
-                            }
-                        },
-                    )
-
-        total_questions = int(attempt.get("total_questions") or 0)
-        if total_questions <= 0:
-            total_questions = len(question_set)
-
-        if question_set:
-            scoring_res = ScoringService.calculate_jee_score(
-                question_set, answers)
-
-            total_jee_score = scoring_res["score"]
-            correct_count = scoring_res["stats"]["correct"]
-            wrong_count = scoring_res["stats"]["wrong"]
-            unattempted_count = scoring_res["stats"]["unattempted"]
-            partial_count = scoring_res["stats"]["partial"]
-            accuracy = scoring_res["accuracy"]
-
-            # Determine max score based on question types (Main = 4, Adv Single = 3, Adv Multi = 4)
-            from app.services.scoring_service import JEE_RULES
-            max_possible = 0
-            for q in question_set:
-                qtype = q.get("type", "MCQ_MAIN")
-                if qtype == "ADV_SINGLE":
-                    max_possible += 3
-                else:
-                    max_possible += 4  # Default for MCQ_MAIN, NUMERICAL_MAIN, ADV_MULTIPLE
-
-            score_percent = round(
-                (total_jee_score / max_possible * 100), 1) if max_possible > 0 else 0.0
-
-            # Build comprehensive performance analysis
-            try:
-                # Create session object for analysis
-                session = {
-                    "questions": question_set,
-                    "answers": answers,
-                }
-
-                # Generate complete analysis
-                complete_analysis = AnalysisService.build_complete_analysis(
-                    session=session,
-                    question_set=question_set,
-                    subject=attempt.get("subject", "General"),
-                )
+            test_doc = StudentService._find_test_by_id(
+                db, str(attempt.get("test_id") or ""))
+            recovered_id = QuestionSetService.reference(db, test_doc) if test_doc else None
+            if recovered_id:
+                question_set = QuestionSetService.get(db, recovered_id)
+                graded_updates["question_set_id"] = recovered_id
+                graded_updates["total_questions"] = len(question_set)
 
-                # Generate AI feedback asynchronously (non-blocking)
-                import asyncio
-                try:
-                    loop = asyncio.get_event_loop()
-                except RuntimeError:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-
-                ai_feedback = None
-                try:
-                    # Try to generate AI feedback
-                    ai_feedback = loop.run_until_complete(
-                        AnalysisService.generate_ai_feedback(
-                            analysis=complete_analysis,
-                            weak_topics={
-                                "weak_topics": complete_analysis["weak_topics"],
-                                "strong_topics": complete_analysis["strong_topics"],
-                            },
-                            patterns={
-                                "patterns": complete_analysis["mistake_patterns"],
-                                "mistake_examples": complete_analysis["mistake_examples"],
-                            },
-                            session_subject=attempt.get("subject", "JEE"),
-                        )
-                    )
-                except Exception as e:
-                    # If AI feedback fails, fall back to default message
-                    weak_list = [t["topic"] for t in complete_analysis.get("weak_topics", [])[
-                        :2]]
-                    if weak_list:
-                        ai_feedback = f"Focus on improving {', '.join(weak_list)} to boost your score in the next attempt."
-                    else:
-                        ai_feedback = "Great performance! Keep practicing to maintain excellence."
-
-                # Construct analysis dictionary with all insights
-                analysis = {
-                    "weak_areas": [t["topic"] for t in complete_analysis.get("weak_topics", [])],
-                    "strong_areas": [t["topic"] for t in complete_analysis.get("strong_topics", [])],
-                    "message": ai_feedback or "Review your performance and focus on weak topics.",
-                    "total_score": total_jee_score,
-                    "max_score": max_possible,
-                    "partial_correct": partial_count,
-                    "overall_accuracy": complete_analysis.get("overall_accuracy", 0),
-                    "topic_breakdown": complete_analysis.get("topic_breakdown", {}),
-                    "mistake_patterns": complete_analysis.get("mistake_patterns", {}),
-                    "weak_topics_detailed": complete_analysis.get("weak_topics", []),
-                }
-
-            except Exception as analysis_error:
-                # Fallback to simple analysis if comprehensive analysis fails
-                weak_topics = set()
-                for q in question_set:
-                    qid = str(q.get("id"))
-                    if answers.get(qid) is None or ScoringService._is_wrong(q, answers.get(qid)):
-                        if q.get("subject"):
-                            weak_topics.add(q.get("subject"))
-
-                analysis = {
-                    "weak_areas": list(weak_topics),
-                    "message": "Focus more on " + ", ".join(list(weak_topics)[:2]) + " to improve your rank." if weak_topics else "Excellent performance! Keep it up.",
-                    "total_score": total_jee_score,
-                    "max_score": max_possible,
-                    "partial_correct": partial_count,
-                }
-
-            correct_answers = correct_count
-            incorrect_answers = wrong_count
-            unattempted = unattempted_count
-            answered = correct_answers + incorrect_answers + partial_count
-            score = score_percent
-        else:
+        if not question_set:
+            # Roll the transition back so the student can submit once the key exists.
+            db.test_attempts.update_one(
+                {"_id": attempt_oid, "status": "submitted"},
+                {
+                    "$set": {"status": "in_progress", "submitted_at": None},
+                    "$unset": {"post_submit": ""},
+                },
+            )
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="Attempt cannot be graded because answer key is missing",
             )
 
-        submitted_at = datetime.now(timezone.utc)
+        key = QuestionSetService.answer_key(
+            db, graded_updates.get("question_set_id") or attempt.get("question_set_id"), question_set)
+        graded = key.grade(dict(attempt.get("answers") or {}))
+        analysis = StudentService._pending_analysis(graded)
         db.test_attempts.update_one(
             {"_id": attempt_oid},
             {
                 "$set": {
-                    "status": "submitted",
-                    "score": score,
-                    "raw_score": total_jee_score,
-                    "max_score": total_questions * 4,
-                    "correct_answers": correct_answers,
-                    "incorrect_answers": incorrect_answers,
-                    "unattempted": unattempted,
-                    "partial_correct": partial_count,
-                    "total_answered": answered,
+                    **graded_updates,
+                    **graded,
                     "analysis": analysis,
-                    "auto_submitted": auto_submitted,
-                    "violation_reason": cleaned_violation_reason,
-                    "submitted_at": submitted_at,
-                    "updated_at": submitted_at,
+                    # Release the pipeline's hold now that the score is stored.
+                    "post_submit.next_run_at": datetime.now(timezone.utc),
                 }
             },
         )
+        StudentService._record_graded(db, attempt, graded, year=student.get("year"))
 
-        activity_text = f"{student.get('name', 'Student')} submitted test with score {score}%"
-        if auto_submitted:
-            activity_text = (
-                f"{student.get('name', 'Student')} was auto-submitted for leaving test screen ({score}%)"
-            )
-        ActivityService.log(
-            db,
-            text=activity_text,
-            event_type="test",
-            actor_id=str(student["_id"]),
-            actor_role="student",
-            metadata={
-                "attempt_id": attempt_id,
-                "score": score,
-                "subject": attempt.get("subject"),
-                "auto_submitted": auto_submitted,
-                "violation_reason": cleaned_violation_reason,
-            },
-        )
+        total_questions = int(graded_updates.get("total_questions")
+                              or attempt.get("total_questions") or 0) or len(question_set)
+        return {
+            "attempt_id": attempt_id,
+            "score": graded["score"],
+            "total_questions": total_questions,
+            "answered": graded["total_answered"],
+            "correct_answers": graded["correct_answers"],
+            "incorrect_answers": graded["incorrect_answers"],
+            "unattempted": graded["unattempted"],
+            "accuracy": graded["accuracy"],
+            "partial_correct": graded["partial_correct"],
+            "raw_score": graded["raw_score"],
+            "max_score": graded["max_score"],
+            "analysis": analysis,
+            "ai_feedback": analysis["message"],
+        }
+
+    @staticmethod
+    def _pending_analysis(graded: dict) -> dict:
+        # Topic analysis and AI feedback are filled in by the post-submit
+        # pipeline; the student gets the score immediately.
+        return {
+            "status": "pending",
+            "weak_areas": [],
+            "strong_areas": [],
+            "message": "Your detailed analysis is being prepared.",
+            "total_score": graded["raw_score"],
+            "max_score": graded["max_score"],
+            "partial_correct": graded["partial_correct"],
+        }
 
-        NotificationService.create_for_user(
+    @staticmethod
+    def _record_graded(db: Database, attempt: dict, graded: dict, *, year: str | None = None) -> None:
+        """Propagate a freshly graded submission to the inbox, stats, leaderboards and caches."""
+        student_id = str(attempt["student_id"])
+        TestInboxService.mark_completed(db, attempt, score=graded["score"])
+        avg_score = StudentStatsService.record_submission(
             db,
-            user_id=str(student["_id"]),
-            title="Result Ready",
-            message=f"Your result is ready. Score: {score}%",
-            notification_type="result",
+            student_id,
+            subject=attempt.get("subject"),
+            score=graded["score"],
+            submitted_at=attempt["submitted_at"],
+            year=year,
         )
+        LeaderboardService.record(db, student_id, avg_score, year=year)
 
-        test_doc = StudentService._find_test_by_id(
-            db, str(attempt.get("test_id") or ""))
-        teacher_id = str(test_doc.get("creator_id") or "") if test_doc else ""
-        if teacher_id and auto_submitted:
-            NotificationService.create_for_user(
-                db,
-                user_id=teacher_id,
-                title="Test Auto-Submitted",
-                message=(
-                    f"{student.get('name', 'Student')}'s attempt for "
-                    f"'{test_doc.get('title', 'a test')}' was auto-submitted for leaving the test screen."
-                ),
-                notification_type="test",
-            )
+        if AnswerBuffer.enabled():
+            AnswerBuffer.discard(str(attempt["_id"]))
         # Invalidate student cache so dashboard reflects the submission
         StudentService._invalidate_cache(student_id)
 
-        return {
-            "attempt_id": attempt_id,
-            "score": score,
-            "total_questions": total_questions,
-            "answered": answered,
-            "correct_answers": correct_answers,
-            "incorrect_answers": incorrect_answers,
-            "unattempted": unattempted,
-            "accuracy": accuracy,
-            "partial_correct": partial_count,
-            "raw_score": total_jee_score,
-            "max_score": max_possible,
-            "analysis": analysis,
-            "ai_feedback": analysis.get("message", ""),
-        }
-
     @staticmethod
     def result(db: Database, student: dict, attempt_id: str) -> dict:
+        return StudentService.result_entry(db, student, attempt_id)["payload"]
+
+    @staticmethod
+    def result_entry(db: Database, student: dict, attempt_id: str) -> dict:
+        """
+        Rendered result plus its ETag. Once the post-submit analysis is in,
+        a submitted attempt never changes, so the rendering is cached until
+        something (e.g. a rescore) calls ``invalidate_result``.
+        """
         student_id = str(student["_id"])
+        cache_key = StudentService._result_cache_key(student_id, attempt_id)
+        # Redis is shared by every worker, so invalidation reaches all of
+        # them; the in-process LRU is only used when Redis is not configured.
+        shared = get_redis() is not None
+        cached = cache_get(cache_key) if shared else result_cache.get(cache_key)
+        if cached:
+            return cached
+
+        payload = StudentService._render_result(db, student_id, attempt_id)
+        final = payload["analysis"].get("status") != "pending"
+        entry = {"etag": make_etag(payload), "final": final, "payload": payload}
+        if final:
+            if shared:
+                cache_set(cache_key, entry, ttl=timedelta(days=7))
+            else:
+                result_cache.set(cache_key, entry)
+        return entry
+
+    @staticmethod
+    def invalidate_result(student_id: str, attempt_id: str) -> None:
+        cache_key = StudentService._result_cache_key(student_id, attempt_id)
+        result_cache.delete(cache_key)
+        cache_delete_many([cache_key])
+
+    @staticmethod
+    def _result_cache_key(student_id: str, attempt_id: str) -> str:
+        return f"student:result:{student_id}:{attempt_id}"
+
+    @staticmethod
+    def _render_result(db: Database, student_id: str, attempt_id: str) -> dict:
         attempt_oid = parse_object_id(attempt_id, "attempt_id")
         attempt = db.test_attempts.find_one(
             {"_id": attempt_oid, "student_id": student_id, "status": "submitted"}
@@ -699,15 +614,19 @@ class StudentService:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Result not found")
 
-        answers = attempt.get("answers", {})
-        question_set = attempt.get("question_set") or []
+        answers = dict(attempt.get("answers") or {})
+        question_set = QuestionSetService.for_attempt(db, attempt)
+        # Verdicts come from the same compiled key the score came from, so
+        # multi-correct and numerical questions read as they were graded.
+        key = QuestionSetService.answer_key(db, attempt.get("question_set_id"), question_set)
+        verdicts = key.verdicts(answers)
 
         questions: list[dict] = []
-        for index, question in enumerate(question_set, start=1):
+        for index, (question, verdict) in enumerate(zip(question_set, verdicts), start=1):
             question_id = str(question.get("id") or f"q{index}")
-            selected = StudentService._normalize_answer(
-                answers.get(question_id))
-            correct_answer = int(question.get("correct", 0) or 0)
+            numerical = key.types[index - 1] == NUMERICAL_MAIN
+            selected = StudentService._result_answer(answers.get(question_id), numerical)
+            correct_answer = StudentService._result_answer(question.get("correct"), numerical)
             questions.append(
                 {
                     "question_id": question_id,
@@ -716,7 +635,8 @@ class StudentService:
                     "options": [str(option) for option in (question.get("options") or [])],
                     "selected_answer": selected,
                     "correct_answer": correct_answer,
-                    "is_correct": selected is not None and selected == correct_answer,
+                    "is_correct": verdict == CORRECT,
+                    "verdict": verdict,
                     "explanation": str(
                         question.get("explanation")
                         or "Review the concept for this question and retry a similar problem."
@@ -742,8 +662,8 @@ class StudentService:
             "accuracy": float(attempt.get("accuracy") or 0.0),
             "submitted_at": attempt.get("submitted_at", datetime.now(timezone.utc)),
             "questions": questions,
-            "analysis": attempt.get("analysis", {}),
-            "ai_feedback": attempt.get("analysis", {}).get("message", ""),
+            "analysis": attempt.get("analysis") or {},
+            "ai_feedback": (attempt.get("analysis") or {}).get("message", ""),
         }
 
     @staticmethod
@@ -754,72 +674,33 @@ class StudentService:
         if cached:
             return cached
 
-        # 1. Subject Breakdown & Mastery (Aggregation)
-        mastery_results = list(db.test_attempts.aggregate([
-            {"$match": {"student_id": student_id, "status": "submitted"}},
-            {"$group": {"_id": "$subject", "avg": {
-                "$avg": "$score"}, "count": {"$sum": 1}}}
-        ]))
-        topic_mastery = [{"topic": r["_id"] or "General", "mastery": round(
-            float(r.get("avg", 0.0) or 0.0), 1)} for r in mastery_results]
+        # 1. Subject Breakdown & Mastery
+        stats = StudentStatsService.get(db, student_id)
+        topic_mastery = StudentStatsService.subject_mastery(stats)
         if not topic_mastery:
             topic_mastery = [{"topic": "General", "mastery": 0.0}]
 
-        total_completed = sum(r.get("count", 0) for r in mastery_results)
-        overall_avg = round(sum((r.get("avg", 0.0) or 0.0) * r.get("count", 0)
-                            for r in mastery_results) / total_completed, 1) if total_completed else 0.0
-
-        # 2. Overall Rank (Optimized - Count higher scores)
-        # Calculate my average score first
-        my_avg_result = list(db.test_attempts.aggregate([
-            {"$match": {"student_id": student_id,
-                        "status": "submitted", "submitted_at": {"$ne": None}}},
-            {"$group": {"_id": None, "score": {"$avg": "$score"}}}
-        ]))
-        my_avg = float(my_avg_result[0].get(
-            "score", 0.0) or 0.0) if my_avg_result else 0.0
+        total_completed = int(stats.get("completed_tests") or 0)
+        overall_avg = round(float(stats.get("avg_score") or 0.0), 1)
 
-        # Count students with higher average score
-        # Note regarding performance: Ideally this should be a pre-calculated status on the User model
-        # or a materialized view. For now, we use a slightly better aggregation than fetching all.
+        # 2. Overall Rank
+        my_avg = float(stats.get("avg_score") or 0.0)
 
         # Determine total students (approximate active count)
         total_students = db.users.count_documents(
             {"role": "student", "status": "active"})
 
-        curr_rank = 1
-        if my_avg > 0:
-            pipeline = [
-                {"$match": {"status": "submitted", "submitted_at": {"$ne": None}}},
-                {"$group": {"_id": "$student_id", "avg_score": {"$avg": "$score"}}},
-                {"$match": {"avg_score": {"$gt": my_avg}}},
-                {"$count": "higher_rank_count"}
-            ]
-            rank_res = list(db.test_attempts.aggregate(pipeline))
-            if rank_res:
-                curr_rank = rank_res[0]["higher_rank_count"] + 1
+        position = LeaderboardService.position(db, student)
+        if my_avg > 0 and position["rank"]:
+            curr_rank = position["rank"]
         else:
             # If no score, rank is last
             curr_rank = total_students if total_students > 0 else 1
 
-        # 3. Rank History (Last 6 attempts) - Simplified
-        # We can just return the score history as a proxy for progress,
-        # or minimal mock history if real historical rank calculation is too expensive.
-        # Let's return the last 6 test scores.
-        rank_history = []
-        last_attempts = list(db.test_attempts.find(
-            {"student_id": student_id, "status": "submitted"},
-            {"submitted_at": 1, "score": 1}
-        ).sort("submitted_at", -1).limit(6))
-
-        for att in reversed(last_attempts):
-            rank_history.append({
-                "week": (att.get("submitted_at") or datetime.now(timezone.utc)).strftime("%b %d"),
-                "rank": int(round(float(att.get("score", 0.0) or 0.0)))
-            })
-
+        # 3. Rank History from the scheduled snapshot job
+        rank_history = RankSnapshotService.history(db, student_id)
         if not rank_history:
-            rank_history = [{"week": "Now", "rank": 0}]
+            rank_history = [{"week": "Now", "rank": curr_rank, "percentile": position["percentile"]}]
 
         result = {
             "overall_rank": curr_rank,
@@ -1038,6 +919,7 @@ class StudentService:
                 detail="Notification not found",
             )
 
+        VersionService.bump(db, VersionService.notifications(str(user["_id"])))
         updated = db.notifications.find_one({"_id": notification_oid})
         assert updated is not None
         return serialize_id(updated)
@@ -1056,6 +938,8 @@ class StudentService:
                 }
             },
         )
+        if result.modified_count:
+            VersionService.bump(db, VersionService.notifications(str(user["_id"])))
         return {"updated_count": int(result.modified_count)}
 
     @staticmethod
@@ -1228,7 +1112,7 @@ class StudentService:
                             ("..." if len(suggested) > 30 else "")
                         db.chat_sessions.update_one(
                             {"_id": parse_object_id(session_id, "session_id")},
-                            {"$set": {"title": title}},
+                            {"$set": {"title": title, "updated_at": datetime.now(timezone.utc)}},
                         )
 
         doc = {
@@ -1266,24 +1150,24 @@ class StudentService:
         if result.deleted_count > 0:
             # Delete associated messages
             db.chat_messages.delete_many({"session_id": session_id})
+            SyncService.record_deletions(db, "chat_sessions", str(student["_id"]), [session_id])
             return True
         return False
 
     @staticmethod
-    def _public_question_set(question_set: list[dict]) -> list[dict]:
-        payload: list[dict] = []
-        for index, question in enumerate(question_set, start=1):
-            payload.append(
-                {
-                    "id": str(question.get("id") or f"q{index}"),
-                    "subject": str(question.get("subject") or "General"),
-                    "text": str(question.get("text") or f"Question {index}"),
-                    "options": [str(option) for option in (question.get("options") or [])],
-                    "topic": str(question.get("topic") or "General"),
-                    "subtopic": str(question.get("subtopic") or "General"),
-                }
-            )
-        return payload
+    def _result_answer(value: object, numerical: bool) -> int | float | list[int] | None:
+        """An answer or key as the result page shows it: an option, a list of options or a number."""
+        if numerical:
+            try:
+                number = float(value)  # type: ignore[arg-type]
+            except (TypeError, ValueError):
+                return None
+            if isinstance(value, bool) or not math.isfinite(number):
+                return None
+            return int(number) if number.is_integer() else number
+        if isinstance(value, list):
+            return [option for option in map(StudentService._normalize_answer, value) if option is not None]
+        return StudentService._normalize_answer(value)
 
     @staticmethod
     def _normalize_answer(value: object) -> int | None:
@@ -1305,26 +1189,13 @@ class StudentService:
             return None
         return db.tests.find_one({"_id": ObjectId(test_id)})
 
-    @staticmethod
-    def _student_class_ids(db: Database, student_id: str) -> list[str]:
-        candidate_ids: list[object] = [student_id]
-        if ObjectId.is_valid(student_id):
-            candidate_ids.append(ObjectId(student_id))
-
-        class_docs = db.classes.find(
-            {"student_ids": {"$in": candidate_ids}},
-            {"_id": 1},
-        )
-        return [str(doc["_id"]) for doc in class_docs]
-
     @staticmethod
     def _is_test_assigned_to_student(db: Database, student: dict, test: dict) -> bool:
         status_value = str(test.get("status") or "").lower()
         if status_value not in {"assigned", "active"}:
             return False
 
-        student_id = str(student["_id"])
-        class_ids = set(StudentService._student_class_ids(db, student_id))
+        class_ids = set(ClassMembershipService.class_ids(db, student))
         test_class_ids = {str(class_id) for class_id in test.get(
             "assigned_to_class_ids", []) if class_id}
         if test_class_ids:
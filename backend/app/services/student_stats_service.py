@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from datetime import date, datetime, timezone
+from uuid import uuid4
+
+from bson import ObjectId
+from pymongo.database import Database
+
+# Optimistic writes retried before falling back to a rebuild from history.
+_MAX_CAS_ATTEMPTS = 5
+
+
+class StudentStatsService:
+    """
+    Incrementally maintained per-student totals (``student_stats``, one
+    document per student keyed by student id).
+
+    The submit path applies each new score with ``$inc``/``$set`` so the home
+    screen and progress views read one document instead of aggregating the
+    student's whole attempt history. The average and streak are written in
+    the same update as the counters, conditional on the ``revision`` that was
+    read, so concurrent submits retry instead of overwriting each other. ``rebuild`` recomputes a document from
+    ``test_attempts`` and is used lazily and by the reconciliation script.
+    The student's ``year`` is copied in so year leaderboards can filter on it.
+    """
+
+    @staticmethod
+    def get(db: Database, student_id: str) -> dict:
+        stats = db.student_stats.find_one({"_id": student_id})
+        if stats is None:
+            stats = StudentStatsService.rebuild(db, student_id)
+        return stats
+
+    @staticmethod
+    def record_submission(
+        db: Database,
+        student_id: str,
+        *,
+        subject: str | None,
+        score: float,
+        submitted_at: datetime,
+        year: str | None = None,
+    ) -> float:
+        """Apply one submitted score and return the student's new average."""
+        day = StudentStatsService._day(submitted_at)
+        subject_key = StudentStatsService._subject_key(subject)
+        for _ in range(_MAX_CAS_ATTEMPTS):
+            before = db.student_stats.find_one({"_id": student_id})
+            if before is None:
+                break
+            completed = int(before.get("completed_tests") or 0) + 1
+            score_sum = float(before.get("score_sum") or 0.0) + score
+            avg_score = round(score_sum / completed, 4)
+            streak = StudentStatsService._next_streak(
+                before.get("last_submission_day"), int(before.get("current_streak") or 0), day
+            )
+            if StudentStatsService._write_if_unchanged(
+                db,
+                before,
+                {
+                    "$inc": {
+                        "completed_tests": 1,
+                        "score_sum": score,
+                        f"subjects.{subject_key}.count": 1,
+                        f"subjects.{subject_key}.score_sum": score,
+                    },
+                    "$max": {"last_submission_day": day.isoformat()},
+                    "$set": {
+                        "avg_score": avg_score,
+                        "current_streak": streak,
+                        "last_submitted_at": submitted_at,
+                        "updated_at": datetime.now(timezone.utc),
+                        **({"year": year} if year else {}),
+                    },
+                },
+            ):
+                return avg_score
+        # First write for this student, or heavy contention: derive from
+        # history, which already includes this submission.
+        return float(StudentStatsService.rebuild(db, student_id)["avg_score"])
+
+    @staticmethod
+    def apply_rescore(db: Database, student_id: str, deltas: dict[str | None, float]) -> float:
+        """Shift score sums by per-subject score changes (e.g. a rescore) and return the new average."""
+        increments = {"score_sum": sum(deltas.values())}
+        for subject, delta in deltas.items():
+            increments[f"subjects.{StudentStatsService._subject_key(subject)}.score_sum"] = delta
+        for _ in range(_MAX_CAS_ATTEMPTS):
+            before = db.student_stats.find_one({"_id": student_id})
+            if before is None:
+                break
+            completed = int(before.get("completed_tests") or 0)
+            score_sum = float(before.get("score_sum") or 0.0) + increments["score_sum"]
+            avg_score = round(score_sum / completed, 4) if completed else 0.0
+            if StudentStatsService._write_if_unchanged(
+                db,
+                before,
+                {"$inc": increments, "$set": {"avg_score": avg_score, "updated_at": datetime.now(timezone.utc)}},
+            ):
+                return avg_score
+        # Derived from history, which already holds the new scores.
+        return float(StudentStatsService.rebuild(db, student_id)["avg_score"])
+
+    @staticmethod
+    def streak(stats: dict, today: date | None = None) -> int:
+        """Current streak as of today: a streak ends once a whole day passes without a submission."""
+        last_day = stats.get("last_submission_day")
+        if not last_day:
+            return 0
+        today = today or datetime.now(timezone.utc).date()
+        if (today - date.fromisoformat(last_day)).days > 1:
+            return 0
+        return int(stats.get("current_streak") or 0)
+
+    @staticmethod
+    def subject_mastery(stats: dict) -> list[dict]:
+        mastery = []
+        for subject, values in (stats.get("subjects") or {}).items():
+            count = int(values.get("count") or 0)
+            if count:
+                mastery.append(
+                    {"topic": subject, "mastery": round(float(values.get("score_sum") or 0.0) / count, 1)}
+                )
+        return mastery
+
+    @staticmethod
+    def rebuild(db: Database, student_id: str) -> dict:
+        """Recompute one student's stats from their submitted attempts."""
+        completed = 0
+        score_sum = 0.0
+        subjects: dict[str, dict] = {}
+        days: set[date] = set()
+        last_submitted_at = None
+        for attempt in db.test_attempts.find(
+            {"student_id": student_id, "status": "submitted"},
+            {"subject": 1, "score": 1, "submitted_at": 1},
+        ):
+            score = float(attempt.get("score") or 0.0)
+            completed += 1
+            score_sum += score
+            bucket = subjects.setdefault(
+                StudentStatsService._subject_key(attempt.get("subject")),
+                {"count": 0, "score_sum": 0.0},
+            )
+            bucket["count"] += 1
+            bucket["score_sum"] += score
+            submitted_at = attempt.get("submitted_at")
+            if isinstance(submitted_at, datetime):
+                days.add(StudentStatsService._day(submitted_at))
+                if last_submitted_at is None or submitted_at > last_submitted_at:
+                    last_submitted_at = submitted_at
+
+        ordered_days = sorted(days, reverse=True)
+        streak = 1 if ordered_days else 0
+        for newer, older in zip(ordered_days, ordered_days[1:]):
+            if (newer - older).days != 1:
+                break
+            streak += 1
+
+        user = (
+            db.users.find_one({"_id": ObjectId(student_id)}, {"year": 1})
+            if ObjectId.is_valid(student_id)
+            else None
+        )
+        stats = {
+            "_id": student_id,
+            "year": (user or {}).get("year"),
+            "completed_tests": completed,
+            "score_sum": score_sum,
+            "avg_score": round(score_sum / completed, 4) if completed else 0.0,
+            "subjects": subjects,
+            "last_submission_day": ordered_days[0].isoformat() if ordered_days else None,
+            "last_submitted_at": last_submitted_at,
+            "current_streak": streak,
+            "revision": uuid4().hex,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        db.student_stats.replace_one({"_id": student_id}, stats, upsert=True)
+        return stats
+
+    @staticmethod
+    def _write_if_unchanged(db: Database, before: dict, update: dict) -> bool:
+        """
+        Apply ``update`` only if the document is still the one ``before`` was
+        read from, so counters and the values derived from them (average,
+        streak) always change together. Every write rotates ``revision``.
+        """
+        update.setdefault("$set", {})["revision"] = uuid4().hex
+        result = db.student_stats.update_one({"_id": before["_id"], "revision": before.get("revision")}, update)
+        return bool(result.modified_count)
+
+    @staticmethod
+    def _next_streak(last_day: str | None, current: int, day: date) -> int:
+        if not last_day:
+            return 1
+        gap = (day - date.fromisoformat(last_day)).days
+        if gap <= 0:
+            return max(current, 1)
+        if gap == 1:
+            return current + 1
+        return 1
+
+    @staticmethod
+    def _day(value: datetime) -> date:
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).date()
+
+    @staticmethod
+    def _subject_key(subject: str | None) -> str:
+        # Field names cannot contain dots or start with '$'.
+        return (str(subject or "General").replace(".", "_").lstrip("$")) or "General"
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo.database import Database
+
+from app.core.config import get_settings
+from app.utils.mongo import serialize_id
+
+# Tombstones expire after this long (TTL index in app/db/indexes.py); clients
+# whose deletion watermark is older must resync the collection from scratch.
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+# Chat sessions are deleted (with tombstones) this long after creation, a day
+# ahead of the 30-day TTL index that remains as a backstop.
+CHAT_SESSION_RETENTION = timedelta(days=29)
+
+COLLECTIONS = ("tests", "notifications", "library", "chat_sessions")
+
+
+class SyncService:
+    """
+    Incremental "changes since" feed for the mobile client.
+
+    Each synced collection is read in ``(updated_at, _id)`` order from an
+    opaque per-collection watermark, so a background sync reads only what
+    changed. Hard deletes leave a tombstone in ``sync_tombstones``; library
+    items that are no longer approved are reported as deleted. Rows newer than
+    ``sync_settle_seconds`` are held back until the next sync so a write that
+    commits late with an older timestamp cannot slip behind a watermark.
+
+    TTL expiry removes rows without a tombstone, so chat sessions are expired
+    by ``expire_chat_sessions`` before their TTL index would drop them.
+    """
+
+    @staticmethod
+    def changes(db: Database, student: dict, watermarks: dict[str, str | None], *, limit: int = 100) -> dict:
+        unknown = sorted(set(watermarks) - set(COLLECTIONS))
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown sync collection(s): {', '.join(unknown)}",
+            )
+
+        # Resolve sources first: the tests source may build the inbox, and
+        # those rows must fall inside this sync's horizon.
+        sources = {name: SyncService._source(db, student, name) for name in watermarks}
+        now = datetime.now(timezone.utc)
+        horizon = now - timedelta(seconds=max(0.0, get_settings().sync_settle_seconds))
+        return {
+            "server_time": now,
+            "collections": {
+                name: SyncService._collection_changes(
+                    db, student, name, sources[name], watermark, horizon, limit
+                )
+                for name, watermark in watermarks.items()
+            },
+        }
+
+    @staticmethod
+    def record_deletions(db: Database, collection: str, owner_id: str, doc_ids: list[str]) -> None:
+        if not doc_ids:
+            return
+        now = datetime.now(timezone.utc)
+        db.sync_tombstones.insert_many(
+            [
+                {"collection": collection, "owner_id": owner_id, "doc_id": str(doc_id), "deleted_at": now}
+                for doc_id in doc_ids
+            ]
+        )
+
+    @staticmethod
+    def expire_chat_sessions(db: Database, *, now: datetime | None = None, limit: int = 1000) -> int:
+        """Delete chat sessions past ``CHAT_SESSION_RETENTION`` with their messages. Returns how many."""
+        cutoff = (now or datetime.now(timezone.utc)) - CHAT_SESSION_RETENTION
+        expired = 0
+        while True:
+            sessions = list(
+                db.chat_sessions.find({"created_at": {"$lt": cutoff}}, {"student_id": 1}).limit(limit)
+            )
+            if not sessions:
+                return expired
+            session_ids = [session["_id"] for session in sessions]
+            db.chat_sessions.delete_many({"_id": {"$in": session_ids}})
+            db.chat_messages.delete_many({"session_id": {"$in": [str(session_id) for session_id in session_ids]}})
+            by_owner: dict[str, list[str]] = {}
+            for session in sessions:
+                by_owner.setdefault(str(session.get("student_id")), []).append(str(session["_id"]))
+            for owner_id, doc_ids in by_owner.items():
+                SyncService.record_deletions(db, "chat_sessions", owner_id, doc_ids)
+            expired += len(sessions)
+
+    @staticmethod
+    async def run_expiry_worker(db: Database) -> None:
+        """Periodically expire old chat sessions so synced clients see them deleted."""
+        interval = max(1.0, float(get_settings().chat_expiry_sweep_seconds))
+        while True:
+            try:
+                await asyncio.to_thread(SyncService.expire_chat_sessions, db)
+            except Exception as exc:
+                print(f"Chat expiry worker error: {exc}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _collection_changes(
+        db: Database,
+        student: dict,
+        name: str,
+        source: dict,
+        watermark: str | None,
+        horizon: datetime,
+        limit: int,
+    ) -> dict:
+        position, deleted_since = SyncService._decode_watermark(watermark)
+        reset = deleted_since is not None and deleted_since < horizon - TOMBSTONE_RETENTION
+        if watermark is None or reset:
+            # Full (re)sync: every live row, then deletions from now on.
+            position, deleted_since = None, horizon
+
+        query: dict = {"$and": [source["query"], {"updated_at": {"$lte": horizon}}]}
+        if position is not None:
+            updated_at, row_id = position
+            row_id = ObjectId(row_id) if source["object_ids"] and ObjectId.is_valid(row_id) else row_id
+            query["$and"].append(
+                {
+                    "$or": [
+                        {"updated_at": {"$gt": updated_at}},
+                        {"updated_at": updated_at, "_id": {"$gt": row_id}},
+                    ]
+                }
+            )
+
+        rows = list(source["collection"].find(query).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            last = rows[-1]
+            position = (SyncService._as_utc(last.get("updated_at")), str(last["_id"]))
+
+        hidden = source["hidden"](rows) if source["hidden"] else set()
+        items = [source["payload"](row) for row in rows if row["_id"] not in hidden]
+        deleted = [source["id"](row) for row in rows if row["_id"] in hidden]
+
+        tombstones = list(
+            db.sync_tombstones.find(
+                {
+                    "collection": name,
+                    "owner_id": str(student["_id"]),
+                    "deleted_at": {"$gt": deleted_since, "$lte": horizon},
+                },
+                {"doc_id": 1},
+            )
+        )
+        deleted.extend(str(tombstone["doc_id"]) for tombstone in tombstones)
+
+        return {
+            "items": items,
+            "deleted": list(dict.fromkeys(deleted)),
+            # Deletions are read up to the horizon in one go, so their
+            # watermark only advances once the row pages are drained.
+            "watermark": SyncService._encode_watermark(position, deleted_since if has_more else horizon),
+            "has_more": has_more,
+            "reset": reset,
+        }
+
+    @staticmethod
+    def _source(db: Database, student: dict, name: str) -> dict:
+        student_id = str(student["_id"])
+        if name == "tests":
+            from app.services.test_inbox_service import TestInboxService
+
+            TestInboxService.ensure_built(db, student)
+            return {
+                "collection": db.student_test_inbox,
+                "query": {"student_id": student_id},
+                "object_ids": False,
+                "hidden": None,
+                "payload": TestInboxService._row_payload,
+                "id": lambda row: row["test_id"],
+            }
+        if name == "notifications":
+            return {
+                "collection": db.notifications,
+                "query": {"user_id": student_id},
+                "object_ids": True,
+                "hidden": None,
+                "payload": serialize_id,
+                "id": lambda row: str(row["_id"]),
+            }
+        if name == "chat_sessions":
+            return {
+                "collection": db.chat_sessions,
+                "query": {"student_id": student_id},
+                "object_ids": True,
+                "hidden": None,
+                "payload": serialize_id,
+                "id": lambda row: str(row["_id"]),
+            }
+
+        # Library: same visibility rules as StudentService.list_library;
+        # rows that stopped being visible are reported as deleted.
+        def hidden(rows: list[dict]) -> set:
+            with_files = {
+                str(doc["library_item_id"])
+                for doc in db.library_files.find(
+                    {"library_item_id": {"$in": [str(row["_id"]) for row in rows] + [row["_id"] for row in rows]}},
+                    {"library_item_id": 1},
+                )
+            }
+            return {
+                row["_id"]
+                for row in rows
+                if row.get("status") != "approved" or str(row["_id"]) not in with_files
+            }
+
+        return {
+            "collection": db.library_items,
+            "query": {"year": student.get("year")},
+            "object_ids": True,
+            "hidden": hidden,
+            "payload": serialize_id,
+            "id": lambda row: str(row["_id"]),
+        }
+
+    @staticmethod
+    def _encode_watermark(position: tuple[datetime, str] | None, deleted_since: datetime) -> str:
+        raw = {
+            "t": SyncService._micros(position[0]) if position else None,
+            "i": position[1] if position else None,
+            "d": SyncService._micros(deleted_since),
+        }
+        return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_watermark(watermark: str | None) -> tuple[tuple[datetime, str] | None, datetime | None]:
+        if watermark is None:
+            return None, None
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(watermark.encode("ascii")).decode("utf-8"))
+            position = None
+            if raw.get("t") is not None:
+                position = (SyncService._from_micros(int(raw["t"])), str(raw["i"]))
+            return position, SyncService._from_micros(int(raw["d"]))
+        except Exception as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid sync watermark",
+            ) from exc
+
+    @staticmethod
+    def _as_utc(value: object) -> datetime:
+        if not isinstance(value, datetime):
+            return datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+    @staticmethod
+    def _micros(value: datetime) -> int:
+        # Microseconds keep the watermark exact for any stored precision.
+        value = SyncService._as_utc(value)
+        return (value - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(microseconds=1)
+
+    @staticmethod
+    def _from_micros(value: int) -> datetime:
+        return datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=value)
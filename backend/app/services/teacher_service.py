@@ -10,6 +10,7 @@ from pymongo.database import Database
 from app.core.cache import cache_get, cache_set
 from app.core.config import get_settings
 from app.schemas.teacher import (
+    AnswerKeyCorrectionRequest,
     AssignPaperRequest,
     LessonPlanCreateRequest,
     LessonPlanUpdateRequest,
@@ -20,8 +21,15 @@ from app.schemas.teacher import (
     TeacherStudentAttemptResponse,
 )
 from app.services.activity_service import ActivityService
+from app.services.class_membership_service import ClassMembershipService
+from app.services.item_stats_service import ItemStatsService
+from app.services.leaderboard_service import LeaderboardService
 from app.services.notification_service import NotificationService
 from app.services.question_bank import build_question_set_with_source
+from app.services.question_set_service import QuestionSetService
+from app.services.rescore_service import RescoreService
+from app.services.test_inbox_service import TestInboxService
+from app.services.version_service import VersionService
 from app.utils.mongo import parse_object_id, serialize_id
 
 
@@ -125,6 +133,7 @@ class TeacherService:
         }
         result = db.tests.insert_one(doc)
         doc["_id"] = result.inserted_id
+        VersionService.bump(db, VersionService.papers(str(teacher["_id"])))
 
         teacher_name = teacher.get("name", "Teacher")
         ActivityService.log(
@@ -169,6 +178,10 @@ class TeacherService:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, detail="No updates provided")
 
+        now = datetime.now(timezone.utc)
+        # Students can start a live paper at any moment, so its question set
+        # is validated and stored before anything is written to the paper.
+        live = str(updates.get("status", existing.get("status")) or "").lower() in {"assigned", "active"}
         if "questions" in updates or "difficulty" in updates:
             question_count = int(updates.get(
                 "questions", existing.get("questions", 0) or 0))
@@ -187,18 +200,35 @@ class TeacherService:
                         status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                         detail="AI question generation failed. Please retry.",
                     )
+            updates["question_set_id"] = None
+            updates["question_set_ready_at"] = None
+            if live:
+                question_set = QuestionSetService.normalize(question_set, subject=subject)
+                try:
+                    QuestionSetService.validate(question_set)
+                except ValueError as exc:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail=f"Paper questions are not ready: {exc}",
+                    ) from exc
+                updates["question_set_id"] = QuestionSetService.store(db, question_set, test_id=str(oid))
+                updates["question_set_ready_at"] = now
             updates["question_set"] = question_set
             updates["question_source"] = question_source
+        elif live:
+            await TeacherService._materialize_question_set(db, {**existing, **updates})
 
-        updates["updated_at"] = datetime.now(timezone.utc)
+        updates["updated_at"] = now
 
         db.tests.update_one(
             {"_id": oid, "creator_id": str(teacher["_id"])},
             {"$set": updates},
         )
+        VersionService.bump(db, VersionService.papers(str(teacher["_id"])))
 
         updated = db.tests.find_one({"_id": oid})
         assert updated is not None
+        TestInboxService.refresh_test(db, updated)
 
         teacher_name = teacher.get("name", "Teacher")
         ActivityService.log(
@@ -213,7 +243,115 @@ class TeacherService:
         return TeacherService._paper_payload(updated, include_question_set=True)
 
     @staticmethod
-    def assign_paper(
+    def correct_answer_key(
+        db: Database,
+        teacher: dict,
+        paper_id: str,
+        payload: AnswerKeyCorrectionRequest,
+    ) -> dict:
+        """
+        Fix answer keys on a paper's question set and queue a rescore of
+        the submitted attempts on that set. The corrected set is stored as a
+        new version; in-progress attempts on the old set switch to it
+        straight away (same questions and options, only the key differs).
+        """
+        oid = parse_object_id(paper_id, "paper_id")
+        paper = db.tests.find_one(
+            {"_id": oid, "creator_id": str(teacher["_id"])})
+        if not paper:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Paper not found")
+
+        # Attempts of a paper that predates the shared store embed its set.
+        legacy = not paper.get("question_set_id")
+        current_id = QuestionSetService.reference(db, paper)
+        question_set = QuestionSetService.get(db, current_id) if current_id else []
+        if not question_set:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Paper questions are not ready",
+            )
+
+        corrected = [dict(question) for question in question_set]
+        by_id = {str(question.get("id")): question for question in corrected}
+        for correction in payload.corrections:
+            question = by_id.get(correction.question_id)
+            if question is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Unknown question '{correction.question_id}'",
+                )
+            question["correct"] = correction.correct
+        try:
+            QuestionSetService.validate(corrected)
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+
+        question_set_id = QuestionSetService.store(db, corrected, test_id=str(oid))
+        if question_set_id == current_id:
+            latest = RescoreService.latest(db, str(oid))
+            if latest is not None and latest["question_set_id"] == question_set_id:
+                return RescoreService.payload(latest)
+
+        now = datetime.now(timezone.utc)
+        db.tests.update_one(
+            {"_id": oid},
+            {"$set": {"question_set": corrected, "question_set_id": question_set_id, "updated_at": now}},
+        )
+        db.test_attempts.update_many(
+            {"test_id": str(oid), "status": "in_progress", "question_set_id": current_id},
+            {"$set": {"question_set_id": question_set_id}},
+        )
+        VersionService.bump(db, VersionService.papers(str(teacher["_id"])))
+        job = RescoreService.create(
+            db,
+            test_id=str(oid),
+            question_set_id=question_set_id,
+            source_set_ids=[current_id, None] if legacy else [current_id],
+            requested_by=str(teacher["_id"]),
+        )
+
+        ActivityService.log(
+            db,
+            text=f"{teacher.get('name', 'Teacher')} corrected the answer key of '{paper.get('title', 'Untitled')}'",
+            event_type="paper",
+            actor_id=str(teacher["_id"]),
+            actor_role="teacher",
+            metadata={
+                "paper_id": str(oid),
+                "questions": [correction.question_id for correction in payload.corrections],
+                "rescore_job_id": str(job["_id"]),
+            },
+        )
+        return RescoreService.payload(job)
+
+    @staticmethod
+    def rescore_status(db: Database, teacher: dict, paper_id: str) -> dict:
+        oid = parse_object_id(paper_id, "paper_id")
+        if not db.tests.find_one({"_id": oid, "creator_id": str(teacher["_id"])}, {"_id": 1}):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Paper not found")
+        job = RescoreService.latest(db, str(oid))
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="No rescore for this paper")
+        return RescoreService.payload(job)
+
+    @staticmethod
+    def item_analysis(db: Database, teacher: dict, paper_id: str) -> dict:
+        """Per-question statistics, read from the incrementally kept ``test_item_stats`` document."""
+        oid = parse_object_id(paper_id, "paper_id")
+        paper = db.tests.find_one(
+            {"_id": oid, "creator_id": str(teacher["_id"])}, {"question_set_id": 1})
+        if not paper:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Paper not found")
+        question_set = QuestionSetService.get(db, str(paper["question_set_id"])) if paper.get("question_set_id") else []
+        return ItemStatsService.analysis(db, str(oid), question_set)
+
+    @staticmethod
+    async def assign_paper(
         db: Database,
         teacher: dict,
         paper_id: str,
@@ -256,6 +394,10 @@ class TeacherService:
         students = len(
             unique_student_ids) if unique_student_ids else fallback_students
 
+        # Students must never generate questions inside start_test, so the
+        # question set is built and validated before the paper goes live.
+        await TeacherService._materialize_question_set(db, paper)
+
         db.tests.update_one(
             {"_id": oid},
             {
@@ -268,9 +410,11 @@ class TeacherService:
                 }
             },
         )
+        VersionService.bump(db, VersionService.papers(str(teacher["_id"])))
 
         updated = db.tests.find_one({"_id": oid})
         assert updated is not None
+        TestInboxService.add_test(db, updated, unique_student_ids)
 
         teacher_name = teacher.get("name", "Teacher")
         ActivityService.log(
@@ -440,6 +584,13 @@ class TeacherService:
         updated = db.classes.find_one({"_id": oid})
         assert updated is not None
 
+        previous_ids = {str(student_id) for student_id in cls.get("student_ids", [])}
+        added = [sid for sid in valid_student_ids if sid not in previous_ids]
+        removed = sorted(previous_ids - set(valid_student_ids))
+        ClassMembershipService.apply(db, str(oid), added=added, removed=removed)
+        TestInboxService.sync_class_membership(db, str(oid), added=added, removed=removed)
+        LeaderboardService.sync_class(db, str(oid), added=added, removed=removed)
+
         teacher_name = teacher.get("name", "Teacher")
         ActivityService.log(
             db,
@@ -792,12 +943,22 @@ class TeacherService:
 
             if test_id:
                 test = db.tests.find_one(
-                    {"_id": parse_object_id(test_id, "test_id")})
+                    {"_id": parse_object_id(test_id, "test_id")},
+                    {"title": 1, "question_set_id": 1},
+                )
                 if test:
                     test_title = test.get("title", "Untitled")
 
-                    # Build Question Map
-                    q_map = {q["id"]: q for q in test.get("question_set", [])}
+                    # Grade against the set the student actually sat, shared
+                    # across attempts; fall back to the paper's current set.
+                    question_set = QuestionSetService.for_attempt(db, attempt)
+                    if not question_set and test.get("question_set_id"):
+                        question_set = QuestionSetService.get(
+                            db, str(test["question_set_id"]))
+                    elif not question_set:
+                        legacy = db.tests.find_one(
+                            {"_id": test["_id"]}, {"question_set": 1}) or {}
+                        question_set = legacy.get("question_set") or []
 
                     # Answers
                     correct_answers_ids = attempt.get("correct_answers", [])
@@ -822,7 +983,7 @@ class TeacherService:
                     time_spent_map = attempt.get(
                         "time_spent", {})  # q_id -> seconds
 
-                    for q in test.get("question_set", []):
+                    for q in question_set:
                         qid = q["id"]
                         selected_idx = student_answers.get(qid)
                         correct_idx = q.get("correct")
@@ -869,6 +1030,21 @@ class TeacherService:
 
         return results
 
+    @staticmethod
+    async def _materialize_question_set(db: Database, paper: dict) -> None:
+        try:
+            await QuestionSetService.materialize(db, paper)
+        except RuntimeError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(exc),
+            ) from exc
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Paper questions are not ready: {exc}",
+            ) from exc
+
     @staticmethod
     def _should_require_ai_generation() -> bool:
         settings = get_settings()
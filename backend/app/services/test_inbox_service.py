@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from app.services.class_membership_service import ClassMembershipService
+from app.services.sync_service import SyncService
+from app.services.version_service import VersionService
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_DISPLAY_FIELDS = ("title", "subject", "difficulty", "questions", "duration", "year")
+# Paper statuses students can see and start.
+_VISIBLE_STATUSES = ("assigned", "active")
+
+
+class TestInboxService:
+    """
+    Per-student index of assigned and completed tests (``student_test_inbox``).
+
+    One row per (student, test), keyed ``{student_id}:{test_id}``, carrying
+    everything the test list renders. Rows are written when a paper is
+    assigned, edited or withdrawn, when class membership changes and when an
+    attempt is submitted, so listing a page is a single indexed range read
+    ordered by ``(sort_key, _id)`` descending, where ``sort_key`` is the
+    test's creation time in epoch milliseconds.
+    """
+
+    @staticmethod
+    def list_page(
+        db: Database,
+        student: dict,
+        *,
+        status_filter: str | None = None,
+        subject: str | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+    ) -> dict:
+        TestInboxService.ensure_built(db, student)
+        query = TestInboxService._query(str(student["_id"]), status_filter, subject)
+        if cursor:
+            sort_key, row_id = TestInboxService._decode_cursor(cursor)
+            query["$or"] = [
+                {"sort_key": {"$lt": sort_key}},
+                {"sort_key": sort_key, "_id": {"$lt": row_id}},
+            ]
+
+        rows = list(
+            db.student_test_inbox.find(query)
+            .sort([("sort_key", -1), ("_id", -1)])
+            .limit(limit + 1)
+        )
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = TestInboxService._encode_cursor(rows[-1])
+        return {
+            "items": [TestInboxService._row_payload(row) for row in rows],
+            "next_cursor": next_cursor,
+        }
+
+    @staticmethod
+    def list_all(
+        db: Database,
+        student: dict,
+        *,
+        status_filter: str | None = None,
+        subject: str | None = None,
+    ) -> list[dict]:
+        TestInboxService.ensure_built(db, student)
+        rows = db.student_test_inbox.find(
+            TestInboxService._query(str(student["_id"]), status_filter, subject)
+        ).sort([("sort_key", -1), ("_id", -1)])
+        return [TestInboxService._row_payload(row) for row in rows]
+
+    @staticmethod
+    def add_test(db: Database, test: dict, student_ids: list[str]) -> None:
+        """Add an assigned test to each student's inbox, keeping existing progress."""
+        if not student_ids:
+            return
+        now = datetime.now(timezone.utc)
+        fields = TestInboxService._test_fields(test)
+        db.student_test_inbox.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": f"{student_id}:{test['_id']}"},
+                    {
+                        "$set": {**fields, "updated_at": now},
+                        "$setOnInsert": {
+                            "student_id": student_id,
+                            "test_id": str(test["_id"]),
+                            "status": "assigned",
+                            "score": None,
+                            "attempt_id": None,
+                        },
+                    },
+                    upsert=True,
+                )
+                for student_id in dict.fromkeys(student_ids)
+            ],
+            ordered=False,
+        )
+        VersionService.bump(db, *(VersionService.student(student_id) for student_id in student_ids))
+
+    @staticmethod
+    def refresh_test(db: Database, test: dict) -> None:
+        """
+        Propagate a paper's display fields (title, duration, ...) and its
+        visibility to every inbox row. A paper moved back to draft or archived
+        leaves the students' lists; completed rows stay as result history.
+        """
+        test_id = str(test["_id"])
+        if str(test.get("status") or "").lower() not in _VISIBLE_STATUSES:
+            query = {"test_id": test_id, "status": "assigned"}
+            hidden = db.student_test_inbox.distinct("student_id", query)
+            if hidden:
+                db.student_test_inbox.delete_many(query)
+                for student_id in hidden:
+                    SyncService.record_deletions(db, "tests", student_id, [test_id])
+                VersionService.bump(db, *(VersionService.student(student_id) for student_id in hidden))
+        elif test.get("assigned_to_class_ids"):
+            # Assigned again: rows removed while it was hidden come back.
+            class_oids = [
+                ObjectId(class_id) for class_id in test["assigned_to_class_ids"] if ObjectId.is_valid(str(class_id))
+            ]
+            student_ids = [
+                str(student_id)
+                for cls in db.classes.find({"_id": {"$in": class_oids}}, {"student_ids": 1})
+                for student_id in cls.get("student_ids") or []
+            ]
+            TestInboxService.add_test(db, test, student_ids)
+
+        result = db.student_test_inbox.update_many(
+            {"test_id": test_id},
+            {"$set": {**TestInboxService._test_fields(test), "updated_at": datetime.now(timezone.utc)}},
+        )
+        if result.modified_count:
+            student_ids = db.student_test_inbox.distinct("student_id", {"test_id": test_id})
+            VersionService.bump(db, *(VersionService.student(student_id) for student_id in student_ids))
+
+    @staticmethod
+    def mark_completed(db: Database, attempt: dict, *, score: float | None) -> None:
+        student_id = str(attempt["student_id"])
+        test_id = str(attempt.get("test_id") or "")
+        updates = {
+            "status": "completed",
+            "score": score,
+            "attempt_id": str(attempt["_id"]),
+            "updated_at": datetime.now(timezone.utc),
+        }
+        result = db.student_test_inbox.update_one(
+            {"_id": f"{student_id}:{test_id}"}, {"$set": updates}
+        )
+        VersionService.bump(db, VersionService.student(student_id))
+        if result.matched_count or not ObjectId.is_valid(test_id):
+            return
+
+        # No row yet (e.g. legacy year-wide assignment): create it with display fields.
+        test = db.tests.find_one({"_id": ObjectId(test_id)}, {"question_set": 0})
+        if not test:
+            return
+        db.student_test_inbox.update_one(
+            {"_id": f"{student_id}:{test_id}"},
+            {
+                "$set": {**TestInboxService._test_fields(test), **updates},
+                "$setOnInsert": {"student_id": student_id, "test_id": test_id},
+            },
+            upsert=True,
+        )
+
+    @staticmethod
+    def sync_class_membership(
+        db: Database,
+        class_id: str,
+        *,
+        added: list[str],
+        removed: list[str],
+    ) -> None:
+        """Reflect students joining or leaving a class in their inboxes."""
+        class_tests = list(
+            db.tests.find(
+                {"status": {"$in": ["assigned", "active"]}, "assigned_to_class_ids": class_id},
+                {"question_set": 0},
+            )
+        )
+        if not class_tests:
+            return
+
+        for test in class_tests:
+            TestInboxService.add_test(db, test, added)
+
+        for student_id in removed:
+            other_class_ids = set(ClassMembershipService.class_ids_by_id(db, student_id)) - {class_id}
+            unreachable = [
+                f"{student_id}:{test['_id']}"
+                for test in class_tests
+                if not other_class_ids.intersection(test.get("assigned_to_class_ids") or [])
+            ]
+            if unreachable:
+                # Completed rows stay: the student keeps their result history.
+                query = {"_id": {"$in": unreachable}, "status": "assigned"}
+                gone = db.student_test_inbox.distinct("test_id", query)
+                db.student_test_inbox.delete_many(query)
+                SyncService.record_deletions(db, "tests", student_id, gone)
+        VersionService.bump(db, *(VersionService.student(student_id) for student_id in removed))
+
+    @staticmethod
+    def ensure_built(db: Database, student: dict) -> None:
+        if student.get("test_inbox_built_at"):
+            return
+        TestInboxService.rebuild(db, student)
+        student["test_inbox_built_at"] = datetime.now(timezone.utc)
+
+    @staticmethod
+    def rebuild(db: Database, student: dict) -> int:
+        """Rebuild one student's inbox from tests and attempts. Returns the row count."""
+        student_id = str(student["_id"])
+        year = student.get("year")
+        class_ids = ClassMembershipService.class_ids(db, student)
+
+        access_clauses: list[dict] = []
+        if class_ids:
+            access_clauses.append(
+                {
+                    "status": {"$in": ["assigned", "active"]},
+                    "assigned_to_class_ids": {"$in": class_ids},
+                }
+            )
+        if year:
+            # Legacy year-wide assignment
+            access_clauses.append(
+                {
+                    "assigned": True,
+                    "year": year,
+                    "status": {"$in": ["assigned", "active"]},
+                    "$or": [
+                        {"assigned_to_class_ids": {"$exists": False}},
+                        {"assigned_to_class_ids": {"$size": 0}},
+                    ],
+                }
+            )
+        tests = {
+            str(test["_id"]): test
+            for test in (
+                db.tests.find({"$or": access_clauses}, {"question_set": 0}) if access_clauses else []
+            )
+        }
+
+        latest_attempts: dict[str, dict] = {}
+        for attempt in db.test_attempts.find(
+            {"student_id": student_id, "status": "submitted"},
+            {"test_id": 1, "score": 1, "submitted_at": 1},
+        ).sort("submitted_at", -1):
+            latest_attempts.setdefault(str(attempt.get("test_id") or ""), attempt)
+
+        missing = [
+            ObjectId(test_id)
+            for test_id in latest_attempts
+            if test_id not in tests and ObjectId.is_valid(test_id)
+        ]
+        if missing:
+            for test in db.tests.find({"_id": {"$in": missing}}, {"question_set": 0}):
+                tests[str(test["_id"])] = test
+
+        now = datetime.now(timezone.utc)
+        operations = []
+        for test_id, test in tests.items():
+            attempt = latest_attempts.get(test_id)
+            operations.append(
+                UpdateOne(
+                    {"_id": f"{student_id}:{test_id}"},
+                    {
+                        "$set": {
+                            **TestInboxService._test_fields(test),
+                            "student_id": student_id,
+                            "test_id": test_id,
+                            "status": "completed" if attempt else "assigned",
+                            "score": attempt.get("score") if attempt else None,
+                            "attempt_id": str(attempt["_id"]) if attempt else None,
+                            "updated_at": now,
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+
+        stale = {"student_id": student_id, "test_id": {"$nin": list(tests)}}
+        gone = db.student_test_inbox.distinct("test_id", stale)
+        if gone:
+            db.student_test_inbox.delete_many(stale)
+            SyncService.record_deletions(db, "tests", student_id, gone)
+        if operations:
+            db.student_test_inbox.bulk_write(operations, ordered=False)
+        db.users.update_one({"_id": student["_id"]}, {"$set": {"test_inbox_built_at": now}})
+        VersionService.bump(db, VersionService.student(student_id))
+        return len(operations)
+
+    @staticmethod
+    def _query(student_id: str, status_filter: str | None, subject: str | None) -> dict:
+        query: dict = {"student_id": student_id}
+        if status_filter:
+            query["status"] = status_filter
+        if subject:
+            query["subject"] = subject
+        return query
+
+    @staticmethod
+    def _test_fields(test: dict) -> dict:
+        created_at = test.get("created_at")
+        if not isinstance(created_at, datetime):
+            created_at = None
+        sort_at = created_at or _EPOCH
+        if sort_at.tzinfo is None:
+            sort_at = sort_at.replace(tzinfo=timezone.utc)
+        fields = {field: test.get(field) for field in _DISPLAY_FIELDS}
+        fields["created_at"] = created_at
+        fields["sort_key"] = int(sort_at.timestamp() * 1000)
+        return fields
+
+    @staticmethod
+    def _row_payload(row: dict) -> dict:
+        return {
+            "id": row["test_id"],
+            "title": row.get("title") or "Untitled",
+            "subject": row.get("subject") or "General",
+            "difficulty": row.get("difficulty") or "Medium",
+            "questions": int(row.get("questions") or 0),
+            "duration": int(row.get("duration") or 0),
+            "status": row.get("status", "assigned"),
+            "attempt_id": row.get("attempt_id"),
+            "year": row.get("year"),
+            "score": row.get("score"),
+            "created_at": row.get("created_at"),
+        }
+
+    @staticmethod
+    def _encode_cursor(row: dict) -> str:
+        raw = f"{row['sort_key']}|{row['_id']}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[int, str]:
+        try:
+            sort_key, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+            return int(sort_key), row_id
+        except Exception as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor",
+            ) from exc
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from app.services.answer_key import UNATTEMPTED, CompiledAnswerKey
+
+_VERDICT_FIELDS = ("correct", "partial", "wrong")
+
+
+class TopicStatsService:
+    """
+    Cross-attempt topic mastery (``student_topic_stats``, one document per
+    student and (subject, topic, subtopic)).
+
+    Each scored submission adds ``$inc`` counters to the rows its questions
+    touch: questions seen, answered, correct/partial/wrong and seconds spent.
+    "Weak topics across all my tests" and the planner's focus list are then
+    one indexed read of the student's rows instead of a scan over every
+    stored attempt analysis. A rescore applies the verdict difference.
+    """
+
+    @staticmethod
+    def record(db: Database, attempt: dict, key: CompiledAnswerKey) -> bool:
+        """Add one scored attempt to its student's rows, at most once. Returns whether it was added."""
+        claimed = db.test_attempts.update_one(
+            {"_id": attempt["_id"], "topic_stats_at": None},
+            {"$set": {"topic_stats_at": datetime.now(timezone.utc)}},
+        )
+        if not claimed.modified_count:
+            return False
+        TopicStatsService.apply(db, str(attempt["student_id"]), TopicStatsService.counters(attempt, key))
+        return True
+
+    @staticmethod
+    def counters(attempt: dict, key: CompiledAnswerKey) -> dict[tuple[str, str, str], dict[str, int]]:
+        """Per (subject, topic, subtopic): what one attempt adds."""
+        answers = dict(attempt.get("answers") or {})
+        time_spent = dict(attempt.get("time_spent") or {})
+        rows: dict[tuple[str, str, str], dict[str, int]] = {}
+        for question_id, row, verdict in zip(key.question_ids, key.topics, key.verdicts(answers)):
+            counters = rows.get(row)
+            if counters is None:
+                counters = rows[row] = {
+                    "tests": 1,
+                    "questions": 0,
+                    "attempted": 0,
+                    "correct": 0,
+                    "partial": 0,
+                    "wrong": 0,
+                    "time_seconds": 0,
+                }
+            counters["questions"] += 1
+            if verdict != UNATTEMPTED:
+                counters["attempted"] += 1
+                counters[verdict] += 1
+            seconds = time_spent.get(question_id)
+            if isinstance(seconds, int) and seconds > 0:
+                counters["time_seconds"] += seconds
+        return rows
+
+    @staticmethod
+    def apply(db: Database, student_id: str, rows: dict[tuple[str, str, str], dict[str, int]]) -> None:
+        now = datetime.now(timezone.utc)
+        writes = []
+        for (subject, topic, subtopic), counters in rows.items():
+            increments = {field: value for field, value in counters.items() if value}
+            if not increments:
+                continue
+            writes.append(
+                UpdateOne(
+                    {"_id": TopicStatsService._row_id(student_id, subject, topic, subtopic)},
+                    {
+                        "$inc": increments,
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {
+                            "student_id": student_id,
+                            "subject": subject,
+                            "topic": topic,
+                            "subtopic": subtopic,
+                        },
+                    },
+                    upsert=True,
+                )
+            )
+        if writes:
+            db.student_topic_stats.bulk_write(writes, ordered=False)
+
+    @staticmethod
+    def apply_rescore(db: Database, attempt: dict, old_key: CompiledAnswerKey, new_key: CompiledAnswerKey) -> None:
+        """Move an already counted attempt's verdicts from the old key to the new one."""
+        if not attempt.get("topic_stats_at"):
+            # Not counted yet; its pipeline step counts it against the new key.
+            return
+        old_rows = TopicStatsService.counters(attempt, old_key)
+        new_rows = TopicStatsService.counters(attempt, new_key)
+        deltas = {}
+        for row in old_rows.keys() | new_rows.keys():
+            old, new = old_rows.get(row, {}), new_rows.get(row, {})
+            delta = {field: new.get(field, 0) - old.get(field, 0) for field in _VERDICT_FIELDS}
+            if any(delta.values()):
+                deltas[row] = delta
+        TopicStatsService.apply(db, str(attempt["student_id"]), deltas)
+
+    @staticmethod
+    def weak_topics(
+        db: Database,
+        student_id: str,
+        *,
+        threshold: float = 50.0,
+        min_questions: int = 3,
+        limit: int = 5,
+    ) -> dict:
+        """
+        Topics across all of a student's tests, split at ``threshold`` accuracy
+        (correct over questions seen, as in the per-attempt analysis). Topics
+        seen fewer than ``min_questions`` times are left out.
+        """
+        topics: dict[tuple[str, str], dict] = {}
+        for row in db.student_topic_stats.find({"student_id": student_id}):
+            entry = topics.setdefault(
+                (row["subject"], row["topic"]),
+                {
+                    "subject": row["subject"],
+                    "topic": row["topic"],
+                    "questions": 0,
+                    "attempted": 0,
+                    "correct": 0,
+                    "partial": 0,
+                    "time_seconds": 0,
+                    "weakest_subtopic": None,
+                    "_subtopic_accuracy": None,
+                },
+            )
+            for field in ("questions", "attempted", "correct", "partial", "time_seconds"):
+                entry[field] += int(row.get(field) or 0)
+            questions = int(row.get("questions") or 0)
+            if questions >= min_questions:
+                accuracy = int(row.get("correct") or 0) / questions * 100
+                if entry["_subtopic_accuracy"] is None or accuracy < entry["_subtopic_accuracy"]:
+                    entry["_subtopic_accuracy"] = accuracy
+                    entry["weakest_subtopic"] = row["subtopic"]
+
+        weak_topics = []
+        strong_topics = []
+        for entry in topics.values():
+            entry.pop("_subtopic_accuracy")
+            questions = entry["questions"]
+            if questions < min_questions:
+                continue
+            entry["accuracy"] = round(entry["correct"] / questions * 100, 1)
+            entry["avg_time_seconds"] = (
+                round(entry["time_seconds"] / entry["attempted"], 1) if entry["attempted"] else None
+            )
+            (weak_topics if entry["accuracy"] < threshold else strong_topics).append(entry)
+
+        weak_topics.sort(key=lambda entry: (entry["accuracy"], -entry["questions"]))
+        strong_topics.sort(key=lambda entry: (-entry["accuracy"], -entry["questions"]))
+        return {
+            "threshold": threshold,
+            "weak_topics": weak_topics[:limit],
+            "strong_topics": strong_topics[:limit],
+        }
+
+    @staticmethod
+    def _row_id(student_id: str, subject: str, topic: str, subtopic: str) -> str:
+        return f"{student_id}:{subject}:{topic}:{subtopic}"
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import time
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+from app.core.cache import get_redis
+from app.utils.http_cache import make_etag
+
+
+class VersionService:
+    """
+    Per-resource change counters used as cheap ETag validators.
+
+    Writers bump the scopes they touch (``student:{id}`` for a student's test
+    list and dashboard, ``notifications:{user_id}``, ``papers:{teacher_id}``);
+    read endpoints derive their ETag from the current counters alone, so an
+    unchanged resource is answered with 304 before any payload is built.
+    Counters live in Redis (``version:{scope}``) when configured and in the
+    ``resource_versions`` collection otherwise. A Redis counter that is missing
+    (never written, or evicted) restarts from the current time in milliseconds
+    rather than from 1, so it never repeats a value a client may still hold.
+    """
+
+    @staticmethod
+    def student(student_id: str) -> str:
+        return f"student:{student_id}"
+
+    @staticmethod
+    def notifications(user_id: str) -> str:
+        return f"notifications:{user_id}"
+
+    @staticmethod
+    def papers(teacher_id: str) -> str:
+        return f"papers:{teacher_id}"
+
+    @staticmethod
+    def bump(db: Database, *scopes: str) -> None:
+        scopes = tuple(dict.fromkeys(scope for scope in scopes if scope))
+        if not scopes:
+            return
+        client = get_redis()
+        if client:
+            seed = int(time.time() * 1000)
+            pipe = client.pipeline(transaction=False)
+            for scope in scopes:
+                pipe.set(f"version:{scope}", seed, nx=True)
+                pipe.incr(f"version:{scope}")
+            pipe.execute()
+            return
+        db.resource_versions.bulk_write(
+            [UpdateOne({"_id": scope}, {"$inc": {"version": 1}}, upsert=True) for scope in scopes],
+            ordered=False,
+        )
+
+    @staticmethod
+    def current(db: Database, *scopes: str) -> list[int]:
+        client = get_redis()
+        if client:
+            keys = [f"version:{scope}" for scope in scopes]
+            values = client.mget(keys)
+            missing = [key for key, value in zip(keys, values) if value is None]
+            if missing:
+                seed = int(time.time() * 1000)
+                pipe = client.pipeline(transaction=False)
+                for key in missing:
+                    pipe.set(key, seed, nx=True)
+                pipe.execute()
+                values = client.mget(keys)
+            return [int(value or 0) for value in values]
+
+        found = {
+            doc["_id"]: int(doc.get("version") or 0)
+            for doc in db.resource_versions.find({"_id": {"$in": list(scopes)}})
+        }
+        return [found.get(scope, 0) for scope in scopes]
+
+    @staticmethod
+    def etag(db: Database, *scopes: str, variant: object = None) -> str:
+        """ETag for a view over ``scopes``; ``variant`` distinguishes query parameters."""
+        return make_etag([list(scopes), VersionService.current(db, *scopes), variant])
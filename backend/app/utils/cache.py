@@ -1,4 +1,6 @@
+import threading
 import time
+from collections import OrderedDict
 from typing import Any, Dict, Optional, Tuple
 
 class SimpleTTLCache:
@@ -27,3 +29,44 @@ student_cache = SimpleTTLCache(ttl_seconds=120)
 teacher_cache = SimpleTTLCache(ttl_seconds=120)
 admin_cache = SimpleTTLCache(ttl_seconds=180)
 planner_cache = SimpleTTLCache(ttl_seconds=300) # Planner assessment is heavy, cache longer
+
+
+class LRUCache:
+    """Bounded in-process cache for immutable values (no expiry, least-recently-used eviction)."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self.cache:
+                return None
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self.cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+
+
+# Question sets are content-addressed and never change once stored.
+question_set_cache = LRUCache(maxsize=256)
+# Answer-free views of question sets (parsed list plus serialized JSON), keyed by question set id.
+public_question_cache = LRUCache(maxsize=256)
+# Compiled answer keys (CompiledAnswerKey), keyed by question set id.
+answer_key_cache = LRUCache(maxsize=256)
+# Rendered results of submitted attempts, keyed by student and attempt.
+result_cache = LRUCache(maxsize=1024)
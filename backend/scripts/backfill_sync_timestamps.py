@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+
+# Collections served by the incremental sync endpoint.
+_COLLECTIONS = ("student_test_inbox", "notifications", "chat_sessions", "library_items")
+
+
+def _backfill(db, *, dry_run: bool) -> dict[str, int]:
+    """Give rows written before incremental sync an ``updated_at`` (their ``created_at`` or now)."""
+    counts: dict[str, int] = {}
+    now = datetime.now(timezone.utc)
+    for name in _COLLECTIONS:
+        collection = db[name]
+        query = {"updated_at": None}
+        counts[name] = collection.count_documents(query)
+        if dry_run or not counts[name]:
+            continue
+        for doc in collection.find(query, {"created_at": 1}):
+            created_at = doc.get("created_at")
+            collection.update_one(
+                {"_id": doc["_id"], "updated_at": None},
+                {"$set": {"updated_at": created_at if isinstance(created_at, datetime) else now}},
+            )
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Backfill updated_at on collections served by POST /student/sync."
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only count rows missing updated_at.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    for name, count in _backfill(db, dry_run=args.dry_run).items():
+        verb = "missing" if args.dry_run else "backfilled"
+        print(f"{name}: {count} rows {verb}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from app.services.analysis_service import AnalysisService
+from app.services.answer_key import CompiledAnswerKey
+from scripts.benchmark_scoring import _answers, _question_set
+
+_TOPICS = ("Mechanics", "Optics", "Thermodynamics", "Electrostatics", "Organic", "Algebra")
+_EXPLANATIONS = (
+    "Apply the conservation law to both states.",
+    "Calculate the ratio, then multiply by the constant.",
+    "Read the options carefully; two look alike.",
+)
+
+
+def _paper(count: int, rng: random.Random) -> list[dict]:
+    questions = _question_set(count, rng)
+    for index, question in enumerate(questions):
+        question["topic"] = _TOPICS[index % len(_TOPICS)]
+        question["subtopic"] = f"Part {index % 3 + 1}"
+        question["explanation"] = " ".join(rng.sample(_EXPLANATIONS, 2)) * 3
+    return questions
+
+
+def _three_pass(question_set: list[dict], answers: dict) -> dict:
+    """The previous analysis: topic stats, mistake patterns and totals as separate walks."""
+    topic_stats: dict[str, dict] = {}
+    subtopic_stats: dict[str, dict] = {}
+    for q in question_set:
+        topic = q.get("topic", "General")
+        subtopic_key = f"{topic}::{q.get('subtopic', 'General')}"
+        if topic not in topic_stats:
+            topic_stats[topic] = {"subject": q.get("subject", "General"), "attempted": 0, "correct": 0, "wrong": 0}
+        if subtopic_key not in subtopic_stats:
+            subtopic_stats[subtopic_key] = {"topic": topic, "attempted": 0, "correct": 0, "wrong": 0}
+        topic_stats[topic]["attempted"] += 1
+        subtopic_stats[subtopic_key]["attempted"] += 1
+        user_answer = answers.get(str(q.get("id", "")))
+        if user_answer is not None:
+            verdict = "correct" if user_answer == q.get("correct") else "wrong"
+            topic_stats[topic][verdict] += 1
+            subtopic_stats[subtopic_key][verdict] += 1
+    for data in (*topic_stats.values(), *subtopic_stats.values()):
+        data["accuracy"] = data["correct"] / data["attempted"] * 100 if data["attempted"] else 0
+
+    patterns = {"conceptual_errors": 0, "calculation_errors": 0, "careless_mistakes": 0, "skipped_questions": 0}
+    mistake_examples = []
+    for q in question_set:
+        user_answer = answers.get(str(q.get("id", "")))
+        explanation = q.get("explanation", "").lower()
+        if user_answer is None:
+            patterns["skipped_questions"] += 1
+        elif user_answer != q.get("correct"):
+            if any(keyword in explanation for keyword in ["concept", "formula", "law", "principle", "rule"]):
+                patterns["conceptual_errors"] += 1
+                mistake_type = "Conceptual Error"
+            elif any(keyword in explanation for keyword in ["calculate", "formula", "multiply", "divide", "add"]):
+                patterns["calculation_errors"] += 1
+                mistake_type = "Calculation Error"
+            else:
+                patterns["careless_mistakes"] += 1
+                mistake_type = "Careless Mistake"
+            mistake_examples.append({"type": mistake_type, "question_id": str(q.get("id", ""))})
+
+    attempted = sum(data["attempted"] for data in topic_stats.values())
+    correct = sum(data["correct"] for data in topic_stats.values())
+    return {
+        "topic_stats": topic_stats,
+        "subtopic_stats": subtopic_stats,
+        "patterns": patterns,
+        "mistake_examples": mistake_examples[:5],
+        "attempted": attempted,
+        "correct": correct,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time the fused result analysis against the previous three-pass analysis."
+    )
+    parser.add_argument("--students", type=int, default=2000, help="Answer sheets to analyse (default: 2000).")
+    parser.add_argument("--questions", type=int, default=90, help="Questions per paper (default: 90).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed (default: 7).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per variant; the best counts (default: 5).")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    questions = _paper(args.questions, rng)
+    answers_list = [_answers(questions, rng) for _ in range(args.students)]
+
+    def best(run) -> float:
+        # Best of --repeat runs, to keep scheduler noise out of the comparison.
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for answers in answers_list:
+                run(answers)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    three_pass_seconds = best(lambda answers: _three_pass(questions, answers))
+    uncached_seconds = best(lambda answers: AnalysisService.build_complete_analysis({"answers": answers}, questions))
+    # As in the pipeline: the key comes out of the per-question-set LRU.
+    key = CompiledAnswerKey.compile(questions)
+    fused_seconds = best(
+        lambda answers: AnalysisService.build_complete_analysis({"answers": answers}, questions, key=key)
+    )
+
+    per_sheet = 1000 / args.students
+    print(f"Analysed {args.students} sheets x {args.questions} questions.")
+    print(f"  three-pass:            {three_pass_seconds * per_sheet:.3f} ms/sheet")
+    print(f"  fused, key per call:   {uncached_seconds * per_sheet:.3f} ms/sheet")
+    print(
+        f"  fused, cached key:     {fused_seconds * per_sheet:.3f} ms/sheet "
+        f"({three_pass_seconds / fused_seconds:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from app.services.answer_key import CompiledAnswerKey
+from app.services.batch_scoring import BatchScoring
+from app.services.scoring_service import ScoringService
+
+_TYPES = ("MCQ_MAIN", "ADV_SINGLE", "NUMERICAL_MAIN", "ADV_MULTIPLE")
+
+
+def _question_set(count: int, rng: random.Random) -> list[dict]:
+    questions: list[dict] = []
+    for index in range(count):
+        qtype = _TYPES[index % len(_TYPES)]
+        if qtype == "NUMERICAL_MAIN":
+            correct: object = rng.randint(0, 50)
+        elif qtype == "ADV_MULTIPLE":
+            correct = sorted(rng.sample(range(4), rng.randint(1, 3)))
+        else:
+            correct = rng.randrange(4)
+        questions.append({"id": f"q{index + 1}", "type": qtype, "options": ["A", "B", "C", "D"], "correct": correct})
+    return questions
+
+
+def _answers(questions: list[dict], rng: random.Random) -> dict:
+    answers: dict = {}
+    for question in questions:
+        roll = rng.random()
+        if roll < 0.2:
+            continue
+        if question["type"] == "NUMERICAL_MAIN":
+            answers[question["id"]] = question["correct"] if roll < 0.6 else rng.randint(0, 50)
+        elif question["type"] == "ADV_MULTIPLE":
+            answers[question["id"]] = sorted(rng.sample(range(4), rng.randint(1, 4)))
+        else:
+            answers[question["id"]] = question["correct"] if roll < 0.6 else rng.randrange(4)
+    return answers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Compare per-attempt scoring with the vectorized batch scorer on random attempts."
+    )
+    parser.add_argument("--students", type=int, default=5000, help="Attempts to score (default: 5000).")
+    parser.add_argument("--questions", type=int, default=90, help="Questions per test (default: 90).")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed (default: 7).")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    questions = _question_set(args.questions, rng)
+    answers_list = [_answers(questions, rng) for _ in range(args.students)]
+
+    started = time.perf_counter()
+    scalar = [ScoringService.grade_attempt(questions, answers) for answers in answers_list]
+    scalar_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = BatchScoring.grade_many(CompiledAnswerKey.compile(questions), answers_list)
+    batch_seconds = time.perf_counter() - started
+
+    if batch != scalar:
+        raise SystemExit("Batch scores differ from the scalar scorer.")
+    print(f"Scored {args.students} attempts x {args.questions} questions; results identical.")
+    print(f"  scalar: {scalar_seconds * 1000:.1f} ms")
+    print(f"  batch:  {batch_seconds * 1000:.1f} ms ({scalar_seconds / batch_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import argparse
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.class_membership_service import ClassMembershipService
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check users.class_ids against classes.student_ids and optionally repair drift."
+    )
+    parser.add_argument("--repair", action="store_true", help="Rewrite class_ids on drifted students.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    report = ClassMembershipService.check(db, repair=args.repair)
+    print(f"Checked {report['checked']} students; {len(report['drifted'])} missing or drifted.")
+    for student_id in report["drifted"][:20]:
+        print(f"  {student_id}")
+    if args.repair:
+        print(f"Repaired {report['repaired']} students.")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.question_set_service import QuestionSetService
+
+
+async def _backfill(db, *, dry_run: bool, include_drafts: bool) -> tuple[int, int, list[str]]:
+    statuses = ["assigned", "active"]
+    if include_drafts:
+        statuses.append("draft")
+    query = {
+        "status": {"$in": statuses},
+        "$or": [
+            {"question_set_ready_at": {"$exists": False}},
+            {"question_set_ready_at": None},
+        ],
+    }
+
+    checked = 0
+    materialized = 0
+    failures: list[str] = []
+    for test in db.tests.find(query):
+        checked += 1
+        if dry_run:
+            continue
+        try:
+            await QuestionSetService.materialize(db, test)
+            materialized += 1
+        except (RuntimeError, ValueError) as exc:
+            failures.append(f"{test['_id']} ({test.get('title', 'Untitled')}): {exc}")
+    return checked, materialized, failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Materialize and validate question sets for tests students can start."
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only count tests that need a question set.")
+    parser.add_argument("--include-drafts", action="store_true", help="Also prepare draft papers.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    checked, materialized, failures = asyncio.run(
+        _backfill(db, dry_run=args.dry_run, include_drafts=args.include_drafts)
+    )
+
+    if args.dry_run:
+        print(f"Tests without a ready question set: {checked}")
+    else:
+        print(f"Materialized {materialized}/{checked} question sets.")
+    for failure in failures:
+        print(f"- failed: {failure}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
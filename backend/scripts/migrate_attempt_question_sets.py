@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import argparse
+
+from pymongo import UpdateOne
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.question_set_service import QuestionSetService
+
+
+def _migrate(db, *, dry_run: bool, batch_size: int) -> tuple[int, int]:
+    """Move embedded attempt question sets into the shared question_sets store."""
+    query = {
+        "question_set_id": {"$in": [None]},
+        "question_set.0": {"$exists": True},
+    }
+    if dry_run:
+        return db.test_attempts.count_documents(query), 0
+
+    checked = 0
+    migrated = 0
+    pending: list[UpdateOne] = []
+    for attempt in db.test_attempts.find(query, {"test_id": 1, "question_set": 1}):
+        checked += 1
+        question_set_id = QuestionSetService.store(
+            db, attempt["question_set"], test_id=str(attempt.get("test_id") or "")
+        )
+        pending.append(
+            UpdateOne(
+                {"_id": attempt["_id"]},
+                {"$set": {"question_set_id": question_set_id}, "$unset": {"question_set": ""}},
+            )
+        )
+        if len(pending) >= batch_size:
+            migrated += db.test_attempts.bulk_write(pending, ordered=False).modified_count
+            pending = []
+    if pending:
+        migrated += db.test_attempts.bulk_write(pending, ordered=False).modified_count
+    return checked, migrated
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replace per-attempt question_set copies with references to the shared store."
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only count attempts that embed a question set.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Attempts updated per bulk write.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    checked, migrated = _migrate(db, dry_run=args.dry_run, batch_size=max(1, args.batch_size))
+    if args.dry_run:
+        print(f"Attempts embedding a question set: {checked}")
+    else:
+        print(f"Migrated {migrated}/{checked} attempts to shared question sets.")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
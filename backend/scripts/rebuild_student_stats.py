@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import argparse
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.leaderboard_service import LeaderboardService
+from app.services.student_stats_service import StudentStatsService
+
+
+def _reconcile(db, *, dry_run: bool, student_id: str | None) -> tuple[int, int]:
+    """Rebuild student_stats from test_attempts. Returns (students checked, documents that drifted)."""
+    student_ids = (
+        [student_id]
+        if student_id
+        else sorted(db.test_attempts.distinct("student_id", {"status": "submitted"}))
+    )
+
+    drifted = 0
+    for sid in student_ids:
+        sid = str(sid)
+        current = db.student_stats.find_one({"_id": sid}) or {}
+        if dry_run:
+            completed = db.test_attempts.count_documents({"student_id": sid, "status": "submitted"})
+            drifted += int(current.get("completed_tests") != completed)
+            continue
+        rebuilt = StudentStatsService.rebuild(db, sid)
+        fields = ("completed_tests", "avg_score", "current_streak", "subjects")
+        drifted += int(any(current.get(field) != rebuilt.get(field) for field in fields))
+    return len(student_ids), drifted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild per-student statistics (student_stats) from submitted attempts."
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only report documents whose test count drifted.")
+    parser.add_argument("--student-id", help="Reconcile a single student.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    checked, drifted = _reconcile(db, dry_run=args.dry_run, student_id=args.student_id)
+    if args.dry_run:
+        print(f"Checked {checked} students; {drifted} have a stale completed count.")
+    else:
+        print(f"Rebuilt stats for {checked} students ({drifted} had drifted).")
+        if not args.student_id:
+            ranked = LeaderboardService.rebuild(db)
+            print(f"Reseeded leaderboards with {ranked} ranked students.")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import argparse
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.test_inbox_service import TestInboxService
+from app.utils.mongo import parse_object_id
+
+
+def _rebuild(db, *, dry_run: bool, student_id: str | None) -> tuple[int, int]:
+    query: dict = {"role": "student"}
+    if student_id:
+        query["_id"] = parse_object_id(student_id, "student_id")
+
+    students = 0
+    rows = 0
+    for student in db.users.find(query, {"_id": 1, "year": 1}):
+        students += 1
+        if not dry_run:
+            rows += TestInboxService.rebuild(db, student)
+    return students, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Rebuild the per-student test inbox from tests, classes and attempts."
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only count students that would be rebuilt.")
+    parser.add_argument("--student-id", help="Rebuild a single student's inbox.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    students, rows = _rebuild(db, dry_run=args.dry_run, student_id=args.student_id)
+    if args.dry_run:
+        print(f"Students to rebuild: {students}")
+    else:
+        print(f"Rebuilt {rows} inbox rows for {students} students.")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
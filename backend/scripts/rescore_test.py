@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.question_set_service import QuestionSetService
+from app.services.rescore_service import ACTIVE, RescoreService
+from app.utils.mongo import parse_object_id
+
+
+def _work(job_id: str) -> None:
+    """One worker process: its own client, claiming batches until the job runs dry."""
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    try:
+        RescoreService.run(client[settings.mongodb_db], job_id)
+    finally:
+        client.close()
+
+
+def _job_for_test(db, test_id: str, source_set_ids: list[str]) -> dict:
+    """The test's active job, or a new one moving ``source_set_ids`` onto its current question set."""
+    job = RescoreService.latest(db, test_id)
+    if job is not None and job["status"] in ACTIVE and not source_set_ids:
+        return job
+    if not source_set_ids:
+        raise SystemExit(f"Test {test_id} has no active rescore job; pass --source-set to start one.")
+    test = db.tests.find_one({"_id": parse_object_id(test_id, "test_id")})
+    if not test:
+        raise SystemExit(f"Test {test_id} not found.")
+    question_set_id = QuestionSetService.reference(db, test)
+    if not question_set_id:
+        raise SystemExit(f"Test {test_id} has no question set.")
+    return RescoreService.create(
+        db, test_id=test_id, question_set_id=question_set_id, source_set_ids=source_set_ids
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Re-grade a test's submitted attempts against its current answer key (rescore_jobs)."
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--job-id", help="Resume an existing rescore job.")
+    target.add_argument("--test-id", help="Rescore a test; resumes its active job if there is one.")
+    parser.add_argument(
+        "--source-set",
+        action="append",
+        default=[],
+        help="With --test-id: a question set whose attempts move to the current set (repeatable).",
+    )
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing the job (default: 1).")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    if args.job_id:
+        job = db.rescore_jobs.find_one({"_id": parse_object_id(args.job_id, "job_id")})
+        if job is None:
+            raise SystemExit(f"Rescore job {args.job_id} not found.")
+    else:
+        job = _job_for_test(db, args.test_id, args.source_set)
+    job_id = str(job["_id"])
+
+    if args.processes > 1:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            for future in [pool.submit(_work, job_id) for _ in range(args.processes)]:
+                future.result()
+    else:
+        RescoreService.run(db, job_id)
+
+    job = RescoreService.payload(db.rescore_jobs.find_one({"_id": job["_id"]}))
+    print(
+        f"Rescore job {job_id} for test {job['test_id']}: {job['status']}, "
+        f"{job['processed']}/{job['total']} attempts processed, {job['changed']} scores changed."
+    )
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
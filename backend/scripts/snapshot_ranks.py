@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import argparse
+
+from app.core.config import get_settings
+from app.db.client import create_mongo_client
+from app.services.rank_snapshot_service import PERIODS, RankSnapshotService
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Record a rank/percentile snapshot for every ranked student (rank_snapshots)."
+    )
+    parser.add_argument("--period", choices=PERIODS, default="weekly", help="Snapshot bucket (default: weekly).")
+    parser.add_argument("--dry-run", action="store_true", help="Count the points without writing them.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = create_mongo_client(settings.mongodb_uri)
+    db = client[settings.mongodb_db]
+
+    taken_at = RankSnapshotService.period_start(args.period)
+    written = RankSnapshotService.take(db, period=args.period, dry_run=args.dry_run)
+    if not written and RankSnapshotService.exists(db, args.period, taken_at):
+        print(f"A {args.period} snapshot for {taken_at:%Y-%m-%d} already exists.")
+    elif args.dry_run:
+        print(f"Would write {written} {args.period} rank points for {taken_at:%Y-%m-%d}.")
+    else:
+        print(f"Wrote {written} {args.period} rank points for {taken_at:%Y-%m-%d}.")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
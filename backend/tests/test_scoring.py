@@ -0,0 +1,88 @@
+import random
+
+from app.services.answer_key import CompiledAnswerKey
+from app.services.batch_scoring import BatchScoring
+from app.services.scoring_service import ScoringService
+from scripts.benchmark_scoring import _answers, _question_set
+
+
+def test_batch_scoring_matches_scalar_scoring() -> None:
+    rng = random.Random(11)
+    questions = _question_set(40, rng)
+    answers_list = [_answers(questions, rng) for _ in range(300)]
+
+    batch = BatchScoring.grade_many(CompiledAnswerKey.compile(questions), answers_list)
+    assert batch == [ScoringService.grade_attempt(questions, answers) for answers in answers_list]
+
+
+IRREGULAR_QUESTIONS = [
+    {"id": "mcq", "type": "MCQ_MAIN", "correct": 2},
+    {"id": "legacy", "correct": "B"},
+    {"id": "unknown-type", "type": "ESSAY", "correct": 1},
+    {"id": "num", "type": "NUMERICAL_MAIN", "correct": "5"},
+    {"id": "num-bad", "type": "NUMERICAL_MAIN", "correct": None},
+    {"id": "multi", "type": "ADV_MULTIPLE", "correct": [0, 2]},
+    {"id": "multi-scalar", "type": "ADV_MULTIPLE", "correct": 1},
+    {"id": "multi-odd", "type": "ADV_MULTIPLE", "correct": ["a", "c"]},
+    {"id": "single", "type": "ADV_SINGLE", "correct": 0},
+]
+IRREGULAR_ANSWERS = [
+    {},
+    {"mcq": 2, "legacy": "B", "unknown-type": 1, "num": 5.0, "num-bad": 1, "multi": [2, 0],
+     "multi-scalar": 1, "multi-odd": ["c", "a"], "single": 0},
+    {"mcq": 2.0, "legacy": 1, "unknown-type": "1", "num": "x", "multi": [0], "multi-scalar": [1, 2],
+     "multi-odd": ["a"], "single": [0]},
+    {"mcq": True, "num": "5", "multi": [], "multi-scalar": [], "multi-odd": ["b"], "single": 99},
+    {"mcq": [2], "multi": [0, 2, 3], "multi-scalar": 0, "single": -1, "num": float("nan")},
+    {"multi": ["0", 2], "mcq": "2", "single": 0.5},
+    {"multi": (0, 2), "multi-scalar": (1,), "mcq": {"a": 1}, "legacy": ["B"]},
+]
+
+
+def test_batch_scoring_matches_scalar_on_irregular_keys_and_answers() -> None:
+    batch = BatchScoring.grade_many(CompiledAnswerKey.compile(IRREGULAR_QUESTIONS), IRREGULAR_ANSWERS)
+    assert batch == [ScoringService.grade_attempt(IRREGULAR_QUESTIONS, answers) for answers in IRREGULAR_ANSWERS]
+
+
+def test_compiled_key_grades_like_scalar_scoring() -> None:
+    rng = random.Random(5)
+    questions = _question_set(40, rng)
+    for question_set, answers_list in (
+        (questions, [_answers(questions, rng) for _ in range(100)]),
+        (IRREGULAR_QUESTIONS, IRREGULAR_ANSWERS),
+    ):
+        key = CompiledAnswerKey.compile(question_set)
+        for answers in answers_list:
+            assert key.grade(answers) == ScoringService.grade_attempt(question_set, answers)
+
+
+def test_answer_key_is_compiled_once_per_question_set() -> None:
+    from app.services.question_set_service import QuestionSetService
+    from app.utils.cache import answer_key_cache
+
+    answer_key_cache.clear()
+    key = QuestionSetService.answer_key(None, "set-1", IRREGULAR_QUESTIONS)
+    assert QuestionSetService.answer_key(None, "set-1", IRREGULAR_QUESTIONS) is key
+    assert QuestionSetService.answer_key(None, None, IRREGULAR_QUESTIONS) is not key
+    assert key.topics[0] == ("General", "General", "General")
+
+
+def test_fused_analysis_agrees_with_scoring() -> None:
+    from app.services.analysis_service import AnalysisService
+    from scripts.benchmark_analysis import _paper
+
+    rng = random.Random(3)
+    questions = _paper(90, rng)
+    key = CompiledAnswerKey.compile(questions)
+    for answers in [_answers(questions, rng) for _ in range(50)]:
+        graded = ScoringService.grade_attempt(questions, answers)
+        analysis = AnalysisService.build_complete_analysis({"answers": answers}, questions, key=key)
+        topics = analysis["topic_breakdown"].values()
+        assert analysis["total_correct"] == graded["correct_answers"]
+        assert sum(topic["partial"] for topic in topics) == graded["partial_correct"]
+        assert sum(topic["wrong"] for topic in topics) == graded["incorrect_answers"]
+        patterns = analysis["mistake_patterns"]
+        assert patterns["skipped_questions"] == graded["unattempted"]
+        assert sum(patterns.values()) - patterns["skipped_questions"] == (
+            graded["incorrect_answers"] + graded["partial_correct"]
+        )
@@ -1,4 +1,5 @@
 import pytest
+from bson import ObjectId
 
 
 @pytest.mark.anyio
@@ -720,3 +721,1516 @@ async def test_student_doubt_api_persists_history(
     )
     assert history.status_code == 200
     assert any(item["id"] == payload["id"] for item in history.json())
+
+
+@pytest.mark.anyio
+async def test_write_behind_autosave_is_flushed_and_seen_by_submit(
+    async_client,
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    from app.core.config import get_settings
+    from app.services.answer_buffer import AnswerBuffer, InMemoryAnswerStore
+
+    monkeypatch.setattr(get_settings(), "answer_write_behind", True)
+    # Without Redis, write-behind stays off: one process's buffer would be
+    # invisible to the others.
+    assert not AnswerBuffer.enabled()
+    monkeypatch.setattr(AnswerBuffer, "_test_store", InMemoryAnswerStore())
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    assert started.status_code == 200
+    attempt_id = started.json()["attempt_id"]
+    question_id = started.json()["questions"][0]["id"]
+
+    saved = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={"answers": {question_id: 1}, "time_spent": {question_id: 12}},
+        headers=student_headers,
+    )
+    assert saved.status_code == 200
+    assert saved.json()["saved_answers"] == 1
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["answers"] == {}
+
+    resumed = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    assert resumed.json()["answers"].get(question_id) == 1
+
+    assert AnswerBuffer.flush(db) == 1
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["answers"] == {question_id: 1}
+    assert attempt["time_spent"] == {question_id: 12}
+
+    saved = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={"answers": {question_id: 2}},
+        headers=student_headers,
+    )
+    assert saved.status_code == 200
+
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit",
+        headers=student_headers,
+    )
+    assert submitted.status_code == 200
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["answers"] == {question_id: 2}
+    assert AnswerBuffer.pending(attempt_id)["answers"] == {}
+
+
+@pytest.mark.anyio
+async def test_assign_materializes_question_set_before_students_start(
+    async_client,
+    teacher_headers: dict[str, str],
+    student_headers: dict[str, str],
+) -> None:
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    teacher = db.users.find_one({"email": "sharma@example.com"})
+    class_id = str(db.classes.find_one({"name": "JEE 2026 Batch A"})["_id"])
+    paper_id = db.tests.insert_one(
+        {
+            "title": "Eager Materialization Paper",
+            "subject": "Physics",
+            "difficulty": "Medium",
+            "questions": 3,
+            "duration": 30,
+            "year": "12th",
+            "status": "draft",
+            "assigned": False,
+            "creator_id": str(teacher["_id"]),
+            "assigned_to_class_ids": [],
+        }
+    ).inserted_id
+
+    assigned = await async_client.post(
+        f"/api/v1/teacher/papers/{paper_id}/assign",
+        json={"class_ids": [class_id]},
+        headers=teacher_headers,
+    )
+    assert assigned.status_code == 200
+
+    paper = db.tests.find_one({"_id": paper_id})
+    assert paper["question_set_ready_at"] is not None
+    assert [q["id"] for q in paper["question_set"]] == ["q1", "q2", "q3"]
+    assert all(q["subject"] == "Physics" for q in paper["question_set"])
+
+    started = await async_client.post(
+        f"/api/v1/student/tests/{paper_id}/start",
+        headers=student_headers,
+    )
+    assert started.status_code == 200
+    assert [q["id"] for q in started.json()["questions"]] == ["q1", "q2", "q3"]
+    assert db.tests.find_one({"_id": paper_id})["updated_at"] == paper["updated_at"]
+
+
+@pytest.mark.anyio
+async def test_invalid_question_set_is_not_written_to_a_live_paper(
+    async_client,
+    teacher_headers: dict[str, str],
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    import app.services.teacher_service as teacher_service
+    from app.services.question_set_service import QuestionSetService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    teacher = db.users.find_one({"email": "sharma@example.com"})
+    class_id = str(db.classes.find_one({"name": "JEE 2026 Batch A"})["_id"])
+    paper_id = db.tests.insert_one(
+        {
+            "title": "Live Edit Paper",
+            "subject": "Physics",
+            "difficulty": "Medium",
+            "questions": 3,
+            "duration": 30,
+            "year": "12th",
+            "status": "draft",
+            "assigned": False,
+            "creator_id": str(teacher["_id"]),
+            "assigned_to_class_ids": [],
+        }
+    ).inserted_id
+    assigned = await async_client.post(
+        f"/api/v1/teacher/papers/{paper_id}/assign",
+        json={"class_ids": [class_id]},
+        headers=teacher_headers,
+    )
+    assert assigned.status_code == 200
+    before = db.tests.find_one({"_id": paper_id})
+
+    async def broken_set(*args, **kwargs):
+        return [{"text": "Which option?", "options": ["only one"], "correct": 0}], "bank"
+
+    monkeypatch.setattr(teacher_service, "build_question_set_with_source", broken_set)
+    rejected = await async_client.patch(
+        f"/api/v1/teacher/papers/{paper_id}", json={"questions": 5}, headers=teacher_headers
+    )
+    assert rejected.status_code == 409
+    after = db.tests.find_one({"_id": paper_id})
+    for field in ("questions", "question_set", "question_set_id", "question_set_ready_at", "updated_at"):
+        assert after.get(field) == before.get(field)
+
+    started = await async_client.post(f"/api/v1/student/tests/{paper_id}/start", headers=student_headers)
+    assert started.status_code == 200
+    assert [q["id"] for q in started.json()["questions"]] == ["q1", "q2", "q3"]
+
+    monkeypatch.undo()
+    updated = await async_client.patch(
+        f"/api/v1/teacher/papers/{paper_id}", json={"questions": 5}, headers=teacher_headers
+    )
+    assert updated.status_code == 200
+    paper = db.tests.find_one({"_id": paper_id})
+    assert paper["questions"] == 5
+    assert paper["question_set_ready_at"] is not None
+    assert QuestionSetService.get(db, paper["question_set_id"]) == paper["question_set"]
+
+
+@pytest.mark.anyio
+async def test_concurrent_starts_share_one_question_set_build(
+    async_client,
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    import asyncio
+
+    from app.services import question_set_service
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    db.tests.update_one(
+        {"_id": test["_id"]},
+        {"$set": {"question_set": []}, "$unset": {"question_set_ready_at": ""}},
+    )
+
+    builds = 0
+
+    async def slow_build(db, subject, count, difficulty, *, require_ai=False, topic=None):
+        nonlocal builds
+        builds += 1
+        await asyncio.sleep(0.05)
+        return [
+            {"text": f"{subject} question {i}", "options": ["A", "B", "C", "D"], "correct": 1}
+            for i in range(count)
+        ]
+
+    monkeypatch.setattr(question_set_service, "build_question_set", slow_build)
+
+    snapshots = [db.tests.find_one({"_id": test["_id"]}) for _ in range(5)]
+    results = await asyncio.gather(
+        *(question_set_service.QuestionSetService.materialize(db, doc) for doc in snapshots)
+    )
+
+    assert builds == 1
+    assert all(result == results[0] for result in results)
+    stored = db.tests.find_one({"_id": test["_id"]})
+    assert stored["question_set"] == results[0]
+    assert "question_set_lock" not in stored
+
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    assert started.status_code == 200
+    assert builds == 1
+
+
+@pytest.mark.anyio
+async def test_attempts_reference_shared_question_set(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    assert started.status_code == 200
+    attempt_id = started.json()["attempt_id"]
+    question_id = started.json()["questions"][0]["id"]
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert "question_set" not in attempt
+    stored = db.question_sets.find_one({"_id": attempt["question_set_id"]})
+    assert stored is not None
+    assert db.tests.find_one({"_id": test["_id"]})["question_set_id"] == stored["_id"]
+
+    await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={"answers": {question_id: 1}},
+        headers=student_headers,
+    )
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit",
+        headers=student_headers,
+    )
+    assert submitted.status_code == 200
+    assert submitted.json()["total_questions"] == stored["question_count"]
+
+    result = await async_client.get(
+        f"/api/v1/student/results/{attempt_id}",
+        headers=student_headers,
+    )
+    assert result.status_code == 200
+    assert [q["question_id"] for q in result.json()["questions"]] == [
+        q["id"] for q in stored["questions"]
+    ]
+
+
+@pytest.mark.anyio
+async def test_post_submit_pipeline_runs_after_response_and_retries(
+    async_client,
+    student_headers: dict[str, str],
+    admin_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    from datetime import datetime, timezone
+
+    from app.services import post_submit_pipeline
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+
+    def flaky_notify(*args, **kwargs):
+        raise RuntimeError("notification store unavailable")
+
+    monkeypatch.setattr(post_submit_pipeline.NotificationService, "create_for_user", flaky_notify)
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit",
+        json={"violation_reason": "Student switched tab or app during active test"},
+        headers=student_headers,
+    )
+    assert submitted.status_code == 200
+    assert submitted.json()["analysis"]["status"] == "pending"
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["status"] == "submitted"
+    assert attempt["post_submit"]["status"] == "pending"
+    assert attempt["post_submit"]["done"] == ["score", "item_stats", "topic_stats", "analysis", "activity"]
+    assert "notification store unavailable" in attempt["post_submit"]["last_error"]
+    assert attempt["analysis"]["status"] == "ready"
+
+    monkeypatch.undo()
+    db.test_attempts.update_one(
+        {"_id": ObjectId(attempt_id)},
+        {"$set": {"post_submit.next_run_at": datetime.now(timezone.utc)}},
+    )
+    assert await post_submit_pipeline.PostSubmitPipeline.run_due(db) == 1
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["post_submit"]["status"] == "done"
+    assert attempt["post_submit"]["attempts"] == 2
+    assert db.notifications.count_documents(
+        {"user_id": attempt["student_id"], "title": "Result Ready"}
+    ) == 1
+    assert db.notifications.count_documents(
+        {"user_id": str(test["creator_id"]), "title": "Test Auto-Submitted"}
+    ) == 1
+
+    # A worker taking over a lapsed lease repeats steps whose completion was
+    # not recorded: their side effects land once, and re-scoring keeps the year.
+    recorded_years = []
+    monkeypatch.setattr(
+        post_submit_pipeline.LeaderboardService,
+        "record",
+        lambda db, student_id, avg_score, *, year=None: recorded_years.append(year),
+    )
+    activity_before = db.activity_logs.count_documents({"metadata.attempt_id": attempt_id})
+    db.test_attempts.update_one(
+        {"_id": ObjectId(attempt_id)},
+        {
+            "$set": {
+                "score": None,
+                "post_submit.status": "running",
+                "post_submit.lease_until": datetime(2000, 1, 1, tzinfo=timezone.utc),
+                "post_submit.done": ["item_stats", "topic_stats", "analysis"],
+            }
+        },
+    )
+    assert await post_submit_pipeline.PostSubmitPipeline.run_due(db) == 1
+    student = db.users.find_one({"_id": ObjectId(attempt["student_id"])})
+    assert recorded_years == [student.get("year")]
+    assert db.activity_logs.count_documents({"metadata.attempt_id": attempt_id}) == activity_before
+    assert db.notifications.count_documents(
+        {"user_id": attempt["student_id"], "title": "Result Ready"}
+    ) == 1
+    assert db.notifications.count_documents(
+        {"user_id": str(test["creator_id"]), "title": "Test Auto-Submitted"}
+    ) == 1
+    monkeypatch.undo()
+
+    status_response = await async_client.get(
+        "/api/v1/admin/post-submit/status",
+        headers=admin_headers,
+    )
+    assert status_response.status_code == 200
+    assert status_response.json()["counts"]["done"] >= 1
+    assert status_response.json()["counts"]["failed"] == 0
+
+
+@pytest.mark.anyio
+async def test_submit_transition_is_atomic(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    import asyncio
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+    question_id = started.json()["questions"][0]["id"]
+    await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={"answers": {question_id: 0}, "time_spent": {question_id: 10}},
+        headers=student_headers,
+    )
+
+    responses = await asyncio.gather(
+        *(
+            async_client.post(
+                f"/api/v1/student/attempts/{attempt_id}/submit",
+                json={"time_spent": {question_id: 42}},
+                headers=student_headers,
+            )
+            for _ in range(3)
+        )
+    )
+    assert sorted(response.status_code for response in responses) == [200, 409, 409]
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["status"] == "submitted"
+    assert attempt["time_spent"] == {question_id: 42}
+    assert attempt["answers"] == {question_id: 0}
+    assert attempt["max_score"] == attempt["analysis"]["max_score"]
+    assert attempt["score"] is not None
+
+
+@pytest.mark.anyio
+async def test_result_is_served_with_etag_and_revalidates(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit",
+        headers=student_headers,
+    )
+    assert submitted.status_code == 200
+
+    first = await async_client.get(
+        f"/api/v1/student/results/{attempt_id}",
+        headers=student_headers,
+    )
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "private, max-age=300"
+    etag = first.headers["etag"]
+
+    # Served from the render cache, even if the stored attempt is touched.
+    db.test_attempts.update_one({"_id": ObjectId(attempt_id)}, {"$set": {"score": -1}})
+    repeat = await async_client.get(
+        f"/api/v1/student/results/{attempt_id}",
+        headers={**student_headers, "If-None-Match": etag},
+    )
+    assert repeat.status_code == 304
+    assert repeat.headers["etag"] == etag
+    assert repeat.content == b""
+
+
+@pytest.mark.anyio
+async def test_test_inbox_pages_with_cursor_and_tracks_assignments(
+    async_client,
+    teacher_headers: dict[str, str],
+    student_headers: dict[str, str],
+) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    teacher = db.users.find_one({"email": "sharma@example.com"})
+    student = db.users.find_one({"name": "Rahul Kumar"})
+    class_id = str(db.classes.find_one({"name": "JEE 2026 Batch A"})["_id"])
+    db.classes.update_one({"_id": ObjectId(class_id)}, {"$addToSet": {"student_ids": str(student["_id"])}})
+
+    baseline = await async_client.get("/api/v1/student/tests", headers=student_headers)
+    assert baseline.status_code == 200
+    known_ids = {item["id"] for item in baseline.json()}
+
+    now = datetime.now(timezone.utc)
+    paper_ids = []
+    for index in range(3):
+        paper_ids.append(
+            str(
+                db.tests.insert_one(
+                    {
+                        "title": f"Inbox Paper {index}",
+                        "subject": "Physics",
+                        "difficulty": "Easy",
+                        "questions": 2,
+                        "duration": 20,
+                        "year": student.get("year"),
+                        "status": "draft",
+                        "creator_id": str(teacher["_id"]),
+                        "assigned_to_class_ids": [],
+                        "created_at": now + timedelta(minutes=index),
+                    }
+                ).inserted_id
+            )
+        )
+        assigned = await async_client.post(
+            f"/api/v1/teacher/papers/{paper_ids[-1]}/assign",
+            json={"class_ids": [class_id]},
+            headers=teacher_headers,
+        )
+        assert assigned.status_code == 200
+
+    seen: list[str] = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = await async_client.get("/api/v1/student/test-inbox", params=params, headers=student_headers)
+        assert page.status_code == 200
+        seen.extend(item["id"] for item in page.json()["items"])
+        cursor = page.json()["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen[:3] == list(reversed(paper_ids))
+    assert len(seen) == len(set(seen)) == len(known_ids) + 3
+
+    listed = await async_client.get("/api/v1/student/tests", headers=student_headers)
+    assert [item["id"] for item in listed.json()] == seen
+
+    bad = await async_client.get(
+        "/api/v1/student/test-inbox", params={"cursor": "not-a-cursor"}, headers=student_headers
+    )
+    assert bad.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_archived_paper_leaves_the_test_inbox(
+    async_client,
+    teacher_headers: dict[str, str],
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    from app.core.config import get_settings
+
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0.0)
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    teacher = db.users.find_one({"email": "sharma@example.com"})
+    student = db.users.find_one({"name": "Rahul Kumar"})
+    class_id = str(db.classes.find_one({"name": "JEE 2026 Batch A"})["_id"])
+    db.classes.update_one({"_id": ObjectId(class_id)}, {"$addToSet": {"student_ids": str(student["_id"])}})
+    paper_id = str(
+        db.tests.insert_one(
+            {
+                "title": "Withdrawn Paper",
+                "subject": "Physics",
+                "difficulty": "Easy",
+                "questions": 2,
+                "duration": 20,
+                "year": student.get("year"),
+                "status": "draft",
+                "creator_id": str(teacher["_id"]),
+                "assigned_to_class_ids": [],
+            }
+        ).inserted_id
+    )
+    assigned = await async_client.post(
+        f"/api/v1/teacher/papers/{paper_id}/assign",
+        json={"class_ids": [class_id]},
+        headers=teacher_headers,
+    )
+    assert assigned.status_code == 200
+
+    async def listed_ids() -> set[str]:
+        response = await async_client.get("/api/v1/student/tests", headers=student_headers)
+        return {item["id"] for item in response.json()}
+
+    assert paper_id in await listed_ids()
+    synced = await async_client.post(
+        "/api/v1/student/sync", json={"watermarks": {"tests": None}, "limit": 500}, headers=student_headers
+    )
+    watermark = synced.json()["collections"]["tests"]["watermark"]
+
+    archived = await async_client.patch(
+        f"/api/v1/teacher/papers/{paper_id}", json={"status": "archived"}, headers=teacher_headers
+    )
+    assert archived.status_code == 200
+    assert paper_id not in await listed_ids()
+    started = await async_client.post(f"/api/v1/student/tests/{paper_id}/start", headers=student_headers)
+    assert started.status_code == 403
+    synced = await async_client.post(
+        "/api/v1/student/sync", json={"watermarks": {"tests": watermark}}, headers=student_headers
+    )
+    assert synced.json()["collections"]["tests"]["deleted"] == [paper_id]
+
+    # Assigning it again brings it back.
+    reassigned = await async_client.patch(
+        f"/api/v1/teacher/papers/{paper_id}", json={"status": "assigned"}, headers=teacher_headers
+    )
+    assert reassigned.status_code == 200
+    assert paper_id in await listed_ids()
+
+
+@pytest.mark.anyio
+async def test_student_stats_are_maintained_on_submit(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    from datetime import datetime, timezone
+
+    from app.services.student_stats_service import StudentStatsService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    student_id = str(db.users.find_one({"name": "Rahul Kumar"})["_id"])
+
+    home = await async_client.get("/api/v1/student/home-summary", headers=student_headers)
+    assert home.status_code == 200
+    before = db.student_stats.find_one({"_id": student_id})
+    assert before["completed_tests"] == home.json()["completed_tests"]
+
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{started.json()['attempt_id']}/submit",
+        headers=student_headers,
+    )
+    assert submitted.status_code == 200
+
+    after = db.student_stats.find_one({"_id": student_id})
+    assert after["completed_tests"] == before["completed_tests"] + 1
+    assert after["subjects"]["Chemistry"]["count"] == before.get("subjects", {}).get("Chemistry", {}).get("count", 0) + 1
+    assert after["last_submission_day"] is not None
+    assert StudentStatsService.streak(after) >= 1
+
+    rebuilt = StudentStatsService.rebuild(db, student_id)
+    for field in ("completed_tests", "current_streak", "last_submission_day"):
+        assert rebuilt[field] == after[field]
+    assert rebuilt["avg_score"] == pytest.approx(after["avg_score"])
+    assert rebuilt["score_sum"] == pytest.approx(after["score_sum"])
+
+    # A write computed from a stale read is rejected (the loser re-reads and
+    # retries), so the derived average never lags the counters.
+    stale = db.student_stats.find_one({"_id": student_id})
+    StudentStatsService.record_submission(
+        db, student_id, subject="Physics", score=10.0, submitted_at=datetime.now(timezone.utc)
+    )
+    assert StudentStatsService._write_if_unchanged(db, stale, {"$inc": {"completed_tests": 1}}) is False
+    latest = db.student_stats.find_one({"_id": student_id})
+    assert latest["completed_tests"] == after["completed_tests"] + 1
+    assert latest["avg_score"] == pytest.approx(latest["score_sum"] / latest["completed_tests"], abs=1e-4)
+
+
+@pytest.mark.anyio
+async def test_leaderboard_reports_rank_percentile_and_scopes(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    from app.services.student_stats_service import StudentStatsService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    student = db.users.find_one({"name": "Rahul Kumar"})
+    student_id = str(student["_id"])
+    stats = StudentStatsService.rebuild(db, student_id)
+    db.student_stats.update_one({"_id": student_id}, {"$set": {"completed_tests": 1, "avg_score": 60.0}})
+    assert stats["year"] == student.get("year")
+
+    other_year = "2099" if student.get("year") != "2099" else "2098"
+    db.student_stats.insert_many(
+        [
+            {"_id": str(ObjectId()), "year": student.get("year"), "completed_tests": 2, "avg_score": 80.0},
+            {"_id": str(ObjectId()), "year": other_year, "completed_tests": 1, "avg_score": 90.0},
+            {"_id": str(ObjectId()), "year": student.get("year"), "completed_tests": 3, "avg_score": 40.0},
+            {"_id": str(ObjectId()), "year": student.get("year"), "completed_tests": 0, "avg_score": 0.0},
+        ]
+    )
+
+    board = await async_client.get("/api/v1/student/leaderboard", headers=student_headers)
+    assert board.status_code == 200
+    body = board.json()
+    higher = db.student_stats.count_documents({"completed_tests": {"$gt": 0}, "avg_score": {"$gt": 60.0}})
+    total = db.student_stats.count_documents({"completed_tests": {"$gt": 0}})
+    assert body["rank"] == higher + 1
+    assert body["total"] == total
+    assert body["percentile"] == round((total - body["rank"]) / total * 100, 1)
+    assert [entry["avg_score"] for entry in body["top"]] == sorted(
+        (entry["avg_score"] for entry in body["top"]), reverse=True
+    )
+
+    year_board = await async_client.get(
+        "/api/v1/student/leaderboard", params={"scope": "year"}, headers=student_headers
+    )
+    assert year_board.status_code == 200
+    assert all(entry["avg_score"] != 90.0 for entry in year_board.json()["top"])
+    assert year_board.json()["rank"] == db.student_stats.count_documents(
+        {"completed_tests": {"$gt": 0}, "year": student.get("year"), "avg_score": {"$gt": 60.0}}
+    ) + 1
+
+    class_board = await async_client.get(
+        "/api/v1/student/leaderboard", params={"scope": "class"}, headers=student_headers
+    )
+    assert class_board.status_code == 200
+    assert class_board.json()["rank"] == 1
+    assert [entry["is_me"] for entry in class_board.json()["top"]] == [True]
+
+    foreign = await async_client.get(
+        "/api/v1/student/leaderboard",
+        params={"scope": "class", "class_id": str(ObjectId())},
+        headers=student_headers,
+    )
+    assert foreign.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_rank_snapshots_feed_progress_rank_history(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from app.services.rank_snapshot_service import RankSnapshotService
+    from app.services.student_stats_service import StudentStatsService
+    from app.utils.cache import student_cache
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    student_id = str(db.users.find_one({"name": "Rahul Kumar"})["_id"])
+    StudentStatsService.rebuild(db, student_id)
+    db.student_stats.update_one({"_id": student_id}, {"$set": {"completed_tests": 1, "avg_score": 50.0}})
+    rival = str(ObjectId())
+    db.student_stats.insert_one({"_id": rival, "completed_tests": 1, "avg_score": 70.0})
+
+    monday = datetime(2026, 3, 2, 9, 30, tzinfo=timezone.utc)
+    written = RankSnapshotService.take(db, period="weekly", now=monday)
+    assert written == db.student_stats.count_documents({"completed_tests": {"$gt": 0}})
+    # Re-running within the same week is a no-op.
+    assert RankSnapshotService.take(db, period="weekly", now=monday + timedelta(days=3)) == 0
+
+    # A run that died mid-write is completed by the next one, without
+    # duplicating the points it already wrote; a live claim is left alone.
+    crashed_week = monday + timedelta(days=14)
+    db.rank_snapshot_runs.insert_one(
+        {"_id": f"weekly:{crashed_week:%Y-%m-%d}", "status": "running", "lease_until": monday}
+    )
+    crashed_at = RankSnapshotService.period_start("weekly", crashed_week)
+    db.rank_snapshots.insert_one(
+        {"taken_at": crashed_at, "meta": {"student_id": rival, "period": "weekly"}, "rank": 1}
+    )
+    assert RankSnapshotService.take(db, period="weekly", now=crashed_week) == written - 1
+    assert db.rank_snapshots.count_documents({"taken_at": crashed_at}) == written
+    assert RankSnapshotService.exists(db, "weekly", crashed_week)
+    live_week = monday + timedelta(days=21)
+    db.rank_snapshot_runs.insert_one(
+        {"_id": f"weekly:{live_week:%Y-%m-%d}", "status": "running", "lease_until": datetime(2999, 1, 1)}
+    )
+    assert RankSnapshotService.take(db, period="weekly", now=live_week) == 0
+    db.rank_snapshots.delete_many({"taken_at": {"$gte": crashed_at}})
+
+    db.student_stats.update_one({"_id": student_id}, {"$set": {"avg_score": 90.0}})
+    RankSnapshotService.take(db, period="weekly", now=monday + timedelta(days=7))
+
+    history = RankSnapshotService.history(db, student_id)
+    assert [point["week"] for point in history] == ["Mar 02", "Mar 09"]
+    assert history[0]["rank"] > history[1]["rank"]
+    assert history[1]["rank"] == 1
+
+    student_cache.clear()
+    progress = await async_client.get("/api/v1/student/progress", headers=student_headers)
+    assert progress.status_code == 200
+    assert [point["rank"] for point in progress.json()["rank_history"]][-2:] == [
+        point["rank"] for point in history
+    ]
+
+
+@pytest.mark.anyio
+async def test_dashboard_degrades_failing_sections(
+    async_client,
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    import time
+
+    from app.core.config import get_settings
+    from app.services.student_service import StudentService
+
+    dashboard = await async_client.get("/api/v1/student/dashboard", headers=student_headers)
+    assert dashboard.status_code == 200
+    assert dashboard.json()["degraded"] == []
+    healthy_home = dashboard.json()["home"]
+
+    def broken_notifications(db, user):
+        raise RuntimeError("notifications store unavailable")
+
+    def slow_progress(db, student):
+        time.sleep(0.5)
+        return {}
+
+    monkeypatch.setattr(StudentService, "list_notifications", staticmethod(broken_notifications))
+    monkeypatch.setattr(StudentService, "progress", staticmethod(slow_progress))
+    monkeypatch.setattr(get_settings(), "dashboard_part_timeout_seconds", 0.1)
+
+    degraded = await async_client.get("/api/v1/student/dashboard", headers=student_headers)
+    assert degraded.status_code == 200
+    body = degraded.json()
+    assert sorted(body["degraded"]) == ["notifications", "progress"]
+    assert body["notifications"] == []
+    assert body["progress"]["rank_history"] == []
+    assert body["home"] == healthy_home
+    assert isinstance(body["tests"], list) and body["tests"]
+
+
+@pytest.mark.anyio
+async def test_read_endpoints_answer_304_until_their_version_changes(
+    async_client,
+    student_headers: dict[str, str],
+    teacher_headers: dict[str, str],
+) -> None:
+    from app.services.notification_service import NotificationService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    student_id = str(db.users.find_one({"name": "Rahul Kumar"})["_id"])
+
+    # The first read builds the student's test inbox, which bumps their version.
+    assert (await async_client.get("/api/v1/student/tests", headers=student_headers)).status_code == 200
+
+    async def revalidate(path: str, headers: dict[str, str]) -> tuple[str, int]:
+        first = await async_client.get(path, headers=headers)
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+        again = await async_client.get(path, headers={**headers, "If-None-Match": etag})
+        return etag, again.status_code
+
+    for path in ("/api/v1/student/dashboard", "/api/v1/student/tests", "/api/v1/notifications"):
+        etag, status_code = await revalidate(path, student_headers)
+        assert status_code == 304, path
+
+    papers_etag, status_code = await revalidate("/api/v1/teacher/papers", teacher_headers)
+    assert status_code == 304
+
+    notifications_etag = (await async_client.get("/api/v1/notifications", headers=student_headers)).headers["etag"]
+    NotificationService.create_for_user(
+        db, user_id=student_id, title="Reminder", message="Mock test tomorrow", notification_type="info"
+    )
+    changed = await async_client.get(
+        "/api/v1/notifications", headers={**student_headers, "If-None-Match": notifications_etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != notifications_etag
+    assert any(item["title"] == "Reminder" for item in changed.json())
+
+    tests_etag = (await async_client.get("/api/v1/student/tests", headers=student_headers)).headers["etag"]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(f"/api/v1/student/tests/{test['_id']}/start", headers=student_headers)
+    await async_client.post(
+        f"/api/v1/student/attempts/{started.json()['attempt_id']}/submit", headers=student_headers
+    )
+    after_submit = await async_client.get(
+        "/api/v1/student/tests", headers={**student_headers, "If-None-Match": tests_etag}
+    )
+    assert after_submit.status_code == 200
+
+    paper = db.tests.find_one({"creator_id": str(db.users.find_one({"email": "sharma@example.com"})["_id"])})
+    updated = await async_client.patch(
+        f"/api/v1/teacher/papers/{paper['_id']}", json={"title": "Renamed paper"}, headers=teacher_headers
+    )
+    assert updated.status_code == 200
+    relisted = await async_client.get(
+        "/api/v1/teacher/papers", headers={**teacher_headers, "If-None-Match": papers_etag}
+    )
+    assert relisted.status_code == 200
+    assert relisted.headers["etag"] != papers_etag
+
+
+@pytest.mark.anyio
+async def test_sync_returns_only_changes_since_watermark(
+    async_client,
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    from app.core.config import get_settings
+    from app.services.notification_service import NotificationService
+    from app.services.student_service import StudentService
+    from scripts.backfill_sync_timestamps import _backfill as _backfill_sync_timestamps
+
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0.0)
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    student = db.users.find_one({"name": "Rahul Kumar"})
+    student_id = str(student["_id"])
+    doomed = StudentService.create_chat_session(db, student, "Old chat")
+    # Seeded notifications predate sync and have no updated_at yet.
+    assert _backfill_sync_timestamps(db, dry_run=False)["notifications"] >= 1
+
+    watermarks: dict = {"tests": None, "notifications": None, "chat_sessions": None}
+    seen: dict[str, set] = {name: set() for name in watermarks}
+    for _ in range(50):
+        response = await async_client.post(
+            "/api/v1/student/sync", json={"watermarks": watermarks, "limit": 2}, headers=student_headers
+        )
+        assert response.status_code == 200
+        collections = response.json()["collections"]
+        for name, changes in collections.items():
+            seen[name].update(item["id"] for item in changes["items"])
+            watermarks[name] = changes["watermark"]
+        if not any(changes["has_more"] for changes in collections.values()):
+            break
+
+    assert seen["tests"] == {row["test_id"] for row in db.student_test_inbox.find({"student_id": student_id})}
+    assert len(seen["notifications"]) == db.notifications.count_documents({"user_id": student_id})
+    assert doomed["id"] in seen["chat_sessions"]
+
+    NotificationService.create_for_user(
+        db, user_id=student_id, title="New", message="Fresh notification", notification_type="info"
+    )
+    StudentService.delete_chat_session(db, student, doomed["id"])
+
+    response = await async_client.post(
+        "/api/v1/student/sync", json={"watermarks": watermarks}, headers=student_headers
+    )
+    collections = response.json()["collections"]
+    assert collections["tests"]["items"] == [] and collections["tests"]["deleted"] == []
+    assert [item["title"] for item in collections["notifications"]["items"]] == ["New"]
+    assert collections["chat_sessions"]["items"] == []
+    assert collections["chat_sessions"]["deleted"] == [doomed["id"]]
+
+    invalid = await async_client.post(
+        "/api/v1/student/sync", json={"watermarks": {"grades": None}}, headers=student_headers
+    )
+    assert invalid.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_expired_chat_sessions_sync_as_deleted(
+    async_client,
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from app.core.config import get_settings
+    from app.services.student_service import StudentService
+    from app.services.sync_service import SyncService
+
+    monkeypatch.setattr(get_settings(), "sync_settle_seconds", 0.0)
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    student = db.users.find_one({"name": "Rahul Kumar"})
+    old = StudentService.create_chat_session(db, student, "Old chat")
+    fresh = StudentService.create_chat_session(db, student, "Fresh chat")
+    db.chat_sessions.update_one(
+        {"_id": ObjectId(old["id"])},
+        {"$set": {"created_at": datetime.now(timezone.utc) - timedelta(days=29, hours=1)}},
+    )
+    db.chat_messages.insert_one({"session_id": old["id"], "content": "hi", "created_at": datetime.now(timezone.utc)})
+
+    first = await async_client.post(
+        "/api/v1/student/sync", json={"watermarks": {"chat_sessions": None}}, headers=student_headers
+    )
+    changes = first.json()["collections"]["chat_sessions"]
+    assert {old["id"], fresh["id"]} <= {item["id"] for item in changes["items"]}
+
+    assert SyncService.expire_chat_sessions(db) == 1
+    assert db.chat_sessions.find_one({"_id": ObjectId(old["id"])}) is None
+    assert db.chat_messages.count_documents({"session_id": old["id"]}) == 0
+    assert db.chat_sessions.find_one({"_id": ObjectId(fresh["id"])}) is not None
+
+    second = await async_client.post(
+        "/api/v1/student/sync",
+        json={"watermarks": {"chat_sessions": changes["watermark"]}},
+        headers=student_headers,
+    )
+    changes = second.json()["collections"]["chat_sessions"]
+    assert changes["items"] == []
+    assert changes["deleted"] == [old["id"]]
+
+
+@pytest.mark.anyio
+async def test_class_ids_are_denormalized_on_students(
+    async_client,
+    teacher_headers: dict[str, str],
+) -> None:
+    from app.services.class_membership_service import ClassMembershipService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    cls = db.classes.find_one({"name": "JEE 2026 Batch A"})
+    class_id = str(cls["_id"])
+    member_id = str(cls["student_ids"][0])
+    assert "class_ids" not in db.users.find_one({"_id": ObjectId(member_id)})
+
+    # First read backfills from classes.
+    assert ClassMembershipService.class_ids_by_id(db, member_id) == [class_id]
+    assert db.users.find_one({"_id": ObjectId(member_id)})["class_ids"] == [class_id]
+
+    removed = await async_client.put(
+        f"/api/v1/teacher/classes/{class_id}/students", json={"student_ids": []}, headers=teacher_headers
+    )
+    assert removed.status_code == 200
+    assert db.users.find_one({"_id": ObjectId(member_id)})["class_ids"] == []
+
+    restored = await async_client.put(
+        f"/api/v1/teacher/classes/{class_id}/students", json={"student_ids": [member_id]}, headers=teacher_headers
+    )
+    assert restored.status_code == 200
+    assert db.users.find_one({"_id": ObjectId(member_id)})["class_ids"] == [class_id]
+    assert ClassMembershipService.check(db)["drifted"] == [
+        str(user["_id"])
+        for user in db.users.find({"role": "student", "class_ids": {"$exists": False}}, {"_id": 1})
+    ]
+
+    db.users.update_one({"_id": ObjectId(member_id)}, {"$set": {"class_ids": ["stale"]}})
+    report = ClassMembershipService.check(db, repair=True)
+    assert member_id in report["drifted"]
+    assert db.users.find_one({"_id": ObjectId(member_id)})["class_ids"] == [class_id]
+    assert ClassMembershipService.check(db)["drifted"] == []
+
+
+@pytest.mark.anyio
+async def test_deadline_sweeper_auto_submits_expired_attempts(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from app.services.attempt_sweeper import AttemptSweeper
+    from app.services.post_submit_pipeline import PostSubmitPipeline
+    from app.services.student_stats_service import StudentStatsService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["deadline_at"] is not None
+    stats_before = StudentStatsService.get(db, attempt["student_id"])
+    # A stats row without the year, as for a first submission that was swept.
+    db.student_stats.update_one({"_id": attempt["student_id"]}, {"$unset": {"year": ""}})
+
+    # Not yet due: nothing is swept.
+    assert AttemptSweeper.sweep(db) == 0
+
+    expired_at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    db.test_attempts.update_one({"_id": ObjectId(attempt_id)}, {"$set": {"deadline_at": expired_at}})
+    assert AttemptSweeper.sweep(db) == 1
+    assert AttemptSweeper.sweep(db) == 0
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["status"] == "submitted"
+    assert attempt["expired"] is True
+    assert attempt["score"] is not None
+    assert attempt["post_submit"]["status"] == "pending"
+    stats_after = db.student_stats.find_one({"_id": attempt["student_id"]})
+    assert stats_after["completed_tests"] == stats_before["completed_tests"] + 1
+    student = db.users.find_one({"_id": ObjectId(attempt["student_id"])})
+    assert student["year"]
+    assert stats_after["year"] == student["year"]
+    inbox_row = db.student_test_inbox.find_one({"student_id": attempt["student_id"], "test_id": str(test["_id"])})
+    assert inbox_row["status"] == "completed"
+
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit",
+        json={},
+        headers=student_headers,
+    )
+    assert submitted.status_code == 409
+
+    assert await PostSubmitPipeline.run_due(db) == 1
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["post_submit"]["status"] == "done"
+    assert db.student_stats.find_one({"_id": attempt["student_id"]})["completed_tests"] == stats_after["completed_tests"]
+
+
+@pytest.mark.anyio
+async def test_offline_package_and_event_replay(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+
+    package = await async_client.get(f"/api/v1/student/attempts/{attempt_id}/package", headers=student_headers)
+    assert package.status_code == 200
+    body = package.json()
+    assert body["last_seq"] == 0
+    assert body["deadline_at"] is not None
+    assert all("correct_answer" not in question for question in body["questions"])
+    first, second = body["questions"][0]["id"], body["questions"][1]["id"]
+
+    events = [
+        {"seq": 1, "type": "answer", "question_id": first, "value": 2},
+        {"seq": 2, "type": "time", "question_id": first, "seconds": 40},
+        {"seq": 3, "type": "answer", "question_id": second, "value": 1},
+        {"seq": 4, "type": "answer", "question_id": first, "value": 0},
+    ]
+    replayed = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/events",
+        json={"events": events, "signature": body["signature"]},
+        headers=student_headers,
+    )
+    assert replayed.status_code == 200
+    assert replayed.json()["applied"] == 4
+    assert replayed.json()["saved_answers"] == 2
+
+    # Resending (e.g. after a dropped response) changes nothing.
+    resent = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/events",
+        json={"events": events + [{"seq": 5, "type": "time", "question_id": second, "seconds": 15}]},
+        headers=student_headers,
+    )
+    assert resent.json()["applied"] == 1
+    assert resent.json()["skipped"] == 4
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert attempt["answers"][first] == 0
+    assert attempt["answers"][second] == 1
+    assert attempt["time_spent"] == {first: 40, second: 15}
+    assert attempt["event_seq"] == 5
+
+    stale = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/events",
+        json={"events": [], "signature": "0" * 64},
+        headers=student_headers,
+    )
+    assert stale.status_code == 409
+    unknown = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/events",
+        json={"events": [{"seq": 6, "type": "answer", "question_id": "nope", "value": 1}]},
+        headers=student_headers,
+    )
+    assert unknown.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_idempotency_key_replays_retried_mutations(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers={**student_headers, "Idempotency-Key": "start-1"},
+    )
+    attempt_id = started.json()["attempt_id"]
+    replayed = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers={**student_headers, "Idempotency-Key": "start-1"},
+    )
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert replayed.json()["attempt_id"] == attempt_id
+    assert replayed.json()["questions"] == started.json()["questions"]
+    # The key stores the attempt's identity, not the paper.
+    record = db.idempotency_keys.find_one({"_id": {"$regex": ":start_test:start-1$"}})
+    assert record["response"] == {"attempt_id": attempt_id, "question_set_id": started.json()["question_set_id"]}
+    # The same key on a different request is rejected before any work is done.
+    reused = await async_client.post(
+        f"/api/v1/student/tests/{ObjectId()}/start",
+        headers={**student_headers, "Idempotency-Key": "start-1"},
+    )
+    assert reused.status_code == 422
+
+    student_id = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})["student_id"]
+    ready_before = db.notifications.count_documents({"user_id": student_id, "title": "Result Ready"})
+    submit_headers = {**student_headers, "Idempotency-Key": "submit-1"}
+    submitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit", json={}, headers=submit_headers
+    )
+    resubmitted = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit", json={}, headers=submit_headers
+    )
+    assert submitted.status_code == resubmitted.status_code == 200
+    assert resubmitted.json()["score"] == submitted.json()["score"]
+    assert resubmitted.headers["Idempotent-Replayed"] == "true"
+    assert db.notifications.count_documents({"user_id": student_id, "title": "Result Ready"}) == ready_before + 1
+
+    # Without a key a retried submit is rejected as before.
+    again = await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/submit", json={}, headers=student_headers
+    )
+    assert again.status_code == 409
+
+
+@pytest.mark.anyio
+async def test_start_serves_cached_public_question_view(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    import json
+
+    from app.services.question_set_service import QuestionSetService
+    from app.utils.cache import public_question_cache
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(f"/api/v1/student/tests/{test['_id']}/start", headers=student_headers)
+    assert started.status_code == 200
+    body = started.json()
+    question_set_id = body["question_set_id"]
+    assert question_set_id
+    view = public_question_cache.get(question_set_id)
+    assert view is not None
+    assert body["questions"] == view["questions"]
+    assert all(set(question) == {"id", "subject", "text", "options", "topic", "subtopic"} for question in body["questions"])
+
+    # Resuming is served from the cached view, not rebuilt from the answer key.
+    view["questions"][0]["text"] = "cached"
+    view["json"] = json.dumps(view["questions"])
+    resumed = await async_client.post(f"/api/v1/student/tests/{test['_id']}/start", headers=student_headers)
+    assert resumed.json()["attempt_id"] == body["attempt_id"]
+    assert resumed.json()["questions"][0]["text"] == "cached"
+    public_question_cache.delete(question_set_id)
+    assert QuestionSetService.public_view(db, question_set_id)["questions"][0]["text"] != "cached"
+
+
+@pytest.mark.anyio
+async def test_answer_key_correction_rescores_submitted_attempts(
+    async_client,
+    student_headers: dict[str, str],
+    teacher_headers: dict[str, str],
+) -> None:
+    from app.services.post_submit_pipeline import PostSubmitPipeline
+    from app.services.question_set_service import QuestionSetService
+    from app.services.rescore_service import RescoreService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    question, second = QuestionSetService.for_attempt(db, attempt)[:2]
+    await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={"answers": {question["id"]: question["correct"], second["id"]: second["correct"]}},
+        headers=student_headers,
+    )
+    await async_client.post(f"/api/v1/student/attempts/{attempt_id}/submit", json={}, headers=student_headers)
+    submitted = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert submitted["correct_answers"] == 2
+    assert submitted["analysis"]["weak_areas"] == []
+    stats_before = db.student_stats.find_one({"_id": submitted["student_id"]})
+    # Attempts on an unrelated, older version of the paper are not corrected.
+    other_versions = db.test_attempts.insert_many(
+        [
+            {
+                "test_id": str(test["_id"]),
+                "student_id": "other",
+                "status": attempt_status,
+                "question_set_id": "older-set",
+                "answers": {},
+                "score": 50.0 if attempt_status == "submitted" else None,
+            }
+            for attempt_status in ("submitted", "in_progress")
+        ]
+    ).inserted_ids
+
+    wrong_key = (question["correct"] + 1) % len(question["options"])
+    corrected = await async_client.put(
+        f"/api/v1/teacher/papers/{test['_id']}/answer-key",
+        json={"corrections": [{"question_id": question["id"], "correct": wrong_key}]},
+        headers=teacher_headers,
+    )
+    assert corrected.status_code == 202
+    assert corrected.json()["total"] == 1
+
+    rescored = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert rescored["question_set_id"] == corrected.json()["question_set_id"]
+    assert rescored["correct_answers"] == 1
+    assert rescored["incorrect_answers"] == 1
+    assert rescored["score"] < submitted["score"]
+    assert "rescore" not in rescored
+    # The verdicts changed, so the analysis is regenerated against the new key.
+    assert rescored["analysis"]["status"] == "pending"
+    assert "analysis" not in rescored["post_submit"]["done"]
+    assert await PostSubmitPipeline.run_due(db) == 1
+    reanalysed = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert reanalysed["post_submit"]["status"] == "done"
+    assert reanalysed["analysis"]["weak_areas"] != submitted["analysis"]["weak_areas"]
+    assert reanalysed["analysis"]["overall_accuracy"] < submitted["analysis"]["overall_accuracy"]
+    assert db.notifications.count_documents({"user_id": submitted["student_id"], "title": "Result Ready"}) == 1
+    for other_id in other_versions:
+        other = db.test_attempts.find_one({"_id": other_id})
+        assert other["question_set_id"] == "older-set"
+        assert "rescored_at" not in other
+    stats_after = db.student_stats.find_one({"_id": submitted["student_id"]})
+    assert stats_after["completed_tests"] == stats_before["completed_tests"]
+    assert stats_after["score_sum"] == pytest.approx(
+        stats_before["score_sum"] + rescored["score"] - submitted["score"]
+    )
+    inbox_row = db.student_test_inbox.find_one({"student_id": submitted["student_id"], "test_id": str(test["_id"])})
+    assert inbox_row["score"] == rescored["score"]
+
+    progress = await async_client.get(f"/api/v1/teacher/papers/{test['_id']}/rescore", headers=teacher_headers)
+    assert progress.json()["status"] == "done"
+    assert (progress.json()["processed"], progress.json()["changed"]) == (1, 1)
+
+    # Running the finished job again (e.g. a resumed worker) changes nothing.
+    assert RescoreService.run(db, progress.json()["job_id"])["processed"] == 1
+    assert db.test_attempts.find_one({"_id": ObjectId(attempt_id)})["score"] == rescored["score"]
+
+    unknown = await async_client.put(
+        f"/api/v1/teacher/papers/{test['_id']}/answer-key",
+        json={"corrections": [{"question_id": "nope", "correct": 0}]},
+        headers=teacher_headers,
+    )
+    assert unknown.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_failed_rescore_batch_is_retried_after_backoff(
+    async_client,
+    student_headers: dict[str, str],
+    monkeypatch,
+) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from app.services.batch_scoring import BatchScoring
+    from app.services.question_set_service import QuestionSetService
+    from app.services.rescore_service import RescoreService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    # Starting the paper materializes its question set.
+    started = await async_client.post(f"/api/v1/student/tests/{test['_id']}/start", headers=student_headers)
+    assert started.status_code == 200
+    question_set_id = QuestionSetService.reference(db, db.tests.find_one({"_id": test["_id"]}))
+    assert question_set_id
+    attempt_id = db.test_attempts.insert_one(
+        {
+            "test_id": str(test["_id"]),
+            "student_id": "someone",
+            "status": "submitted",
+            "question_set_id": "older-set",
+            "answers": {},
+            "score": 50.0,
+        }
+    ).inserted_id
+    job = RescoreService.create(
+        db, test_id=str(test["_id"]), question_set_id=question_set_id, source_set_ids=["older-set"]
+    )
+
+    grade_many = BatchScoring.grade_many
+
+    def flaky(*args, **kwargs):
+        raise ConnectionError("mongo went away")
+
+    monkeypatch.setattr(BatchScoring, "grade_many", staticmethod(flaky))
+    assert RescoreService.run_due(db) == 1
+    failed = db.rescore_jobs.find_one({"_id": job["_id"]})
+    assert failed["status"] == "running"
+    assert failed["attempts"] == 1
+    assert "mongo went away" in failed["last_error"]
+    assert RescoreService.payload(failed)["last_error"] == failed["last_error"]
+    # Backing off: the worker leaves it alone until next_run_at.
+    assert RescoreService.run_due(db) == 0
+
+    monkeypatch.setattr(BatchScoring, "grade_many", grade_many)
+    db.rescore_jobs.update_one(
+        {"_id": job["_id"]}, {"$set": {"next_run_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    )
+    assert RescoreService.run_due(db) == 1
+    resumed = db.rescore_jobs.find_one({"_id": job["_id"]})
+    assert resumed["status"] == "done"
+    assert (resumed["attempts"], resumed["last_error"]) == (0, None)
+    assert db.test_attempts.find_one({"_id": attempt_id})["question_set_id"] == question_set_id
+
+
+@pytest.mark.anyio
+async def test_item_analysis_counts_submissions_incrementally(
+    async_client,
+    student_headers: dict[str, str],
+    teacher_headers: dict[str, str],
+) -> None:
+    from app.services.item_stats_service import ItemStatsService
+    from app.services.question_set_service import QuestionSetService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    first, second = QuestionSetService.for_attempt(db, attempt)[:2]
+    wrong_option = (second["correct"] + 1) % len(second["options"])
+    await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={
+            "answers": {first["id"]: first["correct"], second["id"]: wrong_option},
+            "time_spent": {first["id"]: 40, second["id"]: 75},
+        },
+        headers=student_headers,
+    )
+    await async_client.post(f"/api/v1/student/attempts/{attempt_id}/submit", json={}, headers=student_headers)
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert "item_stats" in attempt["post_submit"]["done"]
+    # Counted once, even if the step is retried.
+    key = QuestionSetService.answer_key(db, attempt["question_set_id"])
+    assert ItemStatsService.record(db, attempt, key) is False
+
+    response = await async_client.get(f"/api/v1/teacher/papers/{test['_id']}/item-analysis", headers=teacher_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["attempts"] == 1
+    items = {item["question_id"]: item for item in body["items"]}
+    assert items[first["id"]]["correct"] == 1
+    assert items[first["id"]]["p_value"] == 1.0
+    assert items[first["id"]]["difficulty"] == "Easy"
+    assert items[first["id"]]["option_distribution"][first["correct"]] == 1
+    assert 30 <= items[first["id"]]["median_time_seconds"] <= 45
+    assert items[second["id"]]["wrong"] == 1
+    assert items[second["id"]]["option_distribution"][wrong_option] == 1
+    assert items[second["id"]]["discrimination"] is None
+    assert len(items) == len(QuestionSetService.for_attempt(db, attempt))
+
+    # A key correction recounts the verdicts.
+    await async_client.put(
+        f"/api/v1/teacher/papers/{test['_id']}/answer-key",
+        json={"corrections": [{"question_id": second["id"], "correct": wrong_option}]},
+        headers=teacher_headers,
+    )
+    response = await async_client.get(f"/api/v1/teacher/papers/{test['_id']}/item-analysis", headers=teacher_headers)
+    items = {item["question_id"]: item for item in response.json()["items"]}
+    assert response.json()["attempts"] == 1
+    assert (items[second["id"]]["correct"], items[second["id"]]["wrong"]) == (1, 0)
+
+
+@pytest.mark.anyio
+async def test_weak_topics_aggregate_across_submissions(
+    async_client,
+    student_headers: dict[str, str],
+    teacher_headers: dict[str, str],
+) -> None:
+    from app.services.question_set_service import QuestionSetService
+    from app.services.topic_stats_service import TopicStatsService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    started = await async_client.post(
+        f"/api/v1/student/tests/{test['_id']}/start",
+        headers=student_headers,
+    )
+    attempt_id = started.json()["attempt_id"]
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    question_set = QuestionSetService.for_attempt(db, attempt)
+    first, second = question_set[:2]
+    wrong_option = (second["correct"] + 1) % len(second["options"])
+    await async_client.post(
+        f"/api/v1/student/attempts/{attempt_id}/answers",
+        json={
+            "answers": {first["id"]: first["correct"], second["id"]: wrong_option},
+            "time_spent": {first["id"]: 40, second["id"]: 20},
+        },
+        headers=student_headers,
+    )
+    await async_client.post(f"/api/v1/student/attempts/{attempt_id}/submit", json={}, headers=student_headers)
+
+    attempt = db.test_attempts.find_one({"_id": ObjectId(attempt_id)})
+    assert "topic_stats" in attempt["post_submit"]["done"]
+    # Counted once, even if the step is retried.
+    key = QuestionSetService.answer_key(db, attempt["question_set_id"])
+    assert TopicStatsService.record(db, attempt, key) is False
+
+    async def topics() -> list[dict]:
+        response = await async_client.get(
+            "/api/v1/student/weak-topics",
+            params={"min_questions": 1, "limit": 50},
+            headers=student_headers,
+        )
+        assert response.status_code == 200
+        body = response.json()
+        return body["weak_topics"] + body["strong_topics"]
+
+    entries = await topics()
+    assert sum(entry["questions"] for entry in entries) == len(question_set)
+    assert sum(entry["attempted"] for entry in entries) == 2
+    assert sum(entry["correct"] for entry in entries) == 1
+    assert all(entry["accuracy"] < 50 for entry in entries if entry["topic"] != first.get("topic", "General"))
+
+    # A key correction moves the verdict in the counters too.
+    await async_client.put(
+        f"/api/v1/teacher/papers/{test['_id']}/answer-key",
+        json={"corrections": [{"question_id": second["id"], "correct": wrong_option}]},
+        headers=teacher_headers,
+    )
+    entries = await topics()
+    assert sum(entry["questions"] for entry in entries) == len(question_set)
+    assert sum(entry["correct"] for entry in entries) == 2
+
+
+@pytest.mark.anyio
+async def test_result_page_uses_scored_verdicts(
+    async_client,
+    student_headers: dict[str, str],
+) -> None:
+    from datetime import datetime, timezone
+
+    from app.services.question_set_service import QuestionSetService
+
+    db = async_client._transport.app.state.db  # type: ignore[attr-defined]
+    test = db.tests.find_one({"title": "Chemistry Practice"})
+    student_id = str(db.users.find_one({"name": "Rahul Kumar"})["_id"])
+    question_set = [
+        {"id": "multi", "type": "ADV_MULTIPLE", "text": "Pick two", "options": ["a", "b", "c", "d"], "correct": [0, 2]},
+        {"id": "num", "type": "NUMERICAL_MAIN", "text": "Value?", "options": [], "correct": 5},
+        {"id": "mcq", "type": "MCQ_MAIN", "text": "Pick one", "options": ["a", "b", "c", "d"], "correct": 1},
+    ]
+    question_set_id = QuestionSetService.store(db, question_set, test_id=str(test["_id"]))
+    answers = {"multi": [2, 0], "num": 5.0, "mcq": 3}
+    key = QuestionSetService.answer_key(db, question_set_id)
+    attempt_id = db.test_attempts.insert_one(
+        {
+            "student_id": student_id,
+            "test_id": str(test["_id"]),
+            "subject": "Chemistry",
+            "status": "submitted",
+            "question_set_id": question_set_id,
+            "answers": answers,
+            "started_at": datetime.now(timezone.utc),
+            "submitted_at": datetime.now(timezone.utc),
+            **key.grade(answers),
+        }
+    ).inserted_id
+
+    response = await async_client.get(f"/api/v1/student/results/{attempt_id}", headers=student_headers)
+    assert response.status_code == 200
+    rows = {row["question_id"]: row for row in response.json()["questions"]}
+    assert (rows["multi"]["is_correct"], rows["multi"]["correct_answer"]) == (True, [0, 2])
+    assert (rows["num"]["is_correct"], rows["num"]["selected_answer"]) == (True, 5)
+    assert (rows["mcq"]["is_correct"], rows["mcq"]["verdict"]) == (False, "wrong")
+    assert sum(row["is_correct"] for row in rows.values()) == response.json()["correct_answers"]
@@ -136,6 +136,45 @@ export interface TeacherPaperResponse {
   created_at?: string | null;
 }
 
+export interface ItemStats {
+  question_id: string;
+  topic: string;
+  correct: number;
+  partial: number;
+  wrong: number;
+  unattempted: number;
+  p_value?: number | null;
+  difficulty?: "Easy" | "Medium" | "Hard" | null;
+  discrimination?: number | null;
+  option_distribution: number[];
+  median_time_seconds?: number | null;
+}
+
+export interface TestItemAnalysisResponse {
+  test_id: string;
+  attempts: number;
+  mean_score: number;
+  items: ItemStats[];
+}
+
+export interface AnswerKeyCorrection {
+  question_id: string;
+  correct: number | number[];
+}
+
+export interface RescoreJobResponse {
+  job_id: string;
+  test_id: string;
+  question_set_id: string;
+  status: "pending" | "running" | "done" | "failed" | "superseded";
+  total: number;
+  processed: number;
+  changed: number;
+  created_at?: string | null;
+  finished_at?: string | null;
+  last_error?: string | null;
+}
+
 export interface TeacherPaperQuestion {
   id: string;
   subject: string;
@@ -285,10 +324,43 @@ export interface StartAttemptResponse {
   status: string;
   started_at: string;
   duration: number;
+  question_set_id?: string | null;
   questions: AttemptQuestionResponse[];
   answers: Record<string, number | null>;
 }
 
+export interface AttemptPackageResponse {
+  attempt_id: string;
+  test_id: string;
+  title: string | null;
+  subject: string;
+  duration: number;
+  started_at: string;
+  deadline_at: string | null;
+  server_time: string;
+  questions: AttemptQuestionResponse[];
+  answers: Record<string, number | null>;
+  time_spent: Record<string, number>;
+  last_seq: number;
+  signature: string;
+}
+
+export interface AttemptEvent {
+  seq: number;
+  type: "answer" | "time";
+  question_id: string;
+  value?: number | null;
+  seconds?: number;
+}
+
+export interface AttemptEventsResponse {
+  attempt_id: string;
+  applied: number;
+  skipped: number;
+  last_seq: number;
+  saved_answers: number;
+}
+
 export interface SaveAnswersResponse {
   attempt_id: string;
   saved_answers: number;
@@ -331,9 +403,10 @@ export interface ResultQuestionResponse {
   subject: string;
   question_text: string;
   options: string[];
-  selected_answer: number | null;
-  correct_answer: number;
+  selected_answer: number | number[] | null;
+  correct_answer: number | number[] | null;
   is_correct: boolean;
+  verdict?: "correct" | "partial" | "wrong" | "unattempted" | null;
   explanation: string;
 }
 
@@ -356,6 +429,24 @@ export interface StudentProgressResponse {
   topic_mastery: TopicMastery[];
 }
 
+export interface WeakTopicEntry {
+  subject: string;
+  topic: string;
+  accuracy: number;
+  questions: number;
+  attempted: number;
+  correct: number;
+  partial: number;
+  avg_time_seconds?: number | null;
+  weakest_subtopic?: string | null;
+}
+
+export interface WeakTopicsResponse {
+  threshold: number;
+  weak_topics: WeakTopicEntry[];
+  strong_topics: WeakTopicEntry[];
+}
+
 export interface StudentLibraryItemResponse {
   id: string;
   title: string;
@@ -448,6 +539,11 @@ function buildUrl(
   return url.toString();
 }
 
+function idempotencyHeaders(key?: string): Record<string, string> | undefined {
+  // Reuse the same key when retrying a mutation so the server replays its first response.
+  return key ? { "Idempotency-Key": key } : undefined;
+}
+
 async function toApiError(response: Response): Promise<ApiError> {
   let detail = `Request failed (${response.status})`;
 
@@ -699,11 +795,13 @@ export async function listTeacherPapers(token: string): Promise<TeacherPaperResp
 export async function createTeacherPaper(
   token: string,
   payload: TeacherPaperCreatePayload,
+  options: { idempotencyKey?: string } = {},
 ): Promise<TeacherPaperResponse> {
   return apiRequest<TeacherPaperResponse>("/teacher/papers", {
     method: "POST",
     token,
     body: payload,
+    headers: idempotencyHeaders(options.idempotencyKey),
   });
 }
 
@@ -740,6 +838,32 @@ export async function assignTeacherPaper(
   });
 }
 
+export async function getTeacherPaperItemAnalysis(
+  token: string,
+  paperId: string,
+): Promise<TestItemAnalysisResponse> {
+  return apiRequest<TestItemAnalysisResponse>(`/teacher/papers/${paperId}/item-analysis`, { token });
+}
+
+export async function correctTeacherPaperAnswerKey(
+  token: string,
+  paperId: string,
+  corrections: AnswerKeyCorrection[],
+): Promise<RescoreJobResponse> {
+  return apiRequest<RescoreJobResponse>(`/teacher/papers/${paperId}/answer-key`, {
+    method: "PUT",
+    token,
+    body: { corrections },
+  });
+}
+
+export async function getTeacherPaperRescore(
+  token: string,
+  paperId: string,
+): Promise<RescoreJobResponse> {
+  return apiRequest<RescoreJobResponse>(`/teacher/papers/${paperId}/rescore`, { token });
+}
+
 export async function listTeacherClasses(token: string): Promise<TeacherClassResponse[]> {
   return apiRequest<TeacherClassResponse[]>("/teacher/classes", { token });
 }
@@ -879,10 +1003,12 @@ export async function listStudentTests(
 export async function startStudentTest(
   token: string,
   testId: string,
+  options: { idempotencyKey?: string } = {},
 ): Promise<StartAttemptResponse> {
   return apiRequest<StartAttemptResponse>(`/student/tests/${testId}/start`, {
     method: "POST",
     token,
+    headers: idempotencyHeaders(options.idempotencyKey),
   });
 }
 
@@ -899,11 +1025,31 @@ export async function saveStudentAnswers(
   });
 }
 
+export async function getStudentAttemptPackage(
+  token: string,
+  attemptId: string,
+): Promise<AttemptPackageResponse> {
+  return apiRequest<AttemptPackageResponse>(`/student/attempts/${attemptId}/package`, { token });
+}
+
+export async function replayStudentAttemptEvents(
+  token: string,
+  attemptId: string,
+  events: AttemptEvent[],
+  signature?: string,
+): Promise<AttemptEventsResponse> {
+  return apiRequest<AttemptEventsResponse>(`/student/attempts/${attemptId}/events`, {
+    method: "POST",
+    token,
+    body: { events, ...(signature ? { signature } : {}) },
+  });
+}
+
 export async function submitStudentAttempt(
   token: string,
   attemptId: string,
   payload: { violation_reason?: string; time_spent?: Record<string, number> } = {},
-  options: { keepalive?: boolean } = {},
+  options: { keepalive?: boolean; idempotencyKey?: string } = {},
 ): Promise<SubmitAttemptResponse> {
   return apiRequest<SubmitAttemptResponse>(`/student/attempts/${attemptId}/submit`, {
     method: "POST",
@@ -913,6 +1059,7 @@ export async function submitStudentAttempt(
       ...(payload.time_spent ? { time_spent: payload.time_spent } : {}),
     },
     keepalive: options.keepalive,
+    headers: idempotencyHeaders(options.idempotencyKey),
   });
 }
 
@@ -927,6 +1074,20 @@ export async function getStudentProgress(token: string): Promise<StudentProgress
   return apiRequest<StudentProgressResponse>("/student/progress", { token });
 }
 
+export async function getStudentWeakTopics(
+  token: string,
+  params: { threshold?: number; min_questions?: number; limit?: number } = {},
+): Promise<WeakTopicsResponse> {
+  return apiRequest<WeakTopicsResponse>("/student/weak-topics", {
+    token,
+    query: {
+      threshold: params.threshold,
+      min_questions: params.min_questions,
+      limit: params.limit,
+    },
+  });
+}
+
 export async function listStudentLibraryItems(
   token: string,
   params: { subject?: Subject } = {},
@@ -988,6 +1149,7 @@ export interface StudentDashboardResponse {
   progress: StudentProgressResponse;
   tests: StudentTestResponse[];
   notifications: NotificationResponse[];
+  degraded?: Array<"home" | "progress" | "tests" | "notifications">;
 }
 
 export async function getStudentDashboard(token: string): Promise<StudentDashboardResponse> {